@@ -0,0 +1,76 @@
+"""
+Dígitos grandes (3x2 celdas) para el LCD 2x16 usando caracteres de la CGRAM.
+
+Los 8 glifos se suben una sola vez con ShadowLcd.load_glyphs; cada dígito se
+compone de esos glifos más el bloque lleno (0xFF) y el espacio de la ROM.
+"""
+
+# Glifos personalizados (5x8), ubicaciones 0-7 de la CGRAM
+LT = 0  # esquina superior izquierda
+UB = 1  # barra superior
+RT = 2  # esquina superior derecha
+LL = 3  # esquina inferior izquierda
+LB = 4  # barra inferior
+LR = 5  # esquina inferior derecha
+UMB = 6  # barra superior y media
+LMB = 7  # barra media e inferior
+FULL = 0xFF
+BLANK = 0x20
+DOT = 0xA5  # punto medio de la ROM A00
+
+GLYPHS = (
+    bytes((0b00111, 0b01111, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111)),
+    bytes((0b11111, 0b11111, 0b11111, 0b00000, 0b00000, 0b00000, 0b00000, 0b00000)),
+    bytes((0b11100, 0b11110, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111)),
+    bytes((0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b01111, 0b00111)),
+    bytes((0b00000, 0b00000, 0b00000, 0b00000, 0b00000, 0b11111, 0b11111, 0b11111)),
+    bytes((0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b11111, 0b11110, 0b11100)),
+    bytes((0b11111, 0b11111, 0b11111, 0b00000, 0b00000, 0b00000, 0b11111, 0b11111)),
+    bytes((0b11111, 0b00000, 0b00000, 0b00000, 0b00000, 0b11111, 0b11111, 0b11111)),
+)
+
+# (fila superior, fila inferior) de cada dígito
+DIGITS = (
+    (bytes((LT, UB, RT)), bytes((LL, LB, LR))),
+    (bytes((UB, RT, BLANK)), bytes((LB, FULL, LB))),
+    (bytes((UMB, UMB, RT)), bytes((LL, LB, LB))),
+    (bytes((UMB, UMB, RT)), bytes((LMB, LMB, LR))),
+    (bytes((LL, LB, FULL)), bytes((BLANK, BLANK, FULL))),
+    (bytes((LT, UMB, UMB)), bytes((LMB, LMB, LR))),
+    (bytes((LT, UMB, UMB)), bytes((LL, LMB, LR))),
+    (bytes((UB, UB, RT)), bytes((BLANK, BLANK, FULL))),
+    (bytes((LT, UMB, RT)), bytes((LL, LMB, LR))),
+    (bytes((LT, UMB, RT)), bytes((BLANK, BLANK, FULL))),
+)
+
+# Columna de inicio de cada dígito de MM:SS; los dos puntos van en la columna 8
+DIGIT_COLUMNS = (0, 4, 9, 13)
+COLON_COLUMN = 8
+
+MAX_SECONDS = 99 * 60 + 59
+
+
+def render(seconds: int, cols: int = 16):
+    """
+    Compone MM:SS en dígitos grandes ocupando las dos filas.
+
+    Args:
+        seconds: Tiempo a mostrar en segundos (se limita a 99:59).
+        cols: Ancho de la pantalla.
+
+    Returns:
+        tuple: (fila superior, fila inferior) como bytearray.
+    """
+    seconds = max(0, min(int(seconds), MAX_SECONDS))
+    minutes, seconds = divmod(seconds, 60)
+    values = (minutes // 10, minutes % 10, seconds // 10, seconds % 10)
+
+    top = bytearray(b' ' * cols)
+    bottom = bytearray(b' ' * cols)
+    for col, value in zip(DIGIT_COLUMNS, values):
+        upper, lower = DIGITS[value]
+        top[col:col + 3] = upper
+        bottom[col:col + 3] = lower
+    top[COLON_COLUMN] = DOT
+    bottom[COLON_COLUMN] = DOT
+    return top, bottom
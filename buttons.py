@@ -0,0 +1,152 @@
+"""
+Botones por interrupción con antirrebote y cola de eventos acotada.
+
+Cada flanco de un botón se registra en la IRQ del pin con su marca de tiempo,
+así que no se pierden pulsaciones cortas aunque nadie esté esperando. Los
+eventos se guardan en un buffer circular preasignado: solo el contexto de
+las IRQ escribe (_written) y solo el lector avanza su índice (_read), así
+ninguno pisa una actualización del otro.
+"""
+from machine import Pin
+
+import runtime
+from ticks import ticks_ms, ticks_diff, ticks_add
+
+try:
+    from micropython import schedule
+except ImportError:
+    # En el host no hay planificador de IRQ: se llama en el momento
+    def schedule(function, arg):
+        function(arg)
+
+PRESS = 1
+RELEASE = 0
+
+
+class ButtonQueue:
+    def __init__(self, pins: dict, debounce_ms: int = 30, capacity: int = 16):
+        """
+        Args:
+            pins: Identificador del botón -> Pin configurado con PULL_UP (activo en bajo).
+            debounce_ms: Tiempo mínimo entre dos flancos aceptados del mismo botón.
+            capacity: Cantidad máxima de eventos en cola; los que no entran se descartan.
+        """
+        self.pins = pins
+        self.debounce_ms = debounce_ms
+        self.capacity = capacity
+        self.dropped = 0
+
+        self._ids = bytearray(capacity)
+        self._kinds = bytearray(capacity)
+        self._ticks = [0] * capacity
+        self._written = 0
+        self._read = 0
+        self.flag = runtime.Flag()
+        self._bounced = False
+
+        self._pressed = {}
+        self._last_edge = {}
+        ready = ticks_add(ticks_ms(), -debounce_ms)
+        for btn_id, pin in pins.items():
+            self._pressed[btn_id] = pin.value() == 0
+            self._last_edge[btn_id] = ready
+            pin.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=self._make_handler(btn_id))
+
+    def _make_handler(self, btn_id: int):
+        def handler(pin):
+            self._edge(btn_id, pin.value() == 0, ticks_ms())
+        return handler
+
+    def _edge(self, btn_id: int, pressed: bool, now: int):
+        if pressed == self._pressed[btn_id]:
+            return
+        if ticks_diff(now, self._last_edge[btn_id]) < self.debounce_ms:
+            self._bounced = True
+            return
+        self._pressed[btn_id] = pressed
+        self._last_edge[btn_id] = now
+        self._push(btn_id, PRESS if pressed else RELEASE, now)
+
+    def _push(self, btn_id: int, kind: int, now: int):
+        if self._written - self._read >= self.capacity:
+            self.dropped += 1
+            return
+        index = self._written % self.capacity
+        self._ids[index] = btn_id
+        self._kinds[index] = kind
+        self._ticks[index] = now
+        self._written += 1
+        self.flag.set()
+
+    def _resync(self, _=None):
+        # Un flanco ignorado por rebote puede dejar el estado desfasado: una vez
+        # pasado el tiempo de antirrebote se corrige leyendo el pin. Se ejecuta
+        # con schedule, en el mismo contexto que las IRQ de los pines, para que
+        # _edge y _push nunca corran desde dos contextos a la vez
+        self._bounced = False
+        now = ticks_ms()
+        for btn_id, pin in self.pins.items():
+            self._edge(btn_id, pin.value() == 0, now)
+
+    def pending(self) -> int:
+        return self._written - self._read
+
+    def clear(self):
+        """
+        Descarta los eventos en cola.
+        """
+        self._read = self._written
+
+    async def anext_event(self, timeout_ms: int | None = None):
+        """
+        Espera el siguiente evento: la tarea duerme hasta que la IRQ de un
+        pin encola un evento.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera; None espera indefinidamente.
+
+        Returns:
+            tuple | None: (botón, PRESS o RELEASE, ticks_ms del flanco) o None
+                si se agotó el tiempo.
+        """
+        start = ticks_ms()
+        while not self.pending():
+            # Tras un rebote se vuelven a leer los pines y se mira de nuevo al
+            # vencer el antirrebote; si no, la tarea solo despierta con la IRQ
+            # o al agotar el plazo
+            wait_ms = None
+            if self._bounced:
+                schedule(self._resync, None)
+                wait_ms = self.debounce_ms
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+                if remaining <= 0:
+                    return None
+                wait_ms = remaining if wait_ms is None else min(wait_ms, remaining)
+            await self.flag.wait_ms(wait_ms)
+        return self._pop()
+
+    def _pop(self):
+        index = self._read % self.capacity
+        event = (self._ids[index], self._kinds[index], self._ticks[index])
+        self._read += 1
+        return event
+
+    async def anext_press(self, *excluded: int, timeout_ms: int | None = None):
+        """
+        Espera la siguiente pulsación de un botón no excluido.
+
+        Returns:
+            int | None: Identificador del botón o None si se agotó el tiempo.
+        """
+        start = ticks_ms()
+        while True:
+            remaining = None
+            if timeout_ms is not None:
+                remaining = max(0, timeout_ms - ticks_diff(ticks_ms(), start))
+            event = await self.anext_event(remaining)
+            if event is None:
+                return None
+            btn_id, kind, _ = event
+            if kind == PRESS and btn_id not in excluded:
+                return btn_id
@@ -1,9 +1,17 @@
-import time
 import random
-import threading
 from machine import I2C, Pin
 from lcd.i2c_lcd import I2cLcd
+import shadow_lcd
+import display_server
+import big_digits
+import screen_templates
+import refresh_scheduler
+import runtime
+from buttons import ButtonQueue
+from ticks import ticks_ms, ticks_diff
 import esp_now_manager
+import protocol
+import rpc
 
 WELCOME_MESSAGES = (
     "Bienvenido",
@@ -13,7 +21,8 @@ WELCOME_MESSAGES = (
 
 # EspNow Configuration
 MASTER_MAC_ADDRESS = b'que bonitos ojos tines'
-esp_now = esp_now_manager.ESPNow(bytes(int(x, 16) for x in MASTER_MAC_ADDRESS.split(':')))
+esp_now = esp_now_manager.ESPNow(bytes(int(x, 16) for x in MASTER_MAC_ADDRESS.split(':')), reliable=True)
+esp_rpc = rpc.RpcClient(esp_now)  # requests to the master, matched with their reply
 
 # I2C Module configuration for 2x16 lcd display
 i2c = I2C(0, scl=Pin(23), sda=Pin(22), freq=400000)
@@ -21,6 +30,7 @@ print(i2c.scan())
 I2C_ADDR = 0x27
 LCD_DIMENSIONS = 2, 16
 lcd = I2cLcd(i2c, I2C_ADDR, *LCD_DIMENSIONS)
+screen = display_server.DisplayServer(shadow_lcd.ShadowLcd(lcd, *LCD_DIMENSIONS))
 
 overwrite_distance: int | None = None
 RESPONSE_MAX_WAIT_TIME: int = 5
@@ -31,6 +41,7 @@ buttons = {
     2: Pin(27, Pin.IN, Pin.PULL_UP),  # pause_button
     3: Pin(26, Pin.IN, Pin.PULL_UP),  # stop_button
 }
+button_queue = ButtonQueue(buttons)
 
 
 def pad_text(text: str):
@@ -48,165 +59,174 @@ def separate_text(*text: str):
     return separation.join(text)
 
 
-def wait_release():
-    while any(button.value() == 0 for button in buttons.values()):
-        time.sleep(0.1)
-
-
-def get_input(*excluded_buttons: int) -> int:
-    while True:
-        for btn_id, button in buttons.items():
-            if button.value() == 0 and btn_id not in excluded_buttons:
-                wait_release()
-                return btn_id
-        time.sleep(0.1)
-
-
-def listen_esp_now_response(limit: int | None = RESPONSE_MAX_WAIT_TIME) -> str | None:
-    init_wait_time = time.process_time()
-    response = esp_now.get_message()
-    while True:
-
+# Menu screens, compiled once at startup
+HOME_SCREEN = screen_templates.Template(pad_text('HOME'), separate_text('start', 'config'), cols=LCD_DIMENSIONS[1])
+CONFIG_SCREEN = screen_templates.Template('Distance', separate_text('select', '↑', '↓'), cols=LCD_DIMENSIONS[1])
+AUTO_SCREEN = screen_templates.Template(
+    'auto:', separate_text('Select', 'Upt', '↓'),
+    fields={'distance': (0, 6, 2), 'selected': (0, 15, 1)}, cols=LCD_DIMENSIONS[1],
+)
+MANUAL_SCREEN = screen_templates.Template(
+    'manual', separate_text('Select', 'Edit', '↑'),
+    fields={'selected': (0, 15, 1)}, cols=LCD_DIMENSIONS[1],
+)
+METERS_SCREEN = screen_templates.Template(
+    'Meters:', separate_text('Apply', '+', '-'),
+    fields={'meters': (0, 7, 2)}, cols=LCD_DIMENSIONS[1],
+)
 
-        if response:
-            break
-        if limit is not None and time.process_time() - init_wait_time > limit:
-            esp_now.listener.stop()
-            break
 
-        time.sleep(0.1)
-    return response
+async def get_input(*excluded_buttons: int, timeout_ms: int | None = None) -> int | None:
+    return await button_queue.anext_press(*excluded_buttons, timeout_ms=timeout_ms)
 
 
-def home():
-    lcd.clear()
+async def request_master(opcode: int, limit: int | None = RESPONSE_MAX_WAIT_TIME) -> bytearray | None:
+    return await esp_rpc.request(opcode, timeout_ms=limit * 1000 if limit is not None else None)
 
-    lcd.move_to(0, 0)
-    lcd.putstr(pad_text('HOME'))
 
-    lcd.move_to(0, 1)
-    lcd.putstr(separate_text('start', 'config'))
+async def home():
+    screen.show(*HOME_SCREEN.render())
 
-    button_input = get_input(0, 2)
+    button_input = await get_input(0, 2)
 
     if button_input == 1:
-        measure()
+        await measure()
 
     if button_input == 3:
-        config()
+        await config()
 
 
-def measure():
-    def listen_input():
-        nonlocal paused_time, listening
-        running: bool = True
-        init_paused = 0
-        while listening:
-            button_input = get_input(0, 1)
+async def measure():
+    async def listen_input():
+        while True:
+            button_input = await get_input(0)
+            if button_input == 1:
+                timer_screen.toggle_big_digits()
             if button_input == 2:
-                timer_screen.first_timer_running = not running
-                timer_screen.second_timer_running = not running
-                running = not running
-                if running:
-                    paused_time = paused_time + time.process_time() - init_paused if init_paused else 0
-                init_paused = time.process_time()
+                if timer_screen.paused:
+                    timer_screen.resume()
+                else:
+                    timer_screen.pause()
             if button_input == 3:
-                timer_screen.first_timer_running = False
-                timer_screen.second_timer_running = False
+                # Same stop path as main.py: stop every lane before leaving
+                for mac in lanes:
+                    await esp_now.asend_frame(protocol.STOP, peer=mac)
+                    esp_now.peers[mac].state = None
+                timer_screen.finish_first()
+                timer_screen.finish_second()
+                runtime.cancel(stages_task)
                 break
 
-    distance: int = get_distance() if not overwrite_distance else overwrite_distance
+    async def listen_stages():
+        # One task follows every lane; the screen shows the default master's lane
+        while not all(stages[1] is not None or mac in errors for mac, stages in results.items()):
+            event = await esp_rpc.anext_event()
+            mac = esp_rpc.event_peer(event)
+            if mac not in results or mac in errors:
+                continue
+            if protocol.opcode(event) == protocol.ERROR:
+                # The master gave up on this run (e.g. ERR_NO_SECONDARY): end its lane and stop it
+                errors[mac] = protocol.arg(event)
+                print(mac.hex(), 'error', errors[mac])
+                esp_now.peers[mac].state = None
+                if mac == shown_lane:
+                    timer_screen.fail(errors[mac])
+                await esp_now.asend_frame(protocol.STOP, peer=mac)
+                continue
+            if protocol.opcode(event) == protocol.SPLIT:
+                # The LCD has no room for split times: they go to the console
+                print(mac.hex(), 'secondary', protocol.arg(event), protocol.value(event), 'ms')
+                continue
+            stage = protocol.arg(event)
+            if protocol.opcode(event) != protocol.STAGE or stage not in (1, 2):
+                continue
+            results[mac][stage - 1] = protocol.value(event)
+            esp_now.peers[mac].state = 'finished' if stage == 2 else 'running'
+
+            if mac != shown_lane:
+                print(mac.hex(), results[mac])
+            elif stage == 1:
+                timer_screen.finish_first(protocol.value(event))
+            else:
+                timer_screen.finish_second(protocol.value(event))
+
+    distance: int = await get_distance() if not overwrite_distance else overwrite_distance
     distance = max(1, min(distance, 99))
-    paused_time: int = 0
 
-    esp_now.send_message('start')
-    response = esp_now.get_message()                 ########################
-    if response != 'ok':
+    esp_rpc.clear_events()
+    # A single broadcast START arms every registered lane at once
+    replies = await esp_rpc.broadcast(protocol.START, timeout_ms=RESPONSE_MAX_WAIT_TIME * 1000)
+    lanes = [mac for mac, response in replies.items() if protocol.opcode(response) == protocol.OK]
+    if not lanes:
         return
+    results = {mac: [None, None] for mac in lanes}  # MAC -> [stage 1, stage 2] in ms
+    errors = {}  # MAC -> code of the ERROR that ended the lane
+    shown_lane = esp_now.peer_mac if esp_now.peer_mac in lanes else lanes[0]
 
-    listening = True
-    listen_input_thread = threading.Thread(target=listen_input)
-    listen_input_thread.start()
-    timer_screen = LcdTimer(lcd)
+    timer_screen = LcdTimer(screen)
     timer_screen.distance = str(distance)
+    timer_screen.start()
 
-    response = esp_now.get_message()               ################
-    if response and response.isdigit():
-        timer_screen.first_timer_running = False
-        timer_screen.first_timer = int(response) - paused_time
-
-    response = esp_now.get_message()          ##############
-    if response and response.isdigit():
-        timer_screen.second_timer_running = False
-        timer_screen.second_timer = int(response) - paused_time
+    stages_task = runtime.spawn(listen_stages())
+    listen_input_task = runtime.spawn(listen_input())
 
-    listening = False
-    listen_input_thread.join()
+    await runtime.join(stages_task)
+    runtime.cancel(listen_input_task)
 
-    get_input(2, 3)
+    await get_input(2, 3)
     timer_screen.stop()
 
 
-def config():
+async def config():
     global overwrite_distance
-    time.sleep(0.2)
-    lcd.clear()
-
-    lcd.move_to(0, 0)
-    lcd.putstr('Distance')
+    screen.show(*CONFIG_SCREEN.render())
 
-    lcd.move_to(0, 1)
-    lcd.putstr(separate_text('select', '↑', '↓'))
-
-    button_input = get_input()
+    button_input = await get_input()
 
     if button_input == 0:
         return
 
     if button_input == 1:
-        overwrite_distance = distance_config_menu.start()
+        overwrite_distance = await distance_config_menu.start()
 
     if button_input == 2:
-        config()
+        await config()
 
     if button_input == 3:
-        config()
-
+        await config()
 
-def get_distance():
-    esp_now.send_message('distance')
 
-    response = listen_esp_now_response()
-    distance = int(response) if response and response.isdigit() else 1
+async def get_distance():
+    response = await request_master(protocol.DISTANCE_REQUEST)
+    # Distance arrives in centimetres; 0 means it could not be measured
+    distance = protocol.value(response) // 100 if response and protocol.opcode(response) == protocol.DISTANCE else 1
 
     distance = max(1, min(distance, 99))
     return distance
 
 
 class DistanceConfigMenu:
-    def __init__(self, lcd_i2c: 'I2cLcd'):
-        self.lcd = lcd_i2c
+    def __init__(self, screen_lcd: 'display_server.DisplayServer'):
+        self.lcd = screen_lcd
 
         self.selected_type = 0
 
         self.distance: int = 1
         self.manual_distance: int = self.distance
 
-    def start(self):
-        self.distance = get_distance()
-        self.auto()
+    async def start(self):
+        self.distance = await get_distance()
+        await self.auto()
         if self.selected_type == 1:
             return self.manual_distance
 
-    def auto(self):
-        self.lcd.clear()
-
-        self.lcd.move_to(0, 0)
-        self.lcd.putstr(separate_text(f'auto: {self.distance}', '*' if self.selected_type == 0 else ''))
-        self.lcd.move_to(0, 1)
-        self.lcd.putstr(separate_text('Select', 'Upt', '↓'))
+    async def auto(self):
+        self.lcd.show(*AUTO_SCREEN.render(
+            distance=self.distance,
+            selected='*' if self.selected_type == 0 else None,
+        ))
 
-        button_input = get_input(1 if not self.selected_type == 0 else None)
+        button_input = await get_input(1 if not self.selected_type == 0 else None)
 
         # if button_input == 1  End the config Menu
 
@@ -214,22 +234,17 @@ class DistanceConfigMenu:
             self.selected_type = 0
 
         if button_input == 2:
-            new_distance = get_distance()
+            new_distance = await get_distance()
             if new_distance is not None and new_distance != 1:
                 self.distance = new_distance
 
         if button_input == 3:
-            self.manual()
+            await self.manual()
 
-    def manual(self):
-        self.lcd.clear()
+    async def manual(self):
+        self.lcd.show(*MANUAL_SCREEN.render(selected='*' if self.selected_type == 1 else None))
 
-        self.lcd.move_to(0, 0)
-        self.lcd.putstr(separate_text('manual', '*' if self.selected_type == 1 else ''))
-        self.lcd.move_to(0, 1)
-        self.lcd.putstr(separate_text('Select', 'Edit', '↑'))
-
-        button_input = get_input(1 if not self.selected_type == 1 else None)
+        button_input = await get_input(1 if not self.selected_type == 1 else None)
 
         if button_input == 0:
             return
@@ -238,23 +253,19 @@ class DistanceConfigMenu:
             self.selected_type = 1
 
         if button_input == 2:
-            self.meter_select()
+            await self.meter_select()
 
         if button_input == 3:
-            self.auto()
+            await self.auto()
 
-    def meter_select(self):
+    async def meter_select(self):
         meters = self.manual_distance
         while True:
             meters = max(1, min(meters, 99))
 
-            self.lcd.clear()
-            self.lcd.move_to(0, 0)
-            self.lcd.putstr(f'Meters:{meters}')
-            self.lcd.move_to(0, 1)
-            self.lcd.putstr(separate_text('Apply', '+', '-'))
+            self.lcd.show(*METERS_SCREEN.render(meters=meters))
 
-            button_input = get_input()
+            button_input = await get_input()
 
             if button_input == 0:
                 return
@@ -271,66 +282,154 @@ class DistanceConfigMenu:
 
 
 class LcdTimer:
-    def __init__(self, lcd_i2c: 'I2cLcd'):
-        self.lcd = lcd_i2c
+    MAX_MS = (99 * 60 + 59) * 1000 + 900
+
+    def __init__(self, screen_lcd: 'display_server.DisplayServer'):
+        self.lcd = screen_lcd
         self.first_timer = 0
         self.second_timer = 0
         self.running = False
         self.first_timer_running = False
         self.second_timer_running = False
+        self.paused = False
+        self.paused_ms = 0
         self.speed = "--"
         self.distance = "--"
+        self.error: int | None = None
+        self.big_digits = False
+        self._start_tick = 0
+        self._pause_tick = 0
+        self.scheduler = refresh_scheduler.RefreshScheduler(screen_lcd)
 
     def start(self):
         if not self.running:
             self.running = True
-            threading.Thread(target=self._update_display, daemon=True).start()
+            self.first_timer_running = True
+            self.second_timer_running = True
+            self.paused = False
+            self.paused_ms = 0
+            self._start_tick = ticks_ms()
+            self.scheduler.set_mode(refresh_scheduler.FAST)
+            runtime.spawn(self._update_display())
         return self
 
     def stop(self):
         self.running = False
+        self.scheduler.close()
         return self
 
-    def _update_display(self):
-        self.first_timer_running = True
-        self.second_timer_running = True
+    def pause(self):
+        if not self.paused:
+            self._pause_tick = ticks_ms()
+            self.paused = True
+            self._changed()
+
+    def resume(self):
+        if self.paused:
+            self.paused_ms += ticks_diff(ticks_ms(), self._pause_tick)
+            self.paused = False
+            self._changed()
+
+    def toggle_big_digits(self):
+        self.big_digits = not self.big_digits
+        self._changed()
+
+    def total_paused_ms(self) -> int:
+        if self.paused:
+            return self.paused_ms + ticks_diff(ticks_ms(), self._pause_tick)
+        return self.paused_ms
+
+    def elapsed_ms(self) -> int:
+        return ticks_diff(ticks_ms(), self._start_tick) - self.total_paused_ms()
+
+    def finish_first(self, elapsed_ms: int | None = None):
+        """
+        Congela el primer cronómetro; elapsed_ms es el tiempo medido por el
+        cono (incluye las pausas, que se descuentan aquí).
+        """
+        if self.first_timer_running:
+            self.first_timer = self._finished_ms(elapsed_ms)
+            self.first_timer_running = False
+            self._changed()
+
+    def finish_second(self, elapsed_ms: int | None = None):
+        if self.second_timer_running:
+            self.second_timer = self._finished_ms(elapsed_ms)
+            self.second_timer_running = False
+            self._changed()
+
+    def fail(self, code: int):
+        """
+        Detiene ambos cronómetros y muestra el código de error en lugar de la velocidad.
+        """
+        self.error = code
+        self.big_digits = False
+        self.finish_first()
+        self.finish_second()
+        self._changed()
+
+    def _finished_ms(self, elapsed_ms: int | None) -> int:
+        if elapsed_ms is None:
+            return min(self.elapsed_ms(), self.MAX_MS)
+        return max(0, min(elapsed_ms - self.total_paused_ms(), self.MAX_MS))
+
+    def _changed(self):
+        """
+        Ajusta el ritmo de refresco al estado actual; set_mode despierta a
+        _update_display, que redibuja en el momento (una sola vez).
+        """
+        if not (self.first_timer_running or self.second_timer_running):
+            self.scheduler.set_mode(refresh_scheduler.STOPPED)
+        elif self.paused:
+            self.scheduler.set_mode(refresh_scheduler.IDLE)
+        else:
+            self.scheduler.set_mode(refresh_scheduler.FAST)
+
+    def refresh(self):
+        elapsed = min(self.elapsed_ms(), self.MAX_MS)
+        first_timer = elapsed if self.first_timer_running else self.first_timer
+        second_timer = elapsed if self.second_timer_running else self.second_timer
+
+        if self.big_digits:
+            shown_timer = first_timer if self.first_timer_running else second_timer
+            self.lcd.show(*big_digits.render(shown_timer // 1000), glyphs=big_digits.GLYPHS)
+        else:
+            first_time_str = self._format_time(first_timer)
+            second_time_str = self._format_time(second_timer)
+
+            label = f"ERR{self.error}" if self.error is not None else f"{self.speed}M/S"
+            self.lcd.show(
+                separate_text(label, f"T1{first_time_str}"),
+                separate_text(f"{self.distance}M", f"T2{second_time_str}"),
+            )
+
+    async def _update_display(self):
         while self.running:
-            if self.first_timer < 99 * 60 and self.first_timer_running:
-                self.first_timer += 1
-            if self.second_timer < 99 * 60 and self.first_timer_running:
-                self.second_timer += 1
+            self.refresh()
+            await self.scheduler.await_next()
 
-            first_time_str = self._format_time(self.first_timer)
-            second_time_str = self._format_time(self.second_timer)
+    @staticmethod
+    def _format_time(milliseconds: int) -> str:
+        seconds, tenths = divmod(milliseconds // 100, 10)
+        minutes, seconds = divmod(seconds, 60)
+        return f"{minutes:02}:{seconds:02}.{tenths}"
 
-            self.lcd.clear()
-            self.lcd.putstr(separate_text(f"{self.speed}M/S", f"T1{first_time_str}"))
-            self.lcd.move_to(0, 1)
-            self.lcd.putstr(separate_text(f"{self.distance}Meters", f"T2{second_time_str}"))
 
-            if self.first_timer >= 99 * 60:
-                self.first_timer = 99 * 60
-            if self.second_timer >= 99 * 60:
-                self.second_timer = 99 * 60
+async def app():
+    runtime.spawn(screen.serve())
+    esp_rpc.start()
+    print('cones:', [mac.hex() for mac in await esp_rpc.discover()])
 
-            time.sleep(1)
+    await runtime.sleep_ms(2000)
+    welcome_message = random.choice(WELCOME_MESSAGES)
+    screen.show('  ' + welcome_message)
+    await runtime.sleep_ms(4000)
+    screen.clear()
 
-    @staticmethod
-    def _format_time(seconds: int) -> str:
-        minutes = seconds // 60
-        seconds = seconds % 60
-        return f"E{minutes:02}:{seconds:02}"
+    while True:
+        await home()
 
 
 if __name__ == '__main__':
-    time.sleep(2)
-    distance_config_menu = DistanceConfigMenu(lcd)
-    welcome_message = random.choice(WELCOME_MESSAGES)
-    lcd.move_to(2, 0)
-    lcd.putstr(welcome_message)
-    time.sleep(4)
-    lcd.clear()
-
-    while True:
-        time.sleep(0.1)
-        home()
+    distance_config_menu = DistanceConfigMenu(screen)
+    runtime.run(app())
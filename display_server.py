@@ -0,0 +1,127 @@
+"""
+Servicio de pantalla: un único hilo es dueño del LCD y dibuja las pantallas
+que le envían los demás hilos.
+
+Enviar una pantalla nunca bloquea; si llega una pantalla nueva antes de que
+la anterior se haya dibujado, la anterior se descarta (gana la más reciente).
+"""
+import runtime
+from mpthreading import Thread, Condition
+from ticks import ticks_us, ticks_diff
+
+
+class DisplayServer:
+    def __init__(self, screen: 'shadow_lcd.ShadowLcd'):
+        """
+        Inicializa el servicio sobre una pantalla con buffer en sombra.
+
+        Args:
+            screen: ShadowLcd que se usará para dibujar.
+        """
+        self.screen = screen
+        self.running = False
+        self._pending = None
+        self._pending_glyphs = None
+        self._flag = None
+        self._cond = Condition()
+
+        self.frames_submitted = 0
+        self.frames_drawn = 0
+        self.frames_dropped = 0
+        self.busy_us = 0
+
+    def start(self):
+        """
+        Arranca el hilo que dibuja las pantallas.
+        """
+        if not self.running:
+            self.running = True
+            Thread(target=self._serve, name='display', daemon=True).start()
+        return self
+
+    async def serve(self):
+        """
+        Alternativa cooperativa a start(): dibuja desde una tarea del bucle
+        en lugar de un hilo propio.
+        """
+        self.running = True
+        self._flag = runtime.Flag()
+        while self.running:
+            lines, glyphs = self._take()
+            if lines is None:
+                await self._flag.wait()
+                continue
+            self._draw(lines, glyphs)
+
+    def stop(self):
+        """
+        Detiene el hilo; las pantallas pendientes se descartan.
+        """
+        self.running = False
+        self._signal()
+        return self
+
+    def show(self, *lines, glyphs=None):
+        """
+        Envía una pantalla completa para que se dibuje. No bloquea.
+
+        Args:
+            *lines: Texto (str o bytes) de cada fila, desde la fila 0.
+            glyphs: Juego de caracteres personalizados que la pantalla necesita
+                en la CGRAM (ver ShadowLcd.load_glyphs).
+        """
+        with self._cond:
+            if self._pending is not None:
+                self.frames_dropped += 1
+            self._pending = lines
+            self._pending_glyphs = glyphs
+            self.frames_submitted += 1
+        self._signal()
+
+    def clear(self):
+        """
+        Envía una pantalla en blanco.
+        """
+        self.show()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Pantallas enviadas, dibujadas y descartadas, y tiempo total
+                dibujando en microsegundos.
+        """
+        return {
+            'submitted': self.frames_submitted,
+            'drawn': self.frames_drawn,
+            'dropped': self.frames_dropped,
+            'busy_us': self.busy_us,
+        }
+
+    def _signal(self):
+        if self._flag is not None:
+            self._flag.set()
+        with self._cond:
+            self._cond.notify()
+
+    def _take(self):
+        with self._cond:
+            lines = self._pending
+            glyphs = self._pending_glyphs
+            self._pending = None
+            return lines, glyphs
+
+    def _serve(self):
+        while self.running:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or not self.running)
+            lines, glyphs = self._take()
+            if lines is not None:
+                self._draw(lines, glyphs)
+
+    def _draw(self, lines, glyphs):
+        start = ticks_us()
+        if glyphs is not None:
+            self.screen.load_glyphs(glyphs)
+        self.screen.show(*lines)
+        self.busy_us += ticks_diff(ticks_us(), start)
+        self.frames_drawn += 1
@@ -1,15 +1,80 @@
-import espnow
-import time
-import threading
-from network import WLAN, STA_IF
+try:
+    import espnow
+    from network import WLAN, STA_IF
+except ImportError:
+    # En el host se usa un transporte UDP con la misma API (ver host_espnow)
+    import host_espnow as espnow
+    from host_espnow import WLAN, STA_IF
+
+import protocol
+import runtime
+from ticks import ticks_ms, ticks_diff, ticks_add, sleep_ms
+
+# Dirección de difusión: una sola transmisión llega a todos los conos en el canal
+BROADCAST = b'\xff' * 6
+
+
+class Peer:
+    def __init__(self, mac: bytes, dedup_window: int):
+        """
+        Estado de un peer registrado.
+
+        Args:
+            mac: Dirección MAC del peer.
+            dedup_window: Tramas recientes que se recuerdan para descartar duplicados.
+        """
+        self.mac = mac
+        self.state = None  # libre para la aplicación (p. ej. 'armed', 'running')
+        self.last_seen_ms: int | None = None
+        self.received = 0
+        self.duplicates = 0
+        self.send_failures = 0
+        self._acked = bytearray(32)  # un bit por número de secuencia que este peer confirmó
+        # Cada peer tiene su propio turno de envío: uno que no responde no
+        # demora los envíos confiables a los demás
+        self._ack_flag = runtime.Flag()
+        self._send_lock = runtime.Lock()
+        self._outgoing = bytearray(protocol.FRAME_SIZE)
+        self._recent = [bytearray(protocol.FRAME_SIZE) for _ in range(dedup_window)]
+        self._recent_index = 0
+
+    def _is_duplicate(self, message) -> bool:
+        for recent in self._recent:
+            if protocol.same_frame(recent, message):
+                self.duplicates += 1
+                return True
+        self._recent[self._recent_index][:] = memoryview(message)[:protocol.FRAME_SIZE]
+        self._recent_index = (self._recent_index + 1) % len(self._recent)
+        return False
+
 
 class ESPNow:
-    def __init__(self, peer_mac: bytes):
+    # Tamaño máximo de un paquete ESP-NOW (espnow.MAX_DATA_LEN)
+    MAX_DATA_LEN = 250
+    # Intervalo de espera en get_message; sleep_ms también deja correr el callback
+    POLL_MS = 1
+    # Canal confiable: reintentos tras el primer envío y espera del ack, que
+    # se duplica en cada intento hasta RETRY_MAX_MS
+    RETRIES = 4
+    RETRY_BASE_MS = 20
+    RETRY_MAX_MS = 320
+    # Límites superiores de los tramos del histograma de latencia; el último
+    # tramo cuenta lo que supera al mayor
+    LATENCY_BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500)
+    # Tramas recientes que se recuerdan para descartar duplicados
+    DEDUP_WINDOW = 4
+
+    def __init__(self, peer_mac: bytes, capacity: int = 8, reliable: bool = False):
         """
         Inicializa el módulo ESP-NOW y configura un peer.
 
         Args:
-            peer_mac: Dirección MAC del dispositivo peer en formato bytes.
+            peer_mac: Dirección MAC del peer por defecto en formato bytes; se
+                pueden agregar más con add_peer.
+            capacity: Paquetes que se guardan mientras nadie los lee.
+            reliable: Si es True, cada trama recibida se confirma con un ACK y
+                las repetidas se descartan, y asend_frame reintenta hasta
+                recibir el ACK. Ambos extremos deben activarlo.
         """
         wlan = WLAN(STA_IF)
         wlan.active(True)  # Activa el modo estación
@@ -17,10 +82,83 @@ class ESPNow:
         self.esp_now.active(True)
         self.peer_mac = peer_mac
         self.responses = []
+        self.peers = {}  # MAC -> Peer
+        self._peer_list = []  # los mismos Peer, para buscarlos sin crear bytes en el callback
+
+        # Buffer circular preasignado: el callback de recepción copia cada
+        # paquete aquí, así no se pierde lo que llega mientras nadie espera.
+        # Solo el callback avanza _written y solo los lectores avanzan _read.
+        self._ring = [bytearray(self.MAX_DATA_LEN) for _ in range(capacity)]
+        self._ring_len = bytearray(capacity)
+        self._ring_peer = [bytearray(6) for _ in range(capacity)]
+        self._written = 0
+        self._read = 0
+        self._flag = runtime.Flag()
+        self._encoder = protocol.Encoder()
+        self._frame = bytearray(protocol.FRAME_SIZE)
+        self.frame_peer = bytearray(6)  # MAC de quien envió la última trama leída
+        self.received = 0
+        self.overflows = 0
+
+        self.reliable = reliable
+        self._ack_encoder = protocol.Encoder()  # el callback no toca el buffer de _encoder
+        self.duplicates = 0
+        self.retransmissions = 0
+        self.failures = 0
+        self.retry_histogram = [0] * (self.RETRIES + 1)
+        self.latency_histogram = [0] * (len(self.LATENCY_BUCKETS_MS) + 1)
 
         # Configurar el peer si no está ya registrado
-        if not self.esp_now.add_peer(peer_mac):
-            print(f"Peer {peer_mac.hex()} ya registrado.")
+        self.add_peer(peer_mac)
+        try:
+            self.esp_now.add_peer(BROADCAST)
+        except OSError:
+            pass  # ya registrado
+
+        self.esp_now.irq(self._on_recv)
+
+    def add_peer(self, mac: bytes) -> Peer:
+        """
+        Registra un peer (si no lo estaba) para poder enviarle tramas.
+
+        Args:
+            mac: Dirección MAC del peer.
+
+        Returns:
+            Peer: El estado del peer.
+        """
+        mac = bytes(mac)
+        peer = self.peers.get(mac)
+        if peer is not None:
+            return peer
+        try:
+            self.esp_now.add_peer(mac)
+        except OSError:
+            print(f"Peer {mac.hex()} ya registrado.")
+        peer = Peer(mac, self.DEDUP_WINDOW)
+        self.peers[mac] = peer
+        self._peer_list = self._peer_list + [peer]  # el callback puede estar recorriendo la lista
+        return peer
+
+    def remove_peer(self, mac: bytes):
+        """
+        Quita un peer de la tabla; sus paquetes siguen llegando y, con
+        reliable=True, su próxima trama lo vuelve a registrar.
+        """
+        peer = self.peers.pop(bytes(mac), None)
+        if peer is None:
+            return
+        self._peer_list = [other for other in self._peer_list if other is not peer]
+        try:
+            self.esp_now.del_peer(peer.mac)
+        except OSError:
+            pass
+
+    def _find_peer(self, mac) -> Peer | None:
+        for peer in self._peer_list:
+            if peer.mac == mac:
+                return peer
+        return None
 
     def send_message(self, message: str):
         """
@@ -32,28 +170,271 @@ class ESPNow:
         Returns:
             bool: True si el mensaje fue enviado exitosamente, False en caso contrario.
         """
+        return self._send(message.encode("utf-8"))
+
+    def send_frame(self, opcode: int, value: int = 0, arg: int = 0, peer: bytes | None = None):
+        """
+        Envía una trama del protocolo binario.
+
+        Args:
+            opcode: Tipo de mensaje (constantes de protocol).
+            value: Milisegundos o centímetros, según el opcode.
+            arg: Argumento de un byte, según el opcode.
+            peer: MAC de destino (BROADCAST llega a todos); None usa el peer por defecto.
+
+        Returns:
+            bool: True si la trama fue enviada exitosamente, False en caso contrario.
+        """
+        return self._send(self._encoder.encode(opcode, value, arg), peer)
+
+    def broadcast_frame(self, opcode: int, value: int = 0, arg: int = 0):
+        """
+        Envía una trama a todos los conos con una sola transmisión (sin ACK).
+        """
+        return self.send_frame(opcode, value, arg, BROADCAST)
+
+    def _send(self, payload, peer: bytes | None = None):
+        mac = peer if peer is not None else self.peer_mac
         try:
-            self.esp_now.send(self.peer_mac, message.encode("utf-8"))
+            self.esp_now.send(mac, payload)
             return True
         except OSError as e:
             print(f"Error enviando mensaje: {e}")
+            state = self._find_peer(mac)
+            if state is not None:
+                state.send_failures += 1
             return False
 
-    def _esp_now_recv(self, result: list | None = None):
-        peer, message = self.esp_now.recv()
-        if result:
-            result.append(message)
-        return message.decode() if message else None
+    async def asend_frame(self, opcode: int, value: int = 0, arg: int = 0, peer: bytes | None = None) -> bool:
+        """
+        Envía una trama y espera su ACK, reintentando con espera exponencial
+        acotada. Requiere reliable=True en ambos extremos.
 
-    def get_message(self, timeout: float | None = None) -> str | None:
-        if not timeout:
-            return self._esp_now_recv()
-        result = []
-        esp_now_recv_thread = threading.Thread(target=self._esp_now_recv, args=(result,))
-        init_t = time.time()
-        esp_now_recv_thread.start()
-        while time.time() - init_t < timeout:
-            if result:
+        Args:
+            opcode: Tipo de mensaje (constantes de protocol).
+            value: Milisegundos o centímetros, según el opcode.
+            arg: Argumento de un byte, según el opcode.
+            peer: MAC de destino; None usa el peer por defecto.
+
+        Returns:
+            bool: True si el peer confirmó la trama, False si se agotaron los
+                reintentos o el peer no está registrado.
+        """
+        # Solo cuenta el ACK del destino: uno tardío de otro peer con el mismo
+        # número de secuencia no confirma esta trama
+        target = self.peers.get(bytes(peer if peer is not None else self.peer_mac))
+        if target is None:
+            self.failures += 1
+            return False
+        acked = target._acked
+        outgoing = target._outgoing
+        async with target._send_lock:
+            # Copia propia: un send_frame concurrente reutiliza el buffer del encoder
+            outgoing[:] = self._encoder.encode(opcode, value, arg)
+            seq = protocol.seq(outgoing)
+            acked[seq >> 3] &= ~(1 << (seq & 7))
+            start = ticks_ms()
+            delay = self.RETRY_BASE_MS
+            for attempt in range(self.RETRIES + 1):
+                if attempt:
+                    self.retransmissions += 1
+                self._send(outgoing, peer)
+                deadline = ticks_add(ticks_ms(), delay)
+                while not self._is_acked(acked, seq):
+                    remaining = ticks_diff(deadline, ticks_ms())
+                    if remaining <= 0:
+                        break
+                    await target._ack_flag.wait_ms(remaining)
+                if self._is_acked(acked, seq):
+                    self._record_delivery(attempt, ticks_diff(ticks_ms(), start))
+                    return True
+                delay = min(delay * 2, self.RETRY_MAX_MS)
+            self.failures += 1
+            return False
+
+    @staticmethod
+    def _is_acked(acked: bytearray, seq: int) -> bool:
+        return bool(acked[seq >> 3] & (1 << (seq & 7)))
+
+    def _record_delivery(self, attempt: int, latency_ms: int):
+        self.retry_histogram[attempt] += 1
+        bucket = 0
+        for limit in self.LATENCY_BUCKETS_MS:
+            if latency_ms < limit:
+                break
+            bucket += 1
+        self.latency_histogram[bucket] += 1
+
+    def _accept_reliable(self, esp_now, peer, state, message) -> bool:
+        # Procesa ACKs y confirma tramas en el callback, así el emisor no
+        # depende de que alguien esté leyendo. Retorna False si el paquete
+        # no debe pasar al anillo.
+        if protocol.opcode(message) == protocol.ACK:
+            if state is not None:
+                seq = protocol.arg(message)
+                state._acked[seq >> 3] |= 1 << (seq & 7)
+                state._ack_flag.set()
+            return False
+        if self._written - self._read >= len(self._ring):
+            # Sin lugar en el anillo la trama no se confirma ni se recuerda
+            # como recibida: el emisor la reintenta hasta que haya lugar
+            self.overflows += 1
+            return False
+        try:
+            esp_now.send(peer, self._ack_encoder.encode(protocol.ACK, arg=protocol.seq(message)), False)
+        except OSError:
+            return False  # sin ACK el emisor reintenta, así que no se entrega
+        # Los duplicados se buscan por peer: dos conos pueden enviar tramas iguales
+        if state._is_duplicate(message):
+            self.duplicates += 1
+            return False
+        return True
+
+    def _on_recv(self, esp_now):
+        # irecv reutiliza sus buffers, así que cada paquete se copia al anillo
+        capacity = len(self._ring)
+        while True:
+            peer, message = esp_now.irecv(0)
+            if message is None:
                 break
-            time.sleep(0.1)
-        return result[-1]
+            state = self._find_peer(peer)
+            reliable = self.reliable and protocol.is_frame(message)
+            if state is None and reliable and protocol.opcode(message) != protocol.ACK:
+                # Un emisor desconocido (p. ej. un cono que responde a
+                # discover) se registra antes de confirmarle la trama: el ACK
+                # solo sale hacia peers registrados y sus reintentos deben
+                # descartarse como duplicados
+                state = self.add_peer(peer)
+            if state is not None:
+                state.last_seen_ms = ticks_ms()
+                state.received += 1
+            if reliable and not self._accept_reliable(esp_now, peer, state, message):
+                continue
+            if self._written - self._read >= capacity:
+                self.overflows += 1
+                continue
+            index = self._written % capacity
+            length = len(message)
+            self._ring[index][:length] = message
+            self._ring_len[index] = length
+            self._ring_peer[index][:] = peer
+            self._written += 1
+            self.received += 1
+        self._flag.set()
+
+    def pending(self) -> int:
+        """
+        Returns:
+            int: Cantidad de paquetes guardados sin leer.
+        """
+        return self._written - self._read
+
+    def _pop(self) -> str | None:
+        index = self._read % len(self._ring)
+        length = self._ring_len[index]
+        message = self._ring[index][:length].decode() if length else None
+        self._read += 1
+        return message
+
+    def _pop_frame(self) -> bytearray | None:
+        index = self._read % len(self._ring)
+        slot = self._ring[index]
+        frame = None
+        if protocol.is_frame(memoryview(slot)[:self._ring_len[index]]):
+            self._frame[:] = memoryview(slot)[:protocol.FRAME_SIZE]
+            self.frame_peer[:] = self._ring_peer[index]
+            frame = self._frame
+        self._read += 1
+        return frame
+
+    def _wait(self, timeout: float | None) -> bool:
+        start = ticks_ms()
+        while not self.pending():
+            if timeout is not None and ticks_diff(ticks_ms(), start) >= timeout * 1000:
+                return False
+            sleep_ms(self.POLL_MS)
+        return True
+
+    async def _await(self, timeout_ms: int | None) -> bool:
+        start = ticks_ms()
+        while not self.pending():
+            remaining = None
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+                if remaining <= 0:
+                    return False
+            await self._flag.wait_ms(remaining)
+        return True
+
+    def get_message(self, timeout: float | None = None) -> str | None:
+        """
+        Espera un mensaje del peer.
+
+        Args:
+            timeout: Tiempo máximo de espera en segundos; None espera indefinidamente.
+
+        Returns:
+            str | None: El mensaje recibido o None si venció el plazo.
+        """
+        return self._pop() if self._wait(timeout) else None
+
+    async def aget_message(self, timeout_ms: int | None = None) -> str | None:
+        """
+        Espera un mensaje sin bloquear el bucle: la tarea queda suspendida
+        hasta que el callback de recepción guarda un paquete o vence el plazo.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera en milisegundos; None espera indefinidamente.
+
+        Returns:
+            str | None: El mensaje recibido o None si venció el plazo.
+        """
+        return self._pop() if await self._await(timeout_ms) else None
+
+    async def aget_frame(self, timeout_ms: int | None = None) -> bytearray | None:
+        """
+        Como aget_message, pero para tramas del protocolo binario; los
+        paquetes que no son tramas se descartan.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera en milisegundos; None espera indefinidamente.
+
+        Returns:
+            bytearray | None: La trama (válida hasta la siguiente lectura) o
+                None si venció el plazo. frame_peer indica quién la envió.
+        """
+        start = ticks_ms()
+        while True:
+            remaining = None
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+            if not await self._await(remaining):
+                return None
+            frame = self._pop_frame()
+            if frame is not None:
+                return frame
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Paquetes recibidos, descartados por anillo lleno (overflows),
+                descartados por el driver (dropped), pendientes de leer y
+                peers registrados (el detalle está en peers). Con
+                reliable=True también duplicados descartados, reenvíos, envíos
+                fallidos, entregas por cantidad de reintentos y por tramo de
+                latencia (ver LATENCY_BUCKETS_MS).
+        """
+        stats = {
+            'received': self.received,
+            'overflows': self.overflows,
+            'dropped': self.esp_now.stats()[4],
+            'pending': self.pending(),
+            'peers': len(self.peers),
+        }
+        if self.reliable:
+            stats['duplicates'] = self.duplicates
+            stats['retransmissions'] = self.retransmissions
+            stats['failures'] = self.failures
+            stats['retries'] = self.retry_histogram
+            stats['latency_ms'] = self.latency_histogram
+        return stats
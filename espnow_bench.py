@@ -0,0 +1,235 @@
+"""
+Benchmark de los pedidos ESP-NOW entre el control y un cono, en el host.
+
+Los dos extremos usan esp_now_manager.ESPNow (reliable=True) y el control usa
+rpc.RpcClient, igual que en la placa, pero sobre el transporte UDP de
+host_espnow y en procesos separados:
+
+    python espnow_bench.py                     mide con un cono en otro proceso
+    python espnow_bench.py --loss 0.2 --reorder 0.1
+    python espnow_bench.py --cone              solo el cono (responde como master.py)
+    python espnow_bench.py --overflow          entrega con el anillo del cono lleno
+    python espnow_bench.py --dead-peer         envíos a un cono mientras otro no responde
+
+Los parámetros del medio (--latency, --jitter, --loss, --reorder) se aplican
+a ambos procesos.
+"""
+import argparse
+import subprocess
+import sys
+
+import esp_now_manager
+import host_espnow
+import master
+import protocol
+import rpc
+import runtime
+from ticks import ticks_ms, ticks_diff
+
+CONTROL_MAC = b'\x02\x00\x00\x00\x00\xc0'
+CONE_MAC = b'\x02\x00\x00\x00\x00\xc1'
+DEAD_MAC = b'\x02\x00\x00\x00\x00\xc2'
+DISTANCE_CM = 1234
+STAGE_MS = (4321, 9876)
+
+
+async def fixed_distance() -> int:
+    return DISTANCE_CM
+
+
+async def cone():
+    """
+    Responde los pedidos del control con master.answer_control, el mismo
+    código que en la placa, con una distancia fija en lugar de la radio NRF;
+    tras el START envía tiempos de etapa fijos en lugar de esperar al sensor.
+    """
+    esp_now = esp_now_manager.ESPNow(CONTROL_MAC, reliable=True)
+    while True:
+        frame = await esp_now.aget_frame()
+        opcode = await master.answer_control(esp_now, frame, fixed_distance)
+        if opcode == protocol.START:
+            control = bytes(esp_now.frame_peer)
+            for stage, elapsed_ms in enumerate(STAGE_MS, 1):
+                await esp_now.asend_frame(protocol.STAGE, elapsed_ms, arg=stage, peer=control)
+        elif opcode == protocol.STOP:
+            return
+
+
+async def control(calls: int) -> dict:
+    esp_now = esp_now_manager.ESPNow(CONE_MAC, reliable=True)
+    client = rpc.RpcClient(esp_now).start()
+
+    # El cono tarda en arrancar; se repite el descubrimiento hasta verlo
+    for _ in range(50):
+        if CONE_MAC in await client.discover(100):
+            break
+    else:
+        raise OSError("El cono no respondió al descubrimiento.")
+
+    wrong = 0
+    for _ in range(calls):
+        reply = await client.request(protocol.DISTANCE_REQUEST, timeout_ms=1000)
+        if reply is not None and protocol.value(reply) != DISTANCE_CM:
+            wrong += 1
+
+    client.clear_events()
+    replies = await client.broadcast(protocol.START, timeout_ms=1000)
+    stages = []
+    while CONE_MAC in replies and len(stages) < len(STAGE_MS):
+        event = await client.anext_event(2000)
+        if event is None:
+            break
+        if protocol.opcode(event) == protocol.STAGE:
+            stages.append(protocol.value(event))
+
+    await esp_now.asend_frame(protocol.STOP)
+    return {
+        'rpc': client.stats(),
+        'link': esp_now.stats(),
+        'wrong': wrong,
+        'stages_ok': stages == list(STAGE_MS),
+    }
+
+
+async def overflow(frames: int = 12, capacity: int = 2, read_ms: int = 30) -> dict:
+    """
+    Envía tramas confiables a un nodo con un anillo de recepción chico que se
+    lee de a una trama cada read_ms, así que la mayoría llega con el anillo
+    lleno. Las que no entran no se confirman y el emisor las reintenta: cada
+    una debe leerse una sola vez y en orden.
+    """
+    host_espnow.configure(mac=CONE_MAC)
+    cone_link = esp_now_manager.ESPNow(CONTROL_MAC, capacity=capacity, reliable=True)
+    host_espnow.configure(mac=CONTROL_MAC)
+    control_link = esp_now_manager.ESPNow(CONE_MAC, reliable=True)
+
+    received = []
+
+    async def read():
+        while len(received) < frames:
+            frame = await cone_link.aget_frame(2000)
+            if frame is None:
+                return
+            received.append(protocol.value(frame))
+            await runtime.sleep_ms(read_ms)
+
+    reader = runtime.spawn(read())
+    delivered = 0
+    for index in range(frames):
+        delivered += await control_link.asend_frame(protocol.STAGE, index, arg=1)
+    await runtime.join(reader)
+    assert received == list(range(frames)), received
+    assert delivered == frames
+    return {'delivered': delivered, 'sender': control_link.stats(), 'receiver': cone_link.stats()}
+
+
+async def dead_peer(frames: int = 5) -> dict:
+    """
+    Envía tramas confiables a un cono mientras otro envío espera el ACK de un
+    peer que no responde: los reintentos de ese envío no deben demorar los
+    del cono que sí responde.
+    """
+    host_espnow.configure(mac=CONE_MAC)
+    cone_link = esp_now_manager.ESPNow(CONTROL_MAC, reliable=True)
+    host_espnow.configure(mac=CONTROL_MAC)
+    control_link = esp_now_manager.ESPNow(CONE_MAC, reliable=True)
+    control_link.add_peer(DEAD_MAC)
+
+    async def read():
+        for _ in range(frames):
+            if await cone_link.aget_frame(2000) is None:
+                return
+
+    reader = runtime.spawn(read())
+    dead = runtime.spawn(control_link.asend_frame(protocol.STAGE, 0, arg=1, peer=DEAD_MAC))
+    await runtime.sleep_ms(0)  # el envío al peer muerto arranca primero
+    start = ticks_ms()
+    delivered = 0
+    for index in range(frames):
+        delivered += await control_link.asend_frame(protocol.STAGE, index, arg=1)
+    elapsed_ms = ticks_diff(ticks_ms(), start)
+    await runtime.join(reader)
+    assert delivered == frames
+    assert not await dead
+    assert elapsed_ms < esp_now_manager.ESPNow.RETRY_MAX_MS, elapsed_ms
+    return {'delivered': delivered, 'elapsed_ms': elapsed_ms}
+
+
+def report_dead_peer(result: dict):
+    print(f'entregadas          {result["delivered"]:>8}')
+    print(f'tiempo total ms     {result["elapsed_ms"]:>8}')
+
+
+def report_overflow(result: dict):
+    sender = result['sender']
+    receiver = result['receiver']
+    print(f'entregadas una vez  {result["delivered"]:>8}')
+    print(f'anillo lleno        {receiver["overflows"]:>8}')
+    print(f'reenvíos            {sender["retransmissions"]:>8}')
+    print(f'duplicados          {receiver["duplicates"]:>8}')
+
+
+def report(calls: int, result: dict):
+    rpc_stats = result['rpc']
+    link = result['link']
+    answered = calls - rpc_stats['timeouts'] - rpc_stats['failures']
+    print(f'pedidos             {calls:>8}')
+    print(f'respondidos         {answered:>8}')
+    print(f'vencidos            {rpc_stats["timeouts"]:>8}')
+    print(f'respuestas erradas  {result["wrong"]:>8}')
+    print(f'rtt min/prom/max ms {rpc_stats["rtt_min_ms"]:>4} / {rpc_stats["rtt_avg_ms"]:.1f} / {rpc_stats["rtt_max_ms"]}')
+    print(f'reenvíos            {link["retransmissions"]:>8}')
+    print(f'envíos fallidos     {link["failures"]:>8}')
+    print(f'duplicados          {link["duplicates"]:>8}')
+    print(f'etapas correctas    {str(result["stages_ok"]):>8}')
+    print('rtt por tramo (ms): ' + ' '.join(
+        f'<{limit}:{count}' for limit, count in zip(esp_now_manager.ESPNow.LATENCY_BUCKETS_MS, rpc_stats['rtt_ms'])
+    ) + f' más:{rpc_stats["rtt_ms"][-1]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cone', action='store_true', help='ejecutar solo el cono')
+    parser.add_argument('--overflow', action='store_true', help='comprobar la entrega con el anillo lleno')
+    parser.add_argument('--dead-peer', action='store_true', help='comprobar envíos con un peer que no responde')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=2)
+    parser.add_argument('--jitter', type=float, default=1)
+    parser.add_argument('--loss', type=float, default=0)
+    parser.add_argument('--reorder', type=float, default=0)
+    args = parser.parse_args()
+
+    medium = {
+        'latency_ms': args.latency,
+        'jitter_ms': args.jitter,
+        'loss': args.loss,
+        'reorder': args.reorder,
+    }
+    if args.cone:
+        host_espnow.configure(mac=CONE_MAC, **medium)
+        runtime.run(cone())
+        return
+    if args.overflow:
+        host_espnow.configure(**medium)
+        report_overflow(runtime.run(overflow()))
+        return
+    if args.dead_peer:
+        host_espnow.configure(**medium)
+        report_dead_peer(runtime.run(dead_peer()))
+        return
+
+    cone_process = subprocess.Popen([
+        sys.executable, __file__, '--cone',
+        '--latency', str(args.latency), '--jitter', str(args.jitter),
+        '--loss', str(args.loss), '--reorder', str(args.reorder),
+    ])
+    try:
+        host_espnow.configure(mac=CONTROL_MAC, **medium)
+        report(args.calls, runtime.run(control(args.calls)))
+    finally:
+        cone_process.terminate()
+        cone_process.wait()
+
+
+if __name__ == '__main__':
+    main()
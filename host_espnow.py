@@ -0,0 +1,235 @@
+"""
+Transporte ESP-NOW para el host (CPython) con la API de los módulos espnow y
+network de MicroPython, para ejecutar y medir los flujos de mensajes entre el
+control y los conos sin placas. esp_now_manager lo usa cuando espnow no existe.
+
+Cada nodo es un socket UDP en 127.0.0.1 cuyo puerto sale del último byte de
+su MAC (PORT_BASE + mac[5]), así que se comunican tanto nodos de procesos
+distintos como varios nodos de un mismo proceso. La difusión se envía a los
+256 puertos posibles.
+
+El medio simula latencia con variación, pérdida y desorden de paquetes. Los
+parámetros se leen de variables de entorno (útil para procesos separados) o
+se cambian con configure():
+
+    ESPNOW_MAC          MAC del próximo nodo, p. ej. 34:5F:45:A9:4C:CC
+                        (sin ella se asigna 02:00:00:00:00:NN libre)
+    ESPNOW_PORT_BASE    primer puerto UDP (47000)
+    ESPNOW_LATENCY_MS   latencia de cada paquete (2)
+    ESPNOW_JITTER_MS    variación uniforme sumada a la latencia (1)
+    ESPNOW_LOSS         probabilidad de perder un paquete (0)
+    ESPNOW_REORDER      probabilidad de retrasar un paquete REORDER_MS extra,
+                        de modo que lo adelanten los siguientes (0)
+    ESPNOW_REORDER_MS   retraso extra de los paquetes desordenados (20)
+
+Los parámetros se aplican al recibir, así que cada proceso configura el
+enlace de llegada.
+"""
+import heapq
+import os
+import random
+import socket
+import time
+
+from threading import Thread
+
+MAX_DATA_LEN = 250
+# Paquetes recibidos que esperan irecv; más allá se descartan, como el
+# buffer de recepción del driver
+RX_QUEUE = 16
+STA_IF = 0
+BROADCAST = b'\xff' * 6
+
+PORT_BASE = int(os.environ.get('ESPNOW_PORT_BASE', 47000))
+mac = bytes(int(x, 16) for x in os.environ['ESPNOW_MAC'].split(':')) if os.environ.get('ESPNOW_MAC') else None
+latency_ms = float(os.environ.get('ESPNOW_LATENCY_MS', 2))
+jitter_ms = float(os.environ.get('ESPNOW_JITTER_MS', 1))
+loss = float(os.environ.get('ESPNOW_LOSS', 0))
+reorder = float(os.environ.get('ESPNOW_REORDER', 0))
+reorder_ms = float(os.environ.get('ESPNOW_REORDER_MS', 20))
+
+
+def configure(**settings):
+    """
+    Cambia los parámetros del medio (mac, latency_ms, jitter_ms, loss,
+    reorder, reorder_ms) para los nodos que se creen después.
+    """
+    names = ('mac', 'latency_ms', 'jitter_ms', 'loss', 'reorder', 'reorder_ms')
+    for name, value in settings.items():
+        if name not in names:
+            raise ValueError(f"Parámetro desconocido: {name}")
+        globals()[name] = value
+
+
+def port_of(address: bytes) -> int:
+    return PORT_BASE + address[5]
+
+
+class WLAN:
+    def __init__(self, interface: int = STA_IF):
+        self._active = False
+
+    def active(self, flag: bool | None = None):
+        if flag is not None:
+            self._active = flag
+        return self._active
+
+    def config(self, name: str):
+        if name == 'mac':
+            return _last_mac
+        raise ValueError(name)
+
+
+_last_mac = None
+
+
+class ESPNow:
+    def __init__(self):
+        """
+        Nodo ESP-NOW emulado; toma los parámetros del medio vigentes al crearlo.
+        """
+        global _last_mac
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.mac = self._bind(mac)
+        _last_mac = self.mac
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_ms = reorder_ms
+
+        self._active = False
+        self._peers = set()
+        self._callback = None
+        self._delayed = []  # heap de (instante de entrega, orden, mac, mensaje)
+        self._order = 0
+        self._queue = []
+        # irecv reutiliza estos buffers, como en la placa
+        self._peer_buffer = bytearray(6)
+        self._message_buffer = bytearray(MAX_DATA_LEN)
+        # tx_pkts, tx_responses, tx_failures, rx_packets, rx_dropped_packets
+        self._stats = [0, 0, 0, 0, 0]
+        Thread(target=self._receive, name='espnow-host', daemon=True).start()
+
+    def _bind(self, address: bytes | None) -> bytes:
+        if address is not None:
+            self._sock.bind(('127.0.0.1', port_of(address)))
+            return bytes(address)
+        for last in range(1, 255):
+            try:
+                self._sock.bind(('127.0.0.1', PORT_BASE + last))
+                return bytes((0x02, 0, 0, 0, 0, last))
+            except OSError:
+                continue
+        raise OSError("No hay puertos libres para otro nodo.")
+
+    def active(self, flag: bool | None = None):
+        if flag is not None:
+            self._active = flag
+        return self._active
+
+    def add_peer(self, address: bytes, *args, **kwargs):
+        address = bytes(address)
+        if address in self._peers:
+            raise OSError("ESP_ERR_ESPNOW_EXIST")
+        self._peers.add(address)
+
+    def del_peer(self, address: bytes):
+        address = bytes(address)
+        if address not in self._peers:
+            raise OSError("ESP_ERR_ESPNOW_NOT_FOUND")
+        self._peers.discard(address)
+
+    def get_peers(self):
+        return tuple((address,) for address in self._peers)
+
+    def send(self, address: bytes, message, sync: bool = True):
+        if not self._active:
+            raise OSError("ESP_ERR_ESPNOW_NOT_INIT")
+        address = bytes(address)
+        if address not in self._peers:
+            raise OSError("ESP_ERR_ESPNOW_NOT_FOUND")
+        if len(message) > MAX_DATA_LEN:
+            raise ValueError("ESP_ERR_ESPNOW_ARG")
+        packet = self.mac + bytes(message)
+        if address == BROADCAST:
+            own = port_of(self.mac)
+            for port in range(PORT_BASE, PORT_BASE + 256):
+                if port != own:
+                    self._sock.sendto(packet, ('127.0.0.1', port))
+        else:
+            self._sock.sendto(packet, ('127.0.0.1', port_of(address)))
+        self._stats[0] += 1
+        return True
+
+    def any(self) -> bool:
+        return bool(self._queue)
+
+    def irecv(self, timeout_ms: int | None = None):
+        """
+        Retorna (mac, mensaje) sobre buffers reutilizados, o (None, None) si
+        no llegó nada en timeout_ms (None espera indefinidamente).
+        """
+        start = time.monotonic()
+        while not self._queue:
+            if timeout_ms is not None and (time.monotonic() - start) * 1000 >= timeout_ms:
+                return None, None
+            time.sleep(0.001)
+        address, message = self._queue.pop(0)
+        self._peer_buffer[:] = address
+        view = memoryview(self._message_buffer)[:len(message)]
+        view[:] = message
+        return self._peer_buffer, view
+
+    def recv(self, timeout_ms: int | None = None):
+        address, message = self.irecv(timeout_ms)
+        if message is None:
+            return None, None
+        return bytes(address), bytes(message)
+
+    def irq(self, callback):
+        """
+        Registra la función que se llama con este nodo cuando llegan paquetes.
+        En el host se llama desde el hilo receptor, como una IRQ.
+        """
+        self._callback = callback
+
+    def stats(self):
+        return tuple(self._stats)
+
+    def _receive(self):
+        while True:
+            timeout = 0.05
+            if self._delayed:
+                timeout = max(0.0005, self._delayed[0][0] - time.monotonic())
+            self._sock.settimeout(timeout)
+            try:
+                packet = self._sock.recv(6 + MAX_DATA_LEN)
+            except socket.timeout:
+                packet = None
+            except OSError:
+                return  # socket cerrado
+            if packet is not None and len(packet) > 6 and random.random() >= self.loss:
+                self._delay(packet[:6], packet[6:])
+            self._deliver_due()
+
+    def _delay(self, address: bytes, message: bytes):
+        delay = self.latency_ms + random.random() * self.jitter_ms
+        if random.random() < self.reorder:
+            delay += self.reorder_ms
+        self._order += 1
+        heapq.heappush(self._delayed, (time.monotonic() + delay / 1000, self._order, address, message))
+
+    def _deliver_due(self):
+        now = time.monotonic()
+        delivered = False
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, address, message = heapq.heappop(self._delayed)
+            if len(self._queue) >= RX_QUEUE:
+                self._stats[4] += 1
+                continue
+            self._queue.append((address, message))
+            self._stats[3] += 1
+            delivered = True
+        if delivered and self._callback is not None:
+            self._callback(self)
@@ -20,6 +20,15 @@ class LCD:
     LCD_BLINKON = 0x01
     LCD_BLINKOFF = 0x00
 
+    # Bits del expansor PCF8574
+    MASK_RS = 0x01
+    MASK_E = 0x04
+
+    # Bytes por caracter: nibble alto y bajo, cada uno con y sin enable
+    BYTES_PER_CHAR = 4
+    # Capacidad del buffer: una pantalla 2x16 completa más un salto de cursor por fila
+    TX_BUFFER_SIZE = BYTES_PER_CHAR * (2 * 16 + 2)
+
     def __init__(self, i2c, address=0x27):
         """
         Inicializa la pantalla LCD con comunicación I2C
@@ -30,6 +39,9 @@ class LCD:
         self.i2c = i2c
         self.address = address
         self.backlight = 0x08  # Valor por defecto de la luz de fondo
+        self._nibbles = self._build_nibble_table()
+        self._tx = bytearray(self.TX_BUFFER_SIZE)
+        self._txv = memoryview(self._tx)
 
         # Inicialización de la pantalla
         time.sleep(0.0050)
@@ -47,6 +59,48 @@ class LCD:
         self.clear()
         self._write_cmd(self.LCD_ENTRYMODESET | 0x02)  # Incremento de cursor, sin desplazamiento
 
+    def _build_nibble_table(self):
+        """
+        Precalcula los dos bytes (con y sin pulso de enable) que el PCF8574
+        necesita para enviar cada nibble, tanto en modo comando como en datos
+        """
+        table = bytearray(2 * 16 * 2)
+        for mode in (0, 1):
+            for nibble in range(16):
+                value = (nibble << 4) | (self.MASK_RS * mode) | self.backlight
+                index = (mode * 16 + nibble) * 2
+                table[index] = value | self.MASK_E
+                table[index + 1] = value
+        return table
+
+    def _encode(self, data, mode, pos):
+        """
+        Codifica un byte en el buffer de transmisión
+
+        :param data: Byte a codificar
+        :param mode: 0 para comando, 1 para datos
+        :param pos: Posición del buffer donde escribir
+        :return: Siguiente posición libre del buffer
+        """
+        table = self._nibbles
+        tx = self._tx
+        high = (mode * 16 + ((data >> 4) & 0x0F)) * 2
+        low = (mode * 16 + (data & 0x0F)) * 2
+        tx[pos] = table[high]
+        tx[pos + 1] = table[high + 1]
+        tx[pos + 2] = table[low]
+        tx[pos + 3] = table[low + 1]
+        return pos + 4
+
+    def _flush(self, length):
+        """
+        Envía los primeros bytes del buffer de transmisión en una sola transferencia I2C
+
+        :param length: Cantidad de bytes a enviar
+        """
+        if length:
+            self.i2c.writeto(self.address, self._txv[:length])
+
     def _write_cmd(self, cmd):
         """
         Envía un comando al LCD
@@ -70,28 +124,7 @@ class LCD:
         :param data: Datos a enviar
         :param mode: 0 para comando, 1 para datos
         """
-        # Separa los 4 bits altos y bajos
-        data_high = data & 0xF0
-        data_low = (data << 4) & 0xF0
-
-        # Envía los 4 bits altos
-        self._send_i2c(data_high | mode | self.backlight)
-        self._send_i2c(data_high | mode | self.backlight | 0x04)
-        self._send_i2c(data_high | mode | self.backlight)
-
-        # Envía los 4 bits bajos
-        self._send_i2c(data_low | mode | self.backlight)
-        self._send_i2c(data_low | mode | self.backlight | 0x04)
-        self._send_i2c(data_low | mode | self.backlight)
-
-    def _send_i2c(self, data):
-        """
-        Envía un byte a través de I2C
-        
-        :param data: Byte a enviar
-        """
-        self.i2c.writeto(self.address, bytes([data]))
-        time.sleep(0.001)
+        self._flush(self._encode(data, mode, 0))
 
     def clear(self):
         """
@@ -107,21 +140,30 @@ class LCD:
         self._write_cmd(self.LCD_RETURNHOME)
         time.sleep(0.002)
 
-    def move(self, col, row):
+    @staticmethod
+    def _address(col, row):
         """
-        Mueve el cursor a una posición específica
-        
+        Calcula la dirección DDRAM de una posición de la pantalla
+
         :param col: Columna (0-15)
         :param row: Fila (0-1)
         """
         # Calcula la dirección base de la fila
-        row_offsets = [0x00, 0x40]
+        row_offsets = (0x00, 0x40)
         if row > 1:
             row = 1
         if col > 15:
             col = 15
+        return col + row_offsets[row]
+
+    def move(self, col, row):
+        """
+        Mueve el cursor a una posición específica
         
-        self._write_cmd(self.LCD_SETDDRAMADDR | (col + row_offsets[row]))
+        :param col: Columna (0-15)
+        :param row: Fila (0-1)
+        """
+        self._write_cmd(self.LCD_SETDDRAMADDR | self._address(col, row))
 
     def write(self, text):
         """
@@ -129,8 +171,56 @@ class LCD:
         
         :param text: Texto a mostrar
         """
-        for char in text:
-            self._write_data(ord(char))
+        self.draw(((None, None, text),))
+
+    def draw(self, segments):
+        """
+        Escribe varios fragmentos de texto agrupando todo en la menor cantidad
+        posible de transferencias I2C (una sola si cabe en el buffer)
+
+        El HD44780 necesita ~37us por comando o caracter; enviar 4 bytes a
+        400kHz ya tarda más que eso, así que no hace falta esperar entre bytes.
+
+        :param segments: Iterable de tuplas (col, row, texto); si col es None
+            el texto se escribe en la posición actual del cursor
+        """
+        pos = 0
+        limit = self.TX_BUFFER_SIZE - self.BYTES_PER_CHAR
+        for col, row, text in segments:
+            if col is not None:
+                if pos > limit:
+                    self._flush(pos)
+                    pos = 0
+                pos = self._encode(self.LCD_SETDDRAMADDR | self._address(col, row), 0, pos)
+            for char in text:
+                if pos > limit:
+                    self._flush(pos)
+                    pos = 0
+                pos = self._encode(char if isinstance(char, int) else ord(char), 1, pos)
+        self._flush(pos)
+
+    def custom_char(self, location, charmap):
+        """
+        Guarda un caracter personalizado en la CGRAM en una sola transferencia I2C
+
+        Después de esto el cursor queda apuntando a la CGRAM; hay que llamar a
+        move() antes de volver a escribir texto.
+
+        :param location: Posición en la CGRAM (0-7)
+        :param charmap: 8 bytes con las filas del caracter (5 bits cada una)
+        """
+        pos = self._encode(self.LCD_SETCGRAMADDR | ((location & 0x07) << 3), 0, 0)
+        for row in range(8):
+            pos = self._encode(charmap[row], 1, pos)
+        self._flush(pos)
+
+    def write_frame(self, lines):
+        """
+        Redibuja la pantalla completa en una sola transferencia I2C
+
+        :param lines: Texto de cada fila
+        """
+        self.draw((0, row, line) for row, line in enumerate(lines))
 
 def init_lcd(scl_pin=22, sda_pin=21, freq=400000):
     """
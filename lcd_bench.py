@@ -0,0 +1,86 @@
+"""
+Benchmark del tiempo de bus I2C por pantalla del LCD 2x16.
+
+Compara el camino antiguo (seis writeto de un byte por caracter, cada uno
+seguido de 1 ms de espera) con el envío agrupado de i2c_lcd.LCD y con el
+envío de solo diferencias de ShadowLcd durante un tick del cronómetro.
+
+Se ejecuta en el host (python lcd_bench.py): el bus es un I2cBusRecorder que
+modela el tiempo de transferencia y un HD44780 emulado comprueba que lo que
+queda en pantalla es correcto.
+"""
+import time
+
+import i2c_lcd
+import shadow_lcd
+from lcd_emulator import I2cBusRecorder
+from ticks import ticks_us, ticks_diff
+
+
+FRAME = ("--M/S   T1E00:00", "12Meter T2E00:00")
+NEXT_FRAME = ("--M/S   T1E00:01", "12Meter T2E00:01")
+
+
+class LegacyLCD(i2c_lcd.LCD):
+    """
+    Reproduce el envío original byte a byte para poder compararlo.
+    """
+
+    def _write_i2c(self, data, mode):
+        data_high = data & 0xF0
+        data_low = (data << 4) & 0xF0
+        for nibble in (data_high, data_low):
+            self._send_i2c(nibble | mode | self.backlight)
+            self._send_i2c(nibble | mode | self.backlight | 0x04)
+            self._send_i2c(nibble | mode | self.backlight)
+
+    def _send_i2c(self, data):
+        self.i2c.writeto(self.address, bytes([data]))
+        time.sleep(0.001)
+
+    def write_frame(self, lines):
+        for row, line in enumerate(lines):
+            self.move(0, row)
+            for char in line:
+                self._write_data(ord(char))
+
+
+def measure(draw, bus, frames=5):
+    """
+    Ejecuta varias veces un dibujado y devuelve los costes medios por pantalla.
+
+    :return: Tupla (transferencias, bytes, tiempo de bus modelado en us, tiempo real en us)
+    """
+    bus.reset()
+    start = ticks_us()
+    for index in range(frames):
+        draw(index)
+    elapsed = ticks_diff(ticks_us(), start)
+    return bus.calls // frames, bus.bytes // frames, bus.bus_time_us() // frames, elapsed // frames
+
+
+def run(freq=400000, frames=5):
+    legacy_bus = I2cBusRecorder(freq)
+    legacy = LegacyLCD(legacy_bus)
+    batched_bus = I2cBusRecorder(freq)
+    batched = i2c_lcd.LCD(batched_bus)
+    shadow_bus = I2cBusRecorder(freq)
+    shadow = shadow_lcd.ShadowLcd(i2c_lcd.LCD(shadow_bus))
+    shadow.show(*FRAME)
+
+    results = (
+        ('antes', measure(lambda _: legacy.write_frame(FRAME), legacy_bus, frames)),
+        ('agrupado', measure(lambda _: batched.write_frame(FRAME), batched_bus, frames)),
+        ('sombra', measure(lambda index: shadow.show(*(NEXT_FRAME, FRAME)[index % 2]), shadow_bus, frames)),
+    )
+    assert legacy_bus.device().lines() == list(FRAME)
+    assert batched_bus.device().lines() == list(FRAME)
+
+    print('camino     writeto  bytes  bus(us)  total(us)')
+    for name, (calls, sent, bus_us, total_us) in results:
+        print(f'{name:<10} {calls:>7}  {sent:>5}  {bus_us:>7}  {total_us:>9}')
+    return results
+
+
+if __name__ == '__main__':
+    run()
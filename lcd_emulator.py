@@ -0,0 +1,198 @@
+"""
+Emulador de un HD44780 detrás de un expansor PCF8574 y grabador del bus I2C.
+
+Sirve para medir en el host lo que cuestan las pantallas de i2c_lcd.LCD e
+I2cLcd y comprobar qué queda realmente en la pantalla:
+
+    bus = I2cBusRecorder()
+    lcd = i2c_lcd.LCD(bus)
+    lcd.write_frame(('Hola', 'Mundo'))
+    bus.device().lines()  # ['Hola            ', 'Mundo           ']
+"""
+
+# Bits del expansor PCF8574
+MASK_RS = 0x01
+MASK_RW = 0x02
+MASK_E = 0x04
+
+# Dirección DDRAM del comienzo de cada fila
+ROW_OFFSETS = (0x00, 0x40)
+ROW_LENGTH = 0x28
+
+
+class HD44780:
+    def __init__(self, rows: int = 2, cols: int = 16):
+        """
+        Estado emulado del controlador: DDRAM, CGRAM, cursor y modo de bus.
+
+        Args:
+            rows: Filas visibles.
+            cols: Columnas visibles.
+        """
+        self.rows = rows
+        self.cols = cols
+        self.ddram = bytearray(b' ' * 0x80)
+        self.cgram = bytearray(64)
+        self.address = 0
+        self.in_cgram = False
+        self.increment = True
+        self.display_on = False
+        self.four_bit = False
+        self.backlight = False
+        self.commands = 0
+        self.writes = 0
+        self._pending_nibble = None
+        self._last = 0
+
+    def feed(self, value: int):
+        """
+        Procesa un byte escrito en el PCF8574; los datos se capturan en el
+        flanco de bajada de la señal E.
+        """
+        self.backlight = bool(value & 0x08)
+        falling = (self._last & MASK_E) and not (value & MASK_E)
+        self._last = value
+        if not falling or value & MASK_RW:
+            return
+
+        nibble = value >> 4
+        rs = value & MASK_RS
+        if not self.four_bit:
+            # En modo 8 bits cada pulso es una instrucción completa (D3-D0 a 0)
+            self._execute(nibble << 4, rs)
+            return
+
+        if self._pending_nibble is None:
+            self._pending_nibble = nibble
+            return
+        data = (self._pending_nibble << 4) | nibble
+        self._pending_nibble = None
+        self._execute(data, rs)
+
+    def _execute(self, data: int, rs: int):
+        if rs:
+            self.writes += 1
+            self._write(data)
+            return
+
+        self.commands += 1
+        if data & 0x80:
+            self.in_cgram = False
+            self.address = data & 0x7F
+        elif data & 0x40:
+            self.in_cgram = True
+            self.address = data & 0x3F
+        elif data & 0x20:
+            if not self.four_bit and not data & 0x10:
+                self.four_bit = True
+                self._pending_nibble = None
+        elif data & 0x10:
+            pass  # desplazamiento de cursor/pantalla: no usado
+        elif data & 0x08:
+            self.display_on = bool(data & 0x04)
+        elif data & 0x04:
+            self.increment = bool(data & 0x02)
+        elif data & 0x02:
+            self.in_cgram = False
+            self.address = 0
+        elif data & 0x01:
+            self.ddram[:] = b' ' * len(self.ddram)
+            self.in_cgram = False
+            self.address = 0
+            self.increment = True
+
+    def _write(self, data: int):
+        if self.in_cgram:
+            self.cgram[self.address] = data & 0x1F
+            self.address = (self.address + (1 if self.increment else -1)) & 0x3F
+            return
+
+        self.ddram[self.address] = data
+        step = 1 if self.increment else -1
+        row = 1 if self.address >= 0x40 else 0
+        col = (self.address - ROW_OFFSETS[row] + step) % ROW_LENGTH
+        self.address = ROW_OFFSETS[row] + col
+
+    @property
+    def cursor(self):
+        """
+        Returns:
+            tuple: (columna, fila) del contador de direcciones DDRAM.
+        """
+        row = 1 if self.address >= 0x40 else 0
+        return self.address - ROW_OFFSETS[row], row
+
+    def row_bytes(self, row: int) -> bytes:
+        start = ROW_OFFSETS[row]
+        return bytes(self.ddram[start:start + self.cols])
+
+    def lines(self) -> list:
+        """
+        Returns:
+            list: Texto visible de cada fila; los caracteres de la CGRAM (0-7)
+                se muestran como dígitos entre llaves, p. ej. '{3}'.
+        """
+        lines = []
+        for row in range(self.rows):
+            lines.append(''.join('{%d}' % char if char < 8 else chr(char) for char in self.row_bytes(row)))
+        return lines
+
+    def glyph(self, location: int) -> bytes:
+        return bytes(self.cgram[location * 8:location * 8 + 8])
+
+
+class I2cBusRecorder:
+    def __init__(self, freq: int = 400000, devices: dict | None = None):
+        """
+        Sustituto de machine.I2C que reenvía las escrituras a dispositivos
+        emulados y registra bytes y tiempo de bus modelado de cada llamada.
+
+        Args:
+            freq: Frecuencia del bus en Hz.
+            devices: Dirección -> dispositivo con método feed(byte). Por
+                defecto un HD44780 en 0x27.
+        """
+        self.freq = freq
+        self.devices = devices if devices is not None else {0x27: HD44780()}
+        self.calls = 0
+        self.bytes = 0
+        self.log = []
+
+    def device(self, address: int = 0x27):
+        return self.devices[address]
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def transfer_time_us(self, length: int) -> int:
+        """
+        Tiempo de bus de una escritura: start + dirección + stop, y 9 bits por byte.
+        """
+        return ((length + 1) * 9 + 2) * 1000000 // self.freq
+
+    def writeto(self, address: int, buf, stop: bool = True):
+        length = len(buf)
+        self.calls += 1
+        self.bytes += length
+        self.log.append((address, length, self.transfer_time_us(length)))
+        device = self.devices.get(address)
+        if device is None:
+            raise OSError(19)  # ENODEV, igual que en la placa
+        for value in buf:
+            device.feed(value)
+        return length
+
+    def writevto(self, address: int, vector, stop: bool = True):
+        data = b''.join(bytes(buf) for buf in vector)
+        return self.writeto(address, data, stop)
+
+    def reset(self):
+        """
+        Borra los contadores y el registro (no el estado de los dispositivos).
+        """
+        self.calls = 0
+        self.bytes = 0
+        self.log = []
+
+    def bus_time_us(self) -> int:
+        return sum(time_us for _, _, time_us in self.log)
@@ -1,9 +1,17 @@
-import time
 import random
-from threading import Thread
 from machine import I2C, Pin
 import i2c_lcd
+import shadow_lcd
+import display_server
+import big_digits
+import screen_templates
+import refresh_scheduler
+import runtime
+from buttons import ButtonQueue
+from ticks import ticks_ms, ticks_diff
 import esp_now_manager
+import protocol
+import rpc
 
 
 def pad_text(text: str):
@@ -20,172 +28,213 @@ def separate_text(*text: str):
     return separation.join(text)
 
 
-def wait_release():
-    while any(button.value() == 0 for button in buttons.values()):
-        time.sleep(0.1)
+# Pantallas de los menús, compiladas una sola vez al arrancar
+HOME_SCREEN = screen_templates.Template(pad_text('HOME'), separate_text('start', 'config'))
+CONFIG_SCREEN = screen_templates.Template('Distance', separate_text('select', 'up', 'down'))
+AUTO_SCREEN = screen_templates.Template(
+    'auto:', separate_text('Select', 'up', 'down'),
+    fields={'distance': (0, 6, 2), 'selected': (0, 15, 1)},
+)
+MANUAL_SCREEN = screen_templates.Template(
+    'manual', separate_text('Select', 'Edit', '↑'),
+    fields={'selected': (0, 15, 1)},
+)
+METERS_SCREEN = screen_templates.Template(
+    'Meters:', separate_text('Apply', '+', '-'),
+    fields={'meters': (0, 7, 2)},
+)
 
 
-def get_input(*excluded_buttons: int) -> int:
-    while True:
-        for btn_id, button in buttons.items():
-            if button.value() == 0 and btn_id not in excluded_buttons:
-                wait_release()
-                return btn_id
-        time.sleep(0.1)
+async def get_input(*excluded_buttons: int, timeout_ms: int | None = None) -> int | None:
+    return await button_queue.anext_press(*excluded_buttons, timeout_ms=timeout_ms)
 
 
-def home():
+async def home():
     global overwrite_distance
-    lcd.clear()
-
-    lcd.move(0, 0)
-    lcd.write(pad_text('HOME'))
-
-    lcd.move(0, 1)
-    lcd.write(separate_text('start', 'config'))
+    screen.show(*HOME_SCREEN.render())
 
-    button_input = get_input(0, 2)
+    button_input = await get_input(0, 2)
 
     if button_input == 1:
-        measure()
+        await measure()
 
     if button_input == 3:
-        config()
+        await config()
 
 
 class EspNowListenStages:
-    def __init__(self, timer_screen: 'LcdTimer'):
+    def __init__(self, timer_screen: 'LcdTimer', lanes: list):
+        """
+        Junta los tiempos de etapa de todos los carriles con una sola tarea;
+        la pantalla muestra el carril del master por defecto (o el primero).
+        """
         self.timer_screen = timer_screen
         self.running: bool = False
-        self.paused_time: int = 0
         self.second_stage = False
-        self.thread = None
-
-    def listen_for_stage_results(self):
+        self.task = None
+        self.lanes = lanes
+        self.results = {mac: [None, None] for mac in lanes}  # MAC -> [etapa 1, etapa 2] en ms
+        self.errors = {}  # MAC -> código del ERROR que terminó el carril
+        self.shown_lane = esp_now.peer_mac if esp_now.peer_mac in lanes else lanes[0]
+        for mac in lanes:
+            esp_now.peers[mac].state = 'running'
+
+    def finished(self) -> bool:
+        return all(stages[1] is not None or mac in self.errors for mac, stages in self.results.items())
+
+    async def listen_for_stage_results(self):
         self.running = True
 
-        response = esp_now.get_message()
-        if not self.running:
-            return
-        self.timer_screen.first_timer_running = False
-        if response and response.isdigit():
-            self.timer_screen.first_timer = int(response) - self.paused_time
-
-        response = esp_now.get_message()
-        if not self.running:
-            return
-        self.timer_screen.second_timer_running = False
-        if response and response.isdigit():
-            self.timer_screen.second_timer = int(response) - self.paused_time
+        while not self.finished():
+            event = await esp_rpc.anext_event()
+            if not self.running:
+                return
+            mac = esp_rpc.event_peer(event)
+            if mac not in self.results or mac in self.errors:
+                continue
+            if protocol.opcode(event) == protocol.ERROR:
+                await self.end_lane(mac, protocol.arg(event))
+                continue
+            if protocol.opcode(event) == protocol.SPLIT:
+                # el LCD no tiene lugar para los parciales: quedan en la consola
+                print(mac.hex(), 'secundario', protocol.arg(event), protocol.value(event), 'ms')
+                continue
+            stage = protocol.arg(event)
+            if protocol.opcode(event) != protocol.STAGE or stage not in (1, 2):
+                continue
+            self.results[mac][stage - 1] = protocol.value(event)
+            if stage == 2:
+                esp_now.peers[mac].state = 'finished'
+
+            if mac != self.shown_lane:
+                print(mac.hex(), self.results[mac])
+            elif stage == 1:
+                self.timer_screen.finish_first(protocol.value(event))
+            else:
+                self.timer_screen.finish_second(protocol.value(event))
+
+    async def end_lane(self, mac: bytes, code: int):
+        """
+        Termina el carril de un master que informó un error (p. ej.
+        ERR_NO_SECONDARY): muestra el código y detiene al master.
+        """
+        print(mac.hex(), 'error', code)
+        self.errors[mac] = code
+        esp_now.peers[mac].state = None
+        if mac == self.shown_lane:
+            self.timer_screen.fail(code)
+        await esp_now.asend_frame(protocol.STOP, peer=mac)
 
     def start(self):
-        Thread(target=self.listen_for_stage_results).start()
+        self.task = runtime.spawn(self.listen_for_stage_results())
+
+    def stop(self):
+        self.running = False
+        runtime.cancel(self.task)
+
+    async def join(self):
+        await runtime.join(self.task)
 
-    def join(self):
-        if self.thread and self.thread.is_alive():
-            self.thread.join()
+
+async def listen_run_buttons(timer_screen: 'LcdTimer', listener: EspNowListenStages):
+    while True:
+        button_input = await get_input(0)
+        if button_input == 1:
+            timer_screen.toggle_big_digits()
+        if button_input == 2:
+            if timer_screen.paused:
+                timer_screen.resume()
+            else:
+                timer_screen.pause()
+        if button_input == 3:
+            for mac in listener.lanes:
+                await esp_now.asend_frame(protocol.STOP, peer=mac)
+                esp_now.peers[mac].state = None
+            timer_screen.finish_first()
+            timer_screen.finish_second()
+            listener.stop()
+            return
 
 
-def measure():
-    distance: int = get_distance() if not overwrite_distance else overwrite_distance
+async def measure():
+    distance: int = await get_distance() if not overwrite_distance else overwrite_distance
     distance = max(1, min(distance, 99))
 
-    esp_now.send_message('start')
-    response = esp_now.get_message()
-    if not response == 'ok':
+    esp_rpc.clear_events()
+    # Un único START difundido arranca a la vez todos los carriles registrados
+    replies = await esp_rpc.broadcast(protocol.START, timeout_ms=RESPONSE_MAX_WAIT_TIME * 1000)
+    lanes = [mac for mac, response in replies.items() if protocol.opcode(response) == protocol.OK]
+    if not lanes:
         return
 
-    timer_screen = LcdTimer(lcd)
+    timer_screen = LcdTimer(screen)
     timer_screen.distance = str(distance)
+    timer_screen.start()
 
-    listener = EspNowListenStages(timer_screen)
+    listener = EspNowListenStages(timer_screen, lanes)
     listener.start()
+    buttons_task = runtime.spawn(listen_run_buttons(timer_screen, listener))
 
-    init_paused: int = 0
-    paused_time: int = 0
-    running: bool = True
-    while listener.thread.is_alive():
-        button_input = get_input(0, 1)
-        if button_input == 2:
-            timer_screen.first_timer_running = not running
-            timer_screen.second_timer_running = not running
-            running = not running
-            if running:
-                paused_time = paused_time + time.time() - init_paused if init_paused else 0
-            init_paused = int(time.time() // 1)
-        if button_input == 3:
-            esp_now.send_message('stop')
-            timer_screen.first_timer_running = False
-            timer_screen.second_timer_running = False
-            break
+    await listener.join()
+    runtime.cancel(buttons_task)
 
-    get_input(2, 3)
+    await get_input(2, 3)
     timer_screen.stop()
 
 
-def config():
+async def config():
     global overwrite_distance
-    time.sleep(0.2)
-    lcd.clear()
-
-    lcd.move(0, 0)
-    lcd.write('Distance')
+    screen.show(*CONFIG_SCREEN.render())
 
-    lcd.move(0, 1)
-    lcd.write(separate_text('select', 'up', 'down'))
-
-    button_input = get_input()
+    button_input = await get_input()
 
     if button_input == 0:
         return
 
     if button_input == 1:
         print('ice cream yummy')
-        overwrite_distance = distance_config_menu.start()
+        overwrite_distance = await distance_config_menu.start()
 
     if button_input == 2:
-        config()
+        await config()
 
     if button_input == 3:
-        config()
+        await config()
 
 
-def get_distance():
-    esp_now.send_message('distance')
+async def get_distance():
     print('nose')
-
-    response = esp_now.get_message()
+    response = await esp_rpc.request(protocol.DISTANCE_REQUEST, timeout_ms=RESPONSE_MAX_WAIT_TIME * 1000)
     print('pito')
-    distance = int(response) if response and response.isdigit() else 1
+    # La distancia llega en centímetros; 0 significa que no se pudo medir
+    distance = protocol.value(response) // 100 if response and protocol.opcode(response) == protocol.DISTANCE else 1
 
     distance = max(1, min(distance, 99))
     return distance
 
 
 class DistanceConfigMenu:
-    def __init__(self, lcd_i2c: 'i2c_lcd.LCD'):
-        self.lcd = lcd_i2c
+    def __init__(self, screen_lcd: 'display_server.DisplayServer'):
+        self.lcd = screen_lcd
 
         self.selected_type = 0
 
         self.distance: int = 1
         self.manual_distance: int = self.distance
 
-    def start(self):
-        self.distance = get_distance()
-        self.auto()
+    async def start(self):
+        self.distance = await get_distance()
+        await self.auto()
         if self.selected_type == 1:
             return self.manual_distance
 
-    def auto(self):
-        self.lcd.clear()
-
-        self.lcd.move(0, 0)
-        self.lcd.write(separate_text(f'auto: {self.distance}', '*' if self.selected_type == 0 else ''))
-        self.lcd.move(0, 1)
-        self.lcd.write(separate_text('Select', 'up', 'down'))
+    async def auto(self):
+        self.lcd.show(*AUTO_SCREEN.render(
+            distance=self.distance,
+            selected='*' if self.selected_type == 0 else None,
+        ))
 
-        button_input = get_input(1 if not self.selected_type == 0 else None)
+        button_input = await get_input(1 if not self.selected_type == 0 else None)
 
         # if button_input == 1  End the config Menu
 
@@ -193,22 +242,17 @@ class DistanceConfigMenu:
             self.selected_type = 0
 
         if button_input == 2:
-            new_distance = get_distance()
+            new_distance = await get_distance()
             if new_distance is not None and new_distance != 1:
                 self.distance = new_distance
 
         if button_input == 3:
-            self.manual()
+            await self.manual()
 
-    def manual(self):
-        self.lcd.clear()
+    async def manual(self):
+        self.lcd.show(*MANUAL_SCREEN.render(selected='*' if self.selected_type == 1 else None))
 
-        self.lcd.move(0, 0)
-        self.lcd.write(separate_text('manual', '*' if self.selected_type == 1 else ''))
-        self.lcd.move(0, 1)
-        self.lcd.write(separate_text('Select', 'Edit', '↑'))
-
-        button_input = get_input(1 if not self.selected_type == 1 else None)
+        button_input = await get_input(1 if not self.selected_type == 1 else None)
 
         if button_input == 0:
             return
@@ -217,23 +261,19 @@ class DistanceConfigMenu:
             self.selected_type = 1
 
         if button_input == 2:
-            self.meter_select()
+            await self.meter_select()
 
         if button_input == 3:
-            self.auto()
+            await self.auto()
 
-    def meter_select(self):
+    async def meter_select(self):
         meters = self.manual_distance
         while True:
             meters = max(1, min(meters, 99))
 
-            self.lcd.clear()
-            self.lcd.move(0, 0)
-            self.lcd.write(f'Meters:{meters}')
-            self.lcd.move(0, 1)
-            self.lcd.write(separate_text('Apply', '+', '-'))
+            self.lcd.show(*METERS_SCREEN.render(meters=meters))
 
-            button_input = get_input()
+            button_input = await get_input()
 
             if button_input == 0:
                 return
@@ -250,55 +290,152 @@ class DistanceConfigMenu:
 
 
 class LcdTimer:
-    def __init__(self, lcd_i2c: 'i2c_lcd.LCD'):
-        self.lcd = lcd_i2c
+    MAX_MS = (99 * 60 + 59) * 1000 + 900
+
+    def __init__(self, screen_lcd: 'display_server.DisplayServer'):
+        self.lcd = screen_lcd
         self.first_timer = 0
         self.second_timer = 0
         self.running = False
         self.first_timer_running = False
         self.second_timer_running = False
+        self.paused = False
+        self.paused_ms = 0
         self.speed = "--"
         self.distance = "--"
+        self.error: int | None = None
+        self.big_digits = False
+        self._start_tick = 0
+        self._pause_tick = 0
+        self.scheduler = refresh_scheduler.RefreshScheduler(screen_lcd)
 
     def start(self):
         if not self.running:
             self.running = True
-            Thread(target=self._update_display).start()
+            self.first_timer_running = True
+            self.second_timer_running = True
+            self.paused = False
+            self.paused_ms = 0
+            self._start_tick = ticks_ms()
+            self.scheduler.set_mode(refresh_scheduler.FAST)
+            runtime.spawn(self._update_display())
         return self
 
     def stop(self):
         self.running = False
+        self.scheduler.close()
         return self
 
-    def _update_display(self):
-        self.first_timer_running = True
-        self.second_timer_running = True
+    def pause(self):
+        if not self.paused:
+            self._pause_tick = ticks_ms()
+            self.paused = True
+            self._changed()
+
+    def resume(self):
+        if self.paused:
+            self.paused_ms += ticks_diff(ticks_ms(), self._pause_tick)
+            self.paused = False
+            self._changed()
+
+    def toggle_big_digits(self):
+        self.big_digits = not self.big_digits
+        self._changed()
+
+    def total_paused_ms(self) -> int:
+        if self.paused:
+            return self.paused_ms + ticks_diff(ticks_ms(), self._pause_tick)
+        return self.paused_ms
+
+    def elapsed_ms(self) -> int:
+        return ticks_diff(ticks_ms(), self._start_tick) - self.total_paused_ms()
+
+    def finish_first(self, elapsed_ms: int | None = None):
+        """
+        Congela el primer cronómetro; elapsed_ms es el tiempo medido por el
+        cono (incluye las pausas, que se descuentan aquí).
+        """
+        if self.first_timer_running:
+            self.first_timer = self._finished_ms(elapsed_ms)
+            self.first_timer_running = False
+            self._changed()
+
+    def finish_second(self, elapsed_ms: int | None = None):
+        if self.second_timer_running:
+            self.second_timer = self._finished_ms(elapsed_ms)
+            self.second_timer_running = False
+            self._changed()
+
+    def fail(self, code: int):
+        """
+        Detiene ambos cronómetros y muestra el código de error en lugar de la velocidad.
+        """
+        self.error = code
+        self.big_digits = False
+        self.finish_first()
+        self.finish_second()
+        self._changed()
+
+    def _finished_ms(self, elapsed_ms: int | None) -> int:
+        if elapsed_ms is None:
+            return min(self.elapsed_ms(), self.MAX_MS)
+        return max(0, min(elapsed_ms - self.total_paused_ms(), self.MAX_MS))
+
+    def _changed(self):
+        """
+        Ajusta el ritmo de refresco al estado actual; set_mode despierta a
+        _update_display, que redibuja en el momento (una sola vez).
+        """
+        if not (self.first_timer_running or self.second_timer_running):
+            self.scheduler.set_mode(refresh_scheduler.STOPPED)
+        elif self.paused:
+            self.scheduler.set_mode(refresh_scheduler.IDLE)
+        else:
+            self.scheduler.set_mode(refresh_scheduler.FAST)
+
+    def refresh(self):
+        elapsed = min(self.elapsed_ms(), self.MAX_MS)
+        first_timer = elapsed if self.first_timer_running else self.first_timer
+        second_timer = elapsed if self.second_timer_running else self.second_timer
+
+        if self.big_digits:
+            shown_timer = first_timer if self.first_timer_running else second_timer
+            self.lcd.show(*big_digits.render(shown_timer // 1000), glyphs=big_digits.GLYPHS)
+        else:
+            first_time_str = self._format_time(first_timer)
+            second_time_str = self._format_time(second_timer)
+
+            label = f"ERR{self.error}" if self.error is not None else f"{self.speed}M/S"
+            self.lcd.show(
+                separate_text(label, f"T1{first_time_str}"),
+                separate_text(f"{self.distance}M", f"T2{second_time_str}"),
+            )
+
+    async def _update_display(self):
         while self.running:
-            if self.first_timer < 99 * 60 and self.first_timer_running:
-                self.first_timer += 1
-            if self.second_timer < 99 * 60 and self.first_timer_running:
-                self.second_timer += 1
+            self.refresh()
+            await self.scheduler.await_next()
 
-            first_time_str = self._format_time(self.first_timer)
-            second_time_str = self._format_time(self.second_timer)
+    @staticmethod
+    def _format_time(milliseconds: int) -> str:
+        seconds, tenths = divmod(milliseconds // 100, 10)
+        minutes, seconds = divmod(seconds, 60)
+        return f"{minutes:02}:{seconds:02}.{tenths}"
 
-            self.lcd.clear()
-            self.lcd.write(separate_text(f"{self.speed}M/S", f"T1{first_time_str}"))
-            self.lcd.move(0, 1)
-            self.lcd.write(separate_text(f"{self.distance}Meters", f"T2{second_time_str}"))
 
-            if self.first_timer >= 99 * 60:
-                self.first_timer = 99 * 60
-            if self.second_timer >= 99 * 60:
-                self.second_timer = 99 * 60
+async def app():
+    runtime.spawn(screen.serve())
+    esp_rpc.start()
+    print('conos:', [mac.hex() for mac in await esp_rpc.discover()])
 
-            time.sleep(1)
+    await runtime.sleep_ms(2000)
+    welcome_message = random.choice(WELCOME_MESSAGES)
+    screen.show('  ' + welcome_message)
+    await runtime.sleep_ms(4000)
+    screen.clear()
 
-    @staticmethod
-    def _format_time(seconds: int) -> str:
-        minutes = seconds // 60
-        seconds = seconds % 60
-        return f"E{minutes:02}:{seconds:02}"
+    while True:
+        await home()
 
 
 if __name__ == '__main__':
@@ -308,6 +445,7 @@ if __name__ == '__main__':
         2: Pin(27, Pin.IN, Pin.PULL_UP),  # pause_button
         3: Pin(26, Pin.IN, Pin.PULL_UP),  # stop_button
     }
+    button_queue = ButtonQueue(buttons)
     # Mensajes de bienvenida
     WELCOME_MESSAGES = ("Bienvenido", 'HOLAAA!!')
 
@@ -315,25 +453,18 @@ if __name__ == '__main__':
     MASTER_MAC_ADDRESS = 'A0:B7:65:0F:6C:48'
     peer_mac = bytes([int(x, 16) for x in MASTER_MAC_ADDRESS.split(':')])
 
-    esp_now = esp_now_manager.ESPNow(peer_mac)
+    esp_now = esp_now_manager.ESPNow(peer_mac, reliable=True)
+    esp_rpc = rpc.RpcClient(esp_now)  # pedidos al master con su respuesta correlacionada
 
     # Configuración del módulo I2C para la pantalla LCD 2x16
     i2c = I2C(0, scl=Pin(23), sda=Pin(22), freq=400000)
     LCD_DIMENSIONS = (2, 16)  # Dimensiones de la pantalla LCD
     lcd = i2c_lcd.init_lcd(23, 22)
+    screen = display_server.DisplayServer(shadow_lcd.ShadowLcd(lcd, *LCD_DIMENSIONS))
 
     # Parámetros de distancia y tiempo de espera
     overwrite_distance: int | None = None
     RESPONSE_MAX_WAIT_TIME: int = 5
 
-    time.sleep(2)
-    distance_config_menu = DistanceConfigMenu(lcd)
-    welcome_message = random.choice(WELCOME_MESSAGES)
-    lcd.move(2, 0)
-    lcd.write(welcome_message)
-    time.sleep(4)
-    lcd.clear()
-
-    while True:
-        time.sleep(0.1)
-        home()
+    distance_config_menu = DistanceConfigMenu(screen)
+    runtime.run(app())
@@ -1,119 +1,200 @@
-import time
-from threading import Thread
-
 import esp_now_manager
+import nrf_network
+import protocol
+import runtime
 import wifi_manager
 from sensor import UltrasonicSensor
+from ticks import ticks_ms, ticks_diff, ticks_add
 
-sensor = UltrasonicSensor(26, 14)
-wifi = wifi_manager.Wifi(send_address=b"1NODE", receive_address=b"2NODE")  # Diceccion de recepcion y emision
+SECONDARY_NODES = (1,)  # secundarios de la red NRF (1-5), ver nrf_network
+# Plazo desde la salida para que los secundarios informen el paso (END)
+SECONDARY_TIMEOUT_MS = 120000
 cono_mac = '34:5F:45:A9:4C:CC'
 peer_mac = bytes(int(x, 16) for x in cono_mac.split(':'))
-esp_now = esp_now_manager.ESPNow(peer_mac)  # Direccion mac del control
+# Periféricos; los crea setup() al arrancar
+sensor: UltrasonicSensor | None = None
+wifi: wifi_manager.Wifi | None = None
+network: nrf_network.Network | None = None
+esp_now: esp_now_manager.ESPNow | None = None
 running = False
-
-
-def esp_now_listener():
-    global running
+control_mac = peer_mac  # control que arrancó la medición; recibe los tiempos
+start_flag = runtime.Flag()
+run_task = None
+
+
+def setup():
+    """
+    Crea los periféricos del cono. Se llama al arrancar y no al importar,
+    así el módulo se puede importar en el host (ver espnow_bench).
+    """
+    global sensor, wifi, network, esp_now
+    sensor = UltrasonicSensor(26, 14)
+    wifi = wifi_manager.Wifi(
+        send_address=nrf_network.SECONDARY_ADDRESSES[0],
+        receive_address=nrf_network.MASTER_ADDRESSES[0],
+    )
+    network = nrf_network.Network(wifi, SECONDARY_NODES)
+    esp_now = esp_now_manager.ESPNow(peer_mac, reliable=True)  # Direccion mac del control
+
+
+async def answer_control(link: 'esp_now_manager.ESPNow', frame, measure_distance) -> int:
+    """
+    Responde una trama del control: HELLO a ANNOUNCE, OK a START y la
+    distancia a DISTANCE_REQUEST, siempre a quien preguntó y con su
+    identificador de pedido (ver rpc).
+
+    Args:
+        link: Enlace ESP-NOW por el que llegó la trama (frame_peer es quien la envió).
+        frame: Trama recibida.
+        measure_distance: Corrutina sin argumentos que retorna la distancia en centímetros.
+
+    Returns:
+        int: El opcode de la trama, para que quien llama actúe sobre START o STOP.
+    """
+    opcode = protocol.opcode(frame)
+    request_id = protocol.arg(frame)  # se devuelve en la respuesta (ver rpc)
+    control = link.add_peer(link.frame_peer).mac  # se responde a quien pregunta
+    if opcode == protocol.ANNOUNCE:
+        await link.asend_frame(protocol.HELLO, arg=request_id, peer=control)
+
+    if opcode == protocol.START:
+        await runtime.sleep_ms(200)
+        await link.asend_frame(protocol.OK, arg=request_id, peer=control)
+
+    if opcode == protocol.DISTANCE_REQUEST:
+        distance_cm = await measure_distance()
+        await link.asend_frame(protocol.DISTANCE, distance_cm, arg=request_id, peer=control)
+    return opcode
+
+
+async def measure_distance() -> int:
+    print('distance')
+    distance = None
+    # el OK del segundo cono llega dentro del ACK del pedido
+    response = await network.arequest_frame(SECONDARY_NODES[0], protocol.DISTANCE_REQUEST)
+    if response is not None and protocol.opcode(response) == protocol.OK:
+        print('got_response')
+        distance = await wifi.get_distance.transmitter()
+
+    print(distance)
+    # 0 cm si el segundo cono no esta encendido o no hubo respuesta
+    return protocol.clamp(distance * 100) if distance is not None else 0
+
+
+async def esp_now_listener():
+    global running, control_mac
     while True:
-        time.sleep(0.1)
-        response = esp_now.get_message()
-        if response == 'start':
-            time.sleep(0.2)
-            esp_now.send_message('ok')
-            running = True
-            break
-
-        if response == 'distance':
-            print('distance')
-            if not wifi.send_message('distance'):
-                esp_now.send_message("1")  # si el segundo cono no esta encendido mandar una distancia falsa
-
-            print('lisening')
-            response = listen_wifi_timeout(0.7)
-            if response != 'ok':
-                esp_now.send_message("1")
-            
-            print('got_response')
-            distance = wifi.get_distance.transmitter()
-
-            print(distance)
-            if distance is None:
-                esp_now.send_message("1")  # si no hubo respuesta mandar una distancia falsa
-
-            esp_now.send_message(str(distance))
+        frame = await esp_now.aget_frame()
+        opcode = await answer_control(esp_now, frame, measure_distance)
+        if opcode == protocol.DISTANCE_REQUEST:
             print('sended distance')
-        if response == 'stop':
-            running = False
-
-
-def listen_wifi_timeout(timeout: float) -> str:
-    response = None
-    wifi.listener.start_listening()
-    init_t = time.time()
-    while time.time() - init_t < timeout:
-        response = wifi.listener.response()
-    if response:
-        return response
 
+        if opcode == protocol.START:
+            control_mac = bytes(esp_now.frame_peer)
+            running = True
+            start_flag.set()
 
-def wait_for_sensor():
-    sensor_wait_thread = Thread(target=sensor.wait_for_detection)
-    sensor_wait_thread.start()
-    while sensor_wait_thread.is_alive():
-        if not running:
+        if opcode == protocol.STOP:
+            running = False
             sensor.stop()
+            runtime.cancel(run_task)
+
+
+async def wait_for_sensor():
+    await sensor.await_detection()
+
+
+async def wait_for_secondaries(nodes: list, init_time: int, timeout_ms: int) -> int | None:
+    """
+    Espera el END de los secundarios `nodes` y envía al control su tiempo
+    (SPLIT) a medida que llegan.
+
+    Args:
+        nodes: Números de los secundarios que confirmaron el START.
+        init_time: ticks_ms de la salida.
+        timeout_ms: Plazo desde la salida; los que no llegan a tiempo se omiten.
+
+    Returns:
+        int | None: ticks_ms de la última detección informada o None si no
+            llegó ningún END.
+    """
+    pending = list(nodes)
+    last_time = None
+    while pending:
+        remaining = timeout_ms - ticks_diff(ticks_ms(), init_time)
+        node = await network.anext(remaining) if remaining > 0 else None
+        if node is None:
+            print('secundarios sin END:', pending)
             break
-        time.sleep(0.1)
-    sensor_wait_thread.join()
-
-
-def main():
+        frame = node.pop()
+        if protocol.opcode(frame) != protocol.END or node.number not in pending:
+            continue
+        pending.remove(node.number)
+        # El valor del END son los milisegundos que el secundario tardó en
+        # enviarlo desde la detección (reintentos incluidos)
+        detected_ms = ticks_add(node.received_ms, -protocol.value(frame))
+        if last_time is None or ticks_diff(detected_ms, last_time) > 0:
+            last_time = detected_ms
+        await esp_now.asend_frame(protocol.SPLIT, ticks_diff(detected_ms, init_time), arg=node.number, peer=control_mac)
+    return last_time
+
+
+async def main():
     while not running:
-        time.sleep(0.1)
+        await start_flag.wait()
 
-    wait_for_sensor()
-
-    wifi.send_message('start')
-    response = listen_wifi_timeout(0.7)
-    if response != 'ok' and running:
-        esp_now.send_message("1")  # si no esta encendido el segundo cono, mandar un dato falso al control
+    await wait_for_sensor()
 
+    network.clear()
+    started = await network.arequest_all(protocol.START)
     if not running:
         return
+    if not started:
+        # sin secundarios no hay etapa 1: el control termina el carril
+        await esp_now.asend_frame(protocol.ERROR, arg=protocol.ERR_NO_SECONDARY, peer=control_mac)
+        return
+    if len(started) < len(network.nodes):
+        # la medición sigue con los que respondieron
+        print('secundarios sin respuesta:', [number for number in network.nodes if number not in started])
 
-    stages_init_time: float = time.time()
-    wifi.listener.start_listening()
-    while True:
-        if wifi.listener.response():
-            break
-
-        time.sleep(0.1)
-
-    stage_one_end_time = time.time()
+    stages_init_time = ticks_ms()
+    # la etapa 1 termina cuando pasó por todos los secundarios que arrancaron
+    stage_one_end_time = await wait_for_secondaries(started, stages_init_time, SECONDARY_TIMEOUT_MS)
     if not running:
         return
-    esp_now.send_message(str((stages_init_time - stage_one_end_time) // 1))  # mandar el tiempo de la etapa 1
+    if stage_one_end_time is None:
+        await esp_now.asend_frame(protocol.ERROR, arg=protocol.ERR_NO_SECONDARY, peer=control_mac)
+        return
+    # mandar el tiempo de la etapa 1 en milisegundos
+    await esp_now.asend_frame(protocol.STAGE, ticks_diff(stage_one_end_time, stages_init_time), arg=1, peer=control_mac)
 
     if not running:
         return
 
-    wait_for_sensor()
-    second_stage_end_time = time.time()
+    await wait_for_sensor()
+    second_stage_end_time = ticks_ms()
 
     if not running:
         return
 
-    esp_now.send_message(str((stages_init_time - second_stage_end_time) // 1))
+    await esp_now.asend_frame(protocol.STAGE, ticks_diff(second_stage_end_time, stages_init_time), arg=2, peer=control_mac)
 
 
-if __name__ == "__main__":
-    listener_thread = Thread(target=esp_now_listener)
-    listener_thread.start()
+async def app():
+    global running, run_task
+    runtime.spawn(esp_now_listener())
+    network.start()
     while True:
+        run_task = runtime.spawn(main())
         try:
-            main()
+            await runtime.join(run_task)
         finally:
-            wifi.send_message('stop')
+            for number in network.nodes:
+                network.send_frame(number, protocol.STOP)
             running = False
             wifi.listener.stop()
+
+
+if __name__ == "__main__":
+    setup()
+    runtime.run(app())
@@ -0,0 +1,494 @@
+"""
+Hilos para MicroPython con la API de threading de CPython (Thread, Lock,
+Condition, Event, Queue) sobre _thread, más un grupo de hilos reutilizables.
+
+Tiene otro nombre para no tapar al threading de la biblioteca estándar: en el
+host se importa igual que en la placa y corre sobre el _thread de CPython, así
+que lo que se prueba fuera de la placa es el mismo código.
+"""
+import _thread
+import sys
+
+try:
+    from time import sleep_ms as _sleep_ms
+except ImportError:
+    from time import sleep as _sleep
+
+    def _sleep_ms(milliseconds):
+        _sleep(milliseconds / 1000)
+
+try:
+    from time import ticks_ms as _ticks_ms, ticks_diff as _ticks_diff
+except ImportError:
+    from time import monotonic as _monotonic
+
+    def _ticks_ms():
+        return int(_monotonic() * 1000)
+
+    def _ticks_diff(end, start):
+        return end - start
+
+try:
+    from sys import print_exception as _print_exception
+except ImportError:
+    from traceback import print_exception as _print_traceback
+
+    def _print_exception(e):
+        _print_traceback(type(e), e, e.__traceback__)
+
+
+# El _thread de MicroPython acepta el plazo de acquire pero lo ignora y espera
+# indefinidamente: ahí el plazo se cumple reintentando sin bloquear
+_TIMED_ACQUIRE = sys.implementation.name != 'micropython'
+
+
+def _acquire(lock, timeout=None):
+    """
+    Adquiere un lock con tiempo máximo de espera en segundos. Sin
+    _TIMED_ACQUIRE se reintenta sin bloquear cada milisegundo.
+    """
+    if timeout is None:
+        return lock.acquire()
+    if _TIMED_ACQUIRE:
+        return lock.acquire(1, max(0, timeout))
+    start = _ticks_ms()
+    while not lock.acquire(0):
+        if _ticks_diff(_ticks_ms(), start) >= timeout * 1000:
+            return False
+        _sleep_ms(1)
+    return True
+
+
+# Registro de hilos vivos, para diagnosticar un cono desde el REPL
+_registry_lock = _thread.allocate_lock()
+_stack_lock = _thread.allocate_lock()
+_active = []
+_created = 0
+
+
+class Thread:
+    def __init__(self, target=None, args=(), name=None, daemon=False, stack_size=None):
+        """
+        Simula una clase Thread básica.
+        :param target: La función que se ejecutará en el hilo.
+        :param args: Los argumentos para la función target.
+        :param name: Nombre para identificar el hilo en enumerate().
+        :param daemon: Si es True, _shutdown() no espera a este hilo.
+        :param stack_size: Tamaño de la pila en bytes (None usa el valor global).
+        """
+        global _created
+        _created += 1
+        self.target = target
+        self.args = args
+        self.name = name or "Thread-%d" % _created
+        self.daemon = daemon
+        self.stack_size = stack_size
+        self.ident = None
+        self.started_ms = None
+        self.finished_ms = None
+        self.exceptions = 0
+        self._started = False
+        self._is_alive = False
+        self._done = _thread.allocate_lock()  # Bloqueo para simular join()
+        self._done.acquire()
+
+    def start(self):
+        """
+        Inicia el hilo y ejecuta la función target.
+        """
+        if not self.target:
+            raise ValueError("No se especificó una función target para ejecutar.")
+        if self._started:
+            raise RuntimeError("El hilo ya fue iniciado.")
+
+        self._started = True
+        self._is_alive = True
+        self.started_ms = _ticks_ms()
+        with _registry_lock:
+            _active.append(self)
+
+        if self.stack_size is None:
+            _thread.start_new_thread(self._run, ())
+            return
+        # _thread.stack_size es global: se cambia solo mientras se crea este hilo
+        with _stack_lock:
+            previous = _thread.stack_size(self.stack_size)
+            try:
+                _thread.start_new_thread(self._run, ())
+            finally:
+                _thread.stack_size(previous)
+
+    def _run(self):
+        self.ident = _thread.get_ident()
+        try:
+            self.target(*self.args)
+        except Exception as e:
+            self.exceptions += 1
+            _print_exception(e)
+        finally:
+            self.finished_ms = _ticks_ms()
+            self._is_alive = False
+            with _registry_lock:
+                _active.remove(self)
+            self._done.release()  # Liberar el bloqueo al finalizar el hilo
+
+    def join(self, timeout=None):
+        """
+        Espera a que el hilo termine.
+        :param timeout: Tiempo máximo de espera en segundos (None espera indefinidamente).
+        :return: True si el hilo terminó.
+        """
+        if not _acquire(self._done, timeout):
+            return False
+        self._done.release()
+        return True
+
+    def is_alive(self):
+        """
+        Retorna True si el hilo sigue activo, False de lo contrario.
+        """
+        return self._is_alive
+
+    def run_ms(self):
+        """
+        Retorna los milisegundos que lleva (o llevó) corriendo el hilo.
+        """
+        if self.started_ms is None:
+            return 0
+        end = self.finished_ms if self.finished_ms is not None else _ticks_ms()
+        return _ticks_diff(end, self.started_ms)
+
+    def __repr__(self):
+        return "<Thread %s %s %d ms, %d excepciones>" % (
+            self.name, "vivo" if self._is_alive else "terminado", self.run_ms(), self.exceptions)
+
+
+def enumerate():
+    """
+    Retorna la lista de hilos vivos creados con Thread.
+    """
+    with _registry_lock:
+        return list(_active)
+
+
+def active_count():
+    """
+    Retorna la cantidad de hilos vivos creados con Thread.
+    """
+    return len(_active)
+
+
+def current_thread():
+    """
+    Retorna el Thread que ejecuta la llamada, o None si no fue creado con Thread
+    (por ejemplo, el hilo principal).
+    """
+    ident = _thread.get_ident()
+    for thread in enumerate():
+        if thread.ident == ident:
+            return thread
+    return None
+
+
+def stack_size(size=None):
+    """
+    Consulta o cambia el tamaño de pila de los hilos que se creen después.
+    :param size: Tamaño en bytes; None solo consulta.
+    :return: El tamaño anterior.
+    """
+    if size is None:
+        return _thread.stack_size()
+    with _stack_lock:
+        return _thread.stack_size(size)
+
+
+def _shutdown():
+    """
+    Espera a los hilos que no son daemon; se puede llamar al final de main.
+    """
+    for thread in enumerate():
+        if not thread.daemon and thread.ident != _thread.get_ident():
+            thread.join()
+
+
+class Lock:
+    def __init__(self):
+        """
+        Lock con timeout sobre _thread.allocate_lock.
+        """
+        self._lock = _thread.allocate_lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        """
+        :param blocking: Si es False retorna enseguida.
+        :param timeout: Tiempo máximo de espera en segundos (-1 espera indefinidamente).
+        :return: True si se adquirió el lock.
+        """
+        if not blocking:
+            return self._lock.acquire(0)
+        return _acquire(self._lock, None if timeout < 0 else timeout)
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Condition:
+    def __init__(self, lock=None):
+        """
+        Variable de condición: cada hilo que espera bloquea su propio lock y
+        notify() lo libera, así el que espera despierta enseguida.
+        :param lock: Lock asociado (se crea uno si no se indica).
+        """
+        self._lock = lock or Lock()
+        self._waiters = []
+
+    def acquire(self, *args):
+        return self._lock.acquire(*args)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+    def wait(self, timeout=None):
+        """
+        Libera el lock y espera una notificación; debe llamarse con el lock tomado.
+        :param timeout: Tiempo máximo de espera en segundos (None espera indefinidamente).
+        :return: True si hubo notificación, False si venció el plazo.
+        """
+        waiter = _thread.allocate_lock()
+        waiter.acquire()
+        self._waiters.append(waiter)
+        self._lock.release()
+        try:
+            notified = _acquire(waiter, timeout)
+        finally:
+            self._lock.acquire()
+        if not notified and waiter in self._waiters:
+            self._waiters.remove(waiter)
+        return notified
+
+    def wait_for(self, predicate, timeout=None):
+        """
+        Espera hasta que predicate() sea verdadero.
+        :return: El último valor de predicate().
+        """
+        start = _ticks_ms()
+        result = predicate()
+        while not result:
+            remaining = None
+            if timeout is not None:
+                remaining = timeout - _ticks_diff(_ticks_ms(), start) / 1000
+                if remaining <= 0:
+                    break
+            self.wait(remaining)
+            result = predicate()
+        return result
+
+    def notify(self, n=1):
+        """
+        Despierta hasta n hilos en espera; debe llamarse con el lock tomado.
+        """
+        while self._waiters and n > 0:
+            self._waiters.pop(0).release()
+            n -= 1
+
+    def notify_all(self):
+        self.notify(len(self._waiters))
+
+
+class Event:
+    def __init__(self):
+        """
+        Bandera que los hilos pueden esperar hasta que otro la active.
+        """
+        self._cond = Condition()
+        self._flag = False
+
+    def is_set(self):
+        return self._flag
+
+    def set(self):
+        with self._cond:
+            self._flag = True
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._flag = False
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: Tiempo máximo de espera en segundos (None espera indefinidamente).
+        :return: True si la bandera está activa, False si venció el plazo.
+        """
+        with self._cond:
+            if not self._flag:
+                self._cond.wait(timeout)
+            return self._flag
+
+
+class Empty(Exception):
+    pass
+
+
+class Full(Exception):
+    pass
+
+
+class Queue:
+    def __init__(self, maxsize=0):
+        """
+        Cola FIFO para pasar datos entre hilos.
+        :param maxsize: Capacidad máxima (0 sin límite).
+        """
+        self.maxsize = maxsize
+        self._items = []
+        self._mutex = Lock()
+        self._not_empty = Condition(self._mutex)
+        self._not_full = Condition(self._mutex)
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def full(self):
+        return 0 < self.maxsize <= len(self._items)
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Agrega un elemento; si la cola está llena espera lugar.
+        :raises Full: Si no hubo lugar (sin bloquear o al vencer el plazo).
+        """
+        with self._not_full:
+            if self.full():
+                if not block or not self._not_full.wait_for(lambda: not self.full(), timeout):
+                    raise Full
+            self._items.append(item)
+            self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        """
+        Retira el elemento más antiguo; si la cola está vacía espera uno.
+        :raises Empty: Si no hubo elementos (sin bloquear o al vencer el plazo).
+        """
+        with self._not_empty:
+            if not self._items:
+                if not block or not self._not_empty.wait_for(lambda: self._items, timeout):
+                    raise Empty
+            item = self._items.pop(0)
+            self._not_full.notify()
+            return item
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def get_nowait(self):
+        return self.get(False)
+
+
+class Future:
+    def __init__(self):
+        """
+        Resultado de una tarea enviada a un ThreadPool.
+        """
+        self._done = Event()
+        self._result = None
+        self._exception = None
+
+    def _set(self, result=None, exception=None):
+        self._result = result
+        self._exception = exception
+        self._done.set()
+
+    def done(self):
+        """
+        Retorna True si la tarea ya terminó.
+        """
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Espera el resultado de la tarea.
+        :param timeout: Tiempo máximo de espera en segundos (None espera indefinidamente).
+        :return: El valor retornado por la tarea; relanza su excepción si falló.
+        """
+        if not self._done.wait(timeout):
+            raise OSError("Tiempo de espera agotado")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class ThreadPool:
+    def __init__(self, workers=2, queue_size=8, stack_size=None, name="pool"):
+        """
+        Grupo fijo de hilos que ejecutan tareas de una cola, para no crear un
+        hilo nuevo (con su propia pila) en cada uso.
+        :param workers: Cantidad de hilos.
+        :param queue_size: Tareas que pueden esperar en cola.
+        :param stack_size: Tamaño de la pila de cada hilo en bytes.
+        :param name: Prefijo del nombre de los hilos.
+        """
+        self.workers = workers
+        self._tasks = Queue(queue_size)
+        self._running = True
+        for index in range(workers):
+            Thread(target=self._worker, name="%s-%d" % (name, index),
+                   daemon=True, stack_size=stack_size).start()
+
+    def submit(self, target, *args):
+        """
+        Encola una tarea.
+        :param target: La función a ejecutar.
+        :param args: Los argumentos para la función.
+        :return: Future con el resultado.
+        """
+        if not self._running:
+            raise RuntimeError("El grupo de hilos está detenido.")
+        future = Future()
+        try:
+            self._tasks.put_nowait((future, target, args))
+        except Full:
+            raise RuntimeError("La cola del grupo de hilos está llena.")
+        return future
+
+    def shutdown(self):
+        """
+        Detiene los hilos cuando terminen la tarea en curso; las tareas en
+        cola se ejecutan antes.
+        """
+        self._running = False
+        for _ in range(self.workers):
+            self._tasks.put(None)
+
+    def _worker(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            future, target, args = task
+            try:
+                future._set(target(*args))
+            except Exception as e:
+                worker = current_thread()
+                if worker is not None:
+                    worker.exceptions += 1
+                future._set(exception=e)
@@ -1,8 +1,15 @@
 """NRF24L01 driver for MicroPython
 """
 
-from micropython import const
-import utime
+try:
+    from micropython import const
+    import utime
+except ImportError:
+    # CPython on the host, driving nrf_emulator
+    import ticks as utime
+
+    def const(value):
+        return value
 
 # nRF24L01+ registers
 CONFIG = const(0x00)
@@ -17,6 +24,7 @@ TX_ADDR = const(0x10)
 RX_PW_P0 = const(0x11)
 FIFO_STATUS = const(0x17)
 DYNPD = const(0x1C)
+FEATURE = const(0x1D)
 
 # CONFIG register
 EN_CRC = const(0x08)  # enable CRC
@@ -38,6 +46,10 @@ RX_DR = const(0x40)  # RX data ready; write 1 to clear
 TX_DS = const(0x20)  # TX data sent; write 1 to clear
 MAX_RT = const(0x10)  # max retransmits reached; write 1 to clear
 
+# FEATURE register
+EN_DPL = const(0x04)  # enable dynamic payload length
+EN_ACK_PAY = const(0x02)  # enable payload with ACK
+
 # FIFO_STATUS register
 RX_EMPTY = const(0x01)  # 1 if RX FIFO is empty
 
@@ -45,6 +57,8 @@ RX_EMPTY = const(0x01)  # 1 if RX FIFO is empty
 R_RX_PL_WID = const(0x60)  # read RX payload width
 R_RX_PAYLOAD = const(0x61)  # read RX payload
 W_TX_PAYLOAD = const(0xA0)  # write TX payload
+W_ACK_PAYLOAD = const(0xA8)  # write ACK payload; OR with the pipe number
+ACTIVATE = const(0x50)  # followed by 0x73 unlocks FEATURE on non-plus parts
 FLUSH_TX = const(0xE1)  # flush TX FIFO
 FLUSH_RX = const(0xE2)  # flush RX FIFO
 NOP = const(0xFF)  # use to read STATUS register
@@ -72,6 +86,25 @@ class NRF24L01:
 
         self.payload_size = payload_size
         self.pipe0_read_addr = None
+        # addresses currently programmed in RX_ADDR_P0 and TX_ADDR
+        self.rx_addr_p0 = None
+        self.tx_addr = None
+        # pipe (RX_P_NO) of the last payload returned by recv/recv_into
+        self.rx_pipe = None
+        self.dynamic_payloads = False
+        # memoryview prefixes of receive buffers, see _prefixes
+        self._rx_views = {}
+        # IRQ-driven receive, see irq_init
+        self.irq = None
+        # streaming TX, see stream_start
+        self._stream_slots = None
+        self.stream_handler = None
+
+        # static zero padding, pre-sliced for every short length so that
+        # send_start never allocates
+        self.pad = bytearray(payload_size)
+        pad = memoryview(self.pad)
+        self._pads = [pad[:n] for n in range(payload_size + 1)]
         utime.sleep_ms(5)
 
         # set address width to 5 bytes and check for device present
@@ -79,8 +112,16 @@ class NRF24L01:
         if self.reg_read(SETUP_AW) != 0b11:
             raise OSError("nRF24L01+ Hardware not responding")
 
+        # in-RAM copies of the registers this driver read-modify-writes, so
+        # that mode switches cost a single write of the bits that change
+        self.shadow = {}
+        for reg in (CONFIG, RF_SETUP, EN_RXADDR, FEATURE):
+            self.shadow[reg] = self.reg_read(reg)
+
         # disable dynamic payloads
         self.reg_write(DYNPD, 0)
+        self.shadow[DYNPD] = 0
+        self.reg_update(FEATURE, 0)
 
         # auto retransmit delay: 1750us
         # auto retransmit count: 8
@@ -132,6 +173,21 @@ class NRF24L01:
         self.cs(1)
         return ret
 
+    # write a shadowed register only if the value changes; returns True if written
+    def reg_update(self, reg, value):
+        if self.shadow[reg] == value:
+            return False
+        self.reg_write(reg, value)
+        self.shadow[reg] = value
+        return True
+
+    # read STATUS with a single-byte NOP command
+    def status(self):
+        self.cs(0)
+        self.spi.readinto(self.buf, NOP)
+        self.cs(1)
+        return self.buf[0]
+
     def flush_rx(self):
         self.cs(0)
         self.spi.readinto(self.buf, FLUSH_RX)
@@ -144,28 +200,49 @@ class NRF24L01:
 
     # power is one of POWER_x defines; speed is one of SPEED_x defines
     def set_power_speed(self, power, speed):
-        setup = self.reg_read(RF_SETUP) & 0b11010001
-        self.reg_write(RF_SETUP, setup | power | speed)
+        setup = self.shadow[RF_SETUP] & 0b11010001
+        self.reg_update(RF_SETUP, setup | power | speed)
 
     # length in bytes: 0, 1 or 2
     def set_crc(self, length):
-        config = self.reg_read(CONFIG) & ~(CRCO | EN_CRC)
+        config = self.shadow[CONFIG] & ~(CRCO | EN_CRC)
         if length == 0:
             pass
         elif length == 1:
             config |= EN_CRC
         else:
             config |= EN_CRC | CRCO
-        self.reg_write(CONFIG, config)
+        self.reg_update(CONFIG, config)
+
+    # dynamic payload length on every pipe; with ack_payloads a receiver can
+    # queue replies with write_ack_payload that ride on the hardware auto-ack
+    def set_dynamic_payloads(self, enabled, ack_payloads=False):
+        feature = 0
+        if enabled:
+            feature = EN_DPL | (EN_ACK_PAY if ack_payloads else 0)
+        if self.reg_update(FEATURE, feature) and self.reg_read(FEATURE) != feature:
+            # nRF24L01 (non-plus) parts ignore FEATURE until activated
+            self.cs(0)
+            self.spi.readinto(self.buf, ACTIVATE)
+            self.spi.readinto(self.buf, 0x73)
+            self.cs(1)
+            self.reg_write(FEATURE, feature)
+        self.reg_update(DYNPD, 0b111111 if enabled else 0)
+        self.dynamic_payloads = enabled
 
     def set_channel(self, channel):
         self.reg_write(RF_CH, min(channel, 125))
 
-    # address should be a bytes object 5 bytes long
+    # address should be a bytes object 5 bytes long; switching back and forth
+    # between peers only rewrites the registers when the address changes
     def open_tx_pipe(self, address):
         assert len(address) == 5
+        if address == self.tx_addr and address == self.rx_addr_p0:
+            return
         self.reg_write_bytes(RX_ADDR_P0, address)
+        self.rx_addr_p0 = address
         self.reg_write_bytes(TX_ADDR, address)
+        self.tx_addr = address
         self.reg_write(RX_PW_P0, self.payload_size)
 
     # address should be a bytes object 5 bytes long
@@ -178,20 +255,23 @@ class NRF24L01:
             self.pipe0_read_addr = address
         if pipe_id < 2:
             self.reg_write_bytes(RX_ADDR_P0 + pipe_id, address)
+            if pipe_id == 0:
+                self.rx_addr_p0 = address
         else:
             self.reg_write(RX_ADDR_P0 + pipe_id, address[0])
         self.reg_write(RX_PW_P0 + pipe_id, self.payload_size)
-        self.reg_write(EN_RXADDR, self.reg_read(EN_RXADDR) | (1 << pipe_id))
+        self.reg_update(EN_RXADDR, self.shadow[EN_RXADDR] | (1 << pipe_id))
 
     def start_listening(self):
-        self.reg_write(CONFIG, self.reg_read(CONFIG) | PWR_UP | PRIM_RX)
+        self.reg_update(CONFIG, self.shadow[CONFIG] | PWR_UP | PRIM_RX)
         self.reg_write(STATUS, RX_DR | TX_DS | MAX_RT)
 
-        if self.pipe0_read_addr is not None:
+        if self.pipe0_read_addr is not None and self.rx_addr_p0 != self.pipe0_read_addr:
             self.reg_write_bytes(RX_ADDR_P0, self.pipe0_read_addr)
+            self.rx_addr_p0 = self.pipe0_read_addr
         self.is_listening = True
 
-        self.flush_rx()
+        # unread payloads (in the RX FIFO or the IRQ ring) survive a TX turnaround
         self.flush_tx()
         self.ce(1)
         utime.sleep_us(130)
@@ -200,24 +280,163 @@ class NRF24L01:
         self.is_listening = False
         self.ce(0)
         self.flush_tx()
-        self.flush_rx()
+
+    # drive the radio from its IRQ line (active low) instead of polling it:
+    # each falling edge drains the RX FIFO into a ring of preallocated slots
+    # and records TX completion, so any/recv_into/send_done need no SPI;
+    # handler(nrf) is called after every IRQ, e.g. to wake a waiting task.
+    # All radio access must then happen from a single thread.
+    def irq_init(self, pin, slots=8, handler=None):
+        self._rx_slots = [bytearray(32) for _ in range(slots)]
+        self._rx_widths = bytearray(slots)
+        self._rx_pipes = bytearray(slots)
+        self._rx_written = 0
+        self._rx_read = 0
+        self.rx_dropped = 0
+        self._stage = bytearray(32)
+        stage = memoryview(self._stage)
+        self._stage_views = [stage[:n] for n in range(33)]
+        self._tx_result = None
+        self._irq_pending = False
+        self._irq_handler = handler
+        self.irq = pin
+        pin.irq(handler=self._on_irq, trigger=pin.IRQ_FALLING)
+        if not pin():
+            self._service()  # already asserted: no edge will come
+
+    def _on_irq(self, pin):
+        if not self.cs():
+            # the IRQ interrupted an SPI transaction; any() finishes the job
+            self._irq_pending = True
+        else:
+            self._service()
+        if self._irq_handler is not None:
+            self._irq_handler(self)
+
+    def _service(self):
+        self._irq_pending = False
+        # clear the flags before draining, so a payload arriving meanwhile
+        # raises a new edge (datasheet RX procedure)
+        status = self.reg_write(STATUS, RX_DR | TX_DS | MAX_RT)
+        if status & (TX_DS | MAX_RT) and not self.shadow[CONFIG] & PRIM_RX:
+            self._tx_result = 2 if status & MAX_RT else 1
+        slots = len(self._rx_slots)
+        while not self.reg_read(FIFO_STATUS) & RX_EMPTY:
+            if self._rx_written - self._rx_read >= slots:
+                self.rx_dropped += 1
+                self.flush_rx()
+                break
+            width = self.payload_width()
+            if width == 0:
+                continue
+            self.cs(0)
+            self.spi.readinto(self.buf, R_RX_PAYLOAD)
+            pipe = (self.buf[0] >> 1) & 0b111  # RX_P_NO of this payload
+            self.spi.readinto(self._stage_views[width])
+            self.cs(1)
+            index = self._rx_written % slots
+            self._rx_pipes[index] = pipe
+            slot = self._rx_slots[index]
+            stage = self._stage
+            for i in range(width):
+                slot[i] = stage[i]
+            self._rx_widths[index] = width
+            self._rx_written += 1
+
+    # payload from the IRQ ring into buf; returns its width (0 if none)
+    def _ring_pop(self, buf):
+        if self._irq_pending:
+            self._service()
+        if self._rx_read == self._rx_written:
+            return 0
+        index = self._rx_read % len(self._rx_slots)
+        slot = self._rx_slots[index]
+        width = min(self._rx_widths[index], len(buf))
+        for i in range(width):
+            buf[i] = slot[i]
+        self.rx_pipe = self._rx_pipes[index]
+        self._rx_read += 1
+        return width
 
     # returns True if any data available to recv
     def any(self):
+        if self.irq is not None:
+            if self._irq_pending:
+                self._service()
+            return self._rx_read != self._rx_written
         return not bool(self.reg_read(FIFO_STATUS) & RX_EMPTY)
 
+    # width of the payload at the head of the RX FIFO
+    def payload_width(self):
+        if not self.dynamic_payloads:
+            return self.payload_size
+        self.cs(0)
+        self.spi.readinto(self.buf, R_RX_PL_WID)
+        self.spi.readinto(self.buf)
+        self.cs(1)
+        width = self.buf[0]
+        if width > 32:
+            # corrupt width: the datasheet says to flush the RX FIFO
+            self.flush_rx()
+            return 0
+        return width
+
     def recv(self):
+        if self.irq is not None:
+            buf = bytearray(32)
+            return bytes(buf[:self._ring_pop(buf)])
+        width = self.payload_width()
         # get the data
         self.cs(0)
         self.spi.readinto(self.buf, R_RX_PAYLOAD)
-        buf = self.spi.read(self.payload_size)
+        self.rx_pipe = (self.buf[0] >> 1) & 0b111
+        buf = self.spi.read(width)
         self.cs(1)
         # clear RX ready flag
         self.reg_write(STATUS, RX_DR)
 
         return buf
 
-    # blocking wait for tx complete
+    # like recv, but reads the payload into a preallocated buffer of at least
+    # payload_size bytes (32 with dynamic payloads); returns the payload width
+    def recv_into(self, buf):
+        if self.irq is not None:
+            return self._ring_pop(buf)
+        width = self.payload_width()
+        if width == 0:
+            return 0
+        self.cs(0)
+        self.spi.readinto(self.buf, R_RX_PAYLOAD)
+        # the STATUS byte clocked out with the command names the source pipe
+        self.rx_pipe = (self.buf[0] >> 1) & 0b111
+        self.spi.readinto(self._prefixes(buf)[min(width, len(buf))])
+        self.cs(1)
+        # clear RX ready flag
+        self.reg_write(STATUS, RX_DR)
+
+        return width
+
+    # memoryview prefixes of every length of buf, built on first use so that
+    # reading a variable-width payload into the same buffer never allocates
+    def _prefixes(self, buf):
+        views = self._rx_views.get(id(buf))
+        if views is None:
+            if len(self._rx_views) >= 4:
+                self._rx_views.clear()
+            view = memoryview(buf)
+            views = [view[:n] for n in range(len(buf) + 1)]
+            self._rx_views[id(buf)] = views
+        return views
+
+    # queue a payload that is sent with the ACK of the next packet received on
+    # pipe_id; needs set_dynamic_payloads(True, ack_payloads=True)
+    def write_ack_payload(self, pipe_id, buf):
+        self.cs(0)
+        self.spi.readinto(self.buf, W_ACK_PAYLOAD | pipe_id)
+        self.spi.write(buf)
+        self.cs(1)
+
+    # blocking wait for tx complete; buf may be bytes, bytearray or memoryview
     def send(self, buf, timeout=500):
         self.send_start(buf)
         start = utime.ticks_ms()
@@ -229,28 +448,154 @@ class NRF24L01:
 
     # non-blocking tx
     def send_start(self, buf):
-        # power up
-        self.reg_write(CONFIG, (self.reg_read(CONFIG) | PWR_UP) & ~PRIM_RX)
-        utime.sleep_us(150)
+        if self.irq is not None:
+            self._tx_result = None
+        # power up; the settling delay is only needed if the mode changed
+        if self.reg_update(CONFIG, (self.shadow[CONFIG] | PWR_UP) & ~PRIM_RX):
+            utime.sleep_us(150)
         # send the data
+        self._write_payload(buf)
+
+        # enable the chip so it can send the data
+        self.ce(1)
+        utime.sleep_us(15)  # needs to be >10us
+        self.ce(0)
+
+    # Streaming TX: up to three payloads wait in the TX FIFO while the radio
+    # stays powered in TX mode, and each CE pulse sends exactly one of them,
+    # so every TX_DS/MAX_RT belongs to a known packet. stream_write queues a
+    # payload and returns its id; stream_poll (call it often, or after an
+    # IRQ) collects results and calls handler(packet_id, ok) for each one.
+    def stream_start(self, handler=None):
+        if self._stream_slots is None:
+            # copies of the queued payloads, to re-queue them after a failure
+            self._stream_slots = [bytearray(32) for _ in range(3)]
+            self._stream_lengths = bytearray(3)
+            self._stream_ids = [0, 0, 0]
+        self._stream_head = 0
+        self._stream_count = 0
+        self._stream_next_id = 0
+        self._stream_on_air = False
+        self.stream_handler = handler
+        self.stream_sent = 0
+        self.stream_failed = 0
+        self.is_listening = False
+        self.ce(0)
+        self.flush_tx()  # in RX mode it may hold ACK payloads
+        if self.irq is not None:
+            self._tx_result = None
+        self.reg_write(STATUS, TX_DS | MAX_RT)
+        if self.reg_update(CONFIG, (self.shadow[CONFIG] | PWR_UP) & ~PRIM_RX):
+            utime.sleep_us(150)
+
+    # queue a payload; returns its packet id, or -1 if the TX FIFO is full
+    def stream_write(self, buf):
+        if self._stream_count >= 3:
+            return -1
+        index = (self._stream_head + self._stream_count) % 3
+        slot = self._stream_slots[index]
+        length = len(buf)
+        for i in range(length):
+            slot[i] = buf[i]
+        self._stream_lengths[index] = length
+        packet_id = self._stream_next_id
+        self._stream_ids[index] = packet_id
+        self._stream_next_id += 1
+        self._stream_count += 1
+        self._write_payload(buf)
+        if not self._stream_on_air:
+            self._pulse()
+        return packet_id
+
+    # number of queued payloads without a result yet
+    def stream_pending(self):
+        return self._stream_count
+
+    # collect the result of the packet on the air, if it is finished; returns
+    # None while it is in progress, 1 for success, 2 for fail
+    def stream_poll(self):
+        if not self._stream_on_air:
+            return None
+        if self.irq is not None:
+            if self._irq_pending:
+                self._service()
+            result = self._tx_result
+            if result is None:
+                return None
+            self._tx_result = None
+        else:
+            status = self.status()
+            if not status & (TX_DS | MAX_RT):
+                return None
+            # RX_DR stays set for ACK payloads read with recv_into
+            self.reg_write(STATUS, TX_DS | MAX_RT)
+            result = 2 if status & MAX_RT else 1
+
+        self._stream_on_air = False
+        head = self._stream_head
+        packet_id = self._stream_ids[head]
+        self._stream_head = (head + 1) % 3
+        self._stream_count -= 1
+        if result == 1:
+            self.stream_sent += 1
+        else:
+            # the failed payload stays at the head of the FIFO: drop it and
+            # queue the ones behind it again
+            self.stream_failed += 1
+            self.flush_tx()
+            for n in range(self._stream_count):
+                index = (self._stream_head + n) % 3
+                self._write_payload(self._stream_slots[index][:self._stream_lengths[index]])
+        if self._stream_count:
+            self._pulse()
+        if self.stream_handler is not None:
+            self.stream_handler(packet_id, result == 1)
+        return result
+
+    # drop whatever is still queued (reported as failed) and power down
+    def stream_stop(self):
+        self.ce(0)
+        self.flush_tx()
+        while self._stream_count:
+            head = self._stream_head
+            self._stream_head = (head + 1) % 3
+            self._stream_count -= 1
+            self.stream_failed += 1
+            if self.stream_handler is not None:
+                self.stream_handler(self._stream_ids[head], False)
+        self._stream_on_air = False
+        self.reg_write(STATUS, TX_DS | MAX_RT)
+        self.reg_update(CONFIG, self.shadow[CONFIG] & ~PWR_UP)
+
+    def _write_payload(self, buf):
         self.cs(0)
         self.spi.readinto(self.buf, W_TX_PAYLOAD)
         self.spi.write(buf)
-        if len(buf) < self.payload_size:
-            self.spi.write(b"\x00" * (self.payload_size - len(buf)))  # pad out data
+        if len(buf) < self.payload_size and not self.dynamic_payloads:
+            self.spi.write(self._pads[self.payload_size - len(buf)])  # pad out data
         self.cs(1)
 
-        # enable the chip so it can send the data
+    # a CE pulse shorter than a packet sends just the head of the TX FIFO
+    def _pulse(self):
+        self._stream_on_air = True
         self.ce(1)
         utime.sleep_us(15)  # needs to be >10us
         self.ce(0)
 
     # returns None if send still in progress, 1 for success, 2 for fail
     def send_done(self):
-        if not (self.reg_read(STATUS) & (TX_DS | MAX_RT)):
+        if self.irq is not None:
+            if self._irq_pending:
+                self._service()
+            if self._tx_result is None:
+                return None  # tx not finished; the IRQ records the result
+            self.reg_update(CONFIG, self.shadow[CONFIG] & ~PWR_UP)
+            return self._tx_result
+
+        if not (self.status() & (TX_DS | MAX_RT)):
             return None  # tx not finished
 
         # either finished or failed: get and clear status flags, power down
         status = self.reg_write(STATUS, RX_DR | TX_DS | MAX_RT)
-        self.reg_write(CONFIG, self.reg_read(CONFIG) & ~PWR_UP)
+        self.reg_update(CONFIG, self.shadow[CONFIG] & ~PWR_UP)
         return 1 if status & TX_DS else 2
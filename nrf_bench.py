@@ -0,0 +1,224 @@
+"""
+Benchmark de las transacciones SPI del driver NRF24L01 por envío y recepción.
+
+Compara el camino antiguo (cada cambio de modo lee y reescribe CONFIG) con el
+driver actual, que guarda una copia de CONFIG, RF_SETUP y EN_RXADDR y solo
+escribe los cambios. Un envío es la secuencia de Wifi._send (stop_listening,
+send, start_listening) y una recepción la de Wifi._await_payload (any,
+recv_into).
+
+También compara el envío de una ráfaga de paquetes con send (espera cada
+uno y apaga la radio entre paquetes) y con stream_write/stream_poll (hasta
+tres en el FIFO, sin apagar la radio).
+
+Antes de medir comprueba que lo recibido y no leído sobrevive a un cambio a
+transmisión y de vuelta, con y sin IRQ.
+
+Se ejecuta en el host (python nrf_bench.py) con dos radios de nrf_emulator,
+que además comprueban que cada paquete llega intacto. El emulador transmite
+al instante, así que el tiempo medido es el del driver (SPI y esperas de
+asentamiento), no el del aire.
+"""
+import nrf24l01
+from nrf24l01 import NRF24L01, CONFIG, EN_RXADDR, RF_SETUP, STATUS, PWR_UP, PRIM_RX, RX_DR, TX_DS, MAX_RT
+from nrf_emulator import Air
+from ticks import sleep_us, ticks_us, ticks_diff
+
+PAYLOAD_SIZE = 16
+SEND_ADDRESS = b"1NODE"
+RECEIVE_ADDRESS = b"2NODE"
+
+
+class LegacyNRF24L01(NRF24L01):
+    """
+    Reproduce las lecturas y escrituras de registros del driver original para
+    poder compararlo.
+    """
+
+    def set_power_speed(self, power, speed):
+        setup = self.reg_read(RF_SETUP) & 0b11010001
+        self.reg_write(RF_SETUP, setup | power | speed)
+
+    def set_crc(self, length):
+        config = self.reg_read(CONFIG) & ~(nrf24l01.CRCO | nrf24l01.EN_CRC)
+        if length == 1:
+            config |= nrf24l01.EN_CRC
+        elif length == 2:
+            config |= nrf24l01.EN_CRC | nrf24l01.CRCO
+        self.reg_write(CONFIG, config)
+
+    def open_rx_pipe(self, pipe_id, address):
+        if pipe_id == 0:
+            self.pipe0_read_addr = address
+        if pipe_id < 2:
+            self.reg_write_bytes(nrf24l01.RX_ADDR_P0 + pipe_id, address)
+        else:
+            self.reg_write(nrf24l01.RX_ADDR_P0 + pipe_id, address[0])
+        self.reg_write(nrf24l01.RX_PW_P0 + pipe_id, self.payload_size)
+        self.reg_write(EN_RXADDR, self.reg_read(EN_RXADDR) | (1 << pipe_id))
+
+    def start_listening(self):
+        self.reg_write(CONFIG, self.reg_read(CONFIG) | PWR_UP | PRIM_RX)
+        self.reg_write(STATUS, RX_DR | TX_DS | MAX_RT)
+        if self.pipe0_read_addr is not None:
+            self.reg_write_bytes(nrf24l01.RX_ADDR_P0, self.pipe0_read_addr)
+        self.is_listening = True
+        self.flush_rx()
+        self.flush_tx()
+        self.ce(1)
+        sleep_us(130)
+
+    def send_start(self, buf):
+        self.reg_write(CONFIG, (self.reg_read(CONFIG) | PWR_UP) & ~PRIM_RX)
+        sleep_us(150)
+        self.cs(0)
+        self.spi.readinto(self.buf, nrf24l01.W_TX_PAYLOAD)
+        self.spi.write(buf)
+        if len(buf) < self.payload_size:
+            self.spi.write(b"\x00" * (self.payload_size - len(buf)))
+        self.cs(1)
+        self.ce(1)
+        sleep_us(15)
+        self.ce(0)
+
+    def send_done(self):
+        if not (self.reg_read(STATUS) & (TX_DS | MAX_RT)):
+            return None
+        status = self.reg_write(STATUS, RX_DR | TX_DS | MAX_RT)
+        self.reg_write(CONFIG, self.reg_read(CONFIG) & ~PWR_UP)
+        return 1 if status & TX_DS else 2
+
+
+def make_pair(driver):
+    """
+    Crea un emisor y un receptor conectados, configurados como en Wifi.
+    """
+    air = Air()
+    chips = air.chip(), air.chip()
+    sender = driver(chips[0].spi, chips[0].csn, chips[0].ce, channel=76, payload_size=PAYLOAD_SIZE)
+    receiver = driver(chips[1].spi, chips[1].csn, chips[1].ce, channel=76, payload_size=PAYLOAD_SIZE)
+    sender.open_tx_pipe(SEND_ADDRESS)
+    sender.open_rx_pipe(1, RECEIVE_ADDRESS)
+    receiver.open_tx_pipe(RECEIVE_ADDRESS)
+    receiver.open_rx_pipe(1, SEND_ADDRESS)
+    sender.start_listening()
+    receiver.start_listening()
+    return sender, receiver, chips
+
+
+def measure(driver, messages: int = 20):
+    """
+    Envía mensajes de un radio al otro y mide las transacciones SPI medias.
+
+    :return: Tupla (transacciones y bytes por envío, transacciones y bytes por recepción)
+    """
+    sender, receiver, chips = make_pair(driver)
+    buffer = bytearray(PAYLOAD_SIZE)
+    send_bus, receive_bus = chips[0].spi, chips[1].spi
+    send_bus.reset()
+    receive_bus.reset()
+    for index in range(messages):
+        payload = bytes((index,)) * 8
+        sender.stop_listening()
+        sender.send(payload)
+        sender.start_listening()
+
+        assert receiver.any()
+        receiver.recv_into(buffer)
+        assert buffer == payload + bytes(PAYLOAD_SIZE - len(payload))
+    return (
+        send_bus.transactions / messages, send_bus.bytes / messages,
+        receive_bus.transactions / messages, receive_bus.bytes / messages,
+    )
+
+
+def measure_burst(streaming: bool, packets: int = 60):
+    """
+    Envía una ráfaga de paquetes a un receptor con IRQ (que los guarda sin
+    que nadie los lea) y mide el coste por paquete.
+
+    :return: Tupla (transacciones SPI por paquete, us por paquete, entregados)
+    """
+    sender, receiver, chips = make_pair(NRF24L01)
+    receiver.irq_init(chips[1].irq, slots=packets)
+    payloads = [bytes((index,)) * 8 for index in range(packets)]
+    results = []
+    sender.stop_listening()
+    chips[0].spi.reset()
+    start = ticks_us()
+    if streaming:
+        sender.stream_start(lambda packet_id, ok: results.append(ok))
+        for payload in payloads:
+            while sender.stream_write(payload) < 0:
+                sender.stream_poll()
+        while sender.stream_pending():
+            sender.stream_poll()
+        sender.stream_stop()
+    else:
+        for payload in payloads:
+            sender.send(payload)
+            results.append(True)
+    elapsed = ticks_diff(ticks_us(), start)
+
+    buffer = bytearray(PAYLOAD_SIZE)
+    for payload in payloads:
+        receiver.recv_into(buffer)
+        assert buffer == payload + bytes(PAYLOAD_SIZE - len(payload))
+    assert not receiver.any()
+    return chips[0].spi.transactions / packets, elapsed / packets, results.count(True)
+
+
+def check_turnaround(irq: bool, pending: int = 2) -> bool:
+    """
+    Deja `pending` paquetes sin leer en el receptor, lo hace transmitir y
+    volver a recepción, y comprueba que siguen ahí, en orden.
+    """
+    sender, receiver, chips = make_pair(NRF24L01)
+    if irq:
+        receiver.irq_init(chips[1].irq)
+    payloads = [bytes((index,)) * 8 for index in range(pending)]
+    sender.stop_listening()
+    for payload in payloads:
+        sender.send(payload)
+    sender.start_listening()
+
+    receiver.stop_listening()
+    receiver.send(b'reply')
+    receiver.start_listening()
+
+    buffer = bytearray(PAYLOAD_SIZE)
+    for payload in payloads:
+        if not receiver.any():
+            return False
+        receiver.recv_into(buffer)
+        if buffer != payload + bytes(PAYLOAD_SIZE - len(payload)):
+            return False
+    return not receiver.any()
+
+
+def run(messages: int = 20, packets: int = 60):
+    for irq in (False, True):
+        print(f'recepción conservada al transmitir ({"IRQ" if irq else "consulta"}): {check_turnaround(irq)}')
+    print()
+
+    results = (
+        ('antes', measure(LegacyNRF24L01, messages)),
+        ('sombra', measure(NRF24L01, messages)),
+    )
+    print('driver   envío: trans  bytes   recepción: trans  bytes')
+    for name, (send_transactions, send_bytes, receive_transactions, receive_bytes) in results:
+        print(f'{name:<8} {send_transactions:>12.1f}  {send_bytes:>5.1f}  {receive_transactions:>16.1f}  {receive_bytes:>5.1f}')
+
+    bursts = (
+        ('send', measure_burst(False, packets)),
+        ('stream', measure_burst(True, packets)),
+    )
+    print()
+    print(f'ráfaga de {packets}  trans/paquete  us/paquete  entregados')
+    for name, (transactions, elapsed_us, delivered) in bursts:
+        print(f'{name:<13} {transactions:>13.1f}  {elapsed_us:>10.0f}  {delivered:>10}')
+    return results, bursts
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,427 @@
+"""
+Emulador de radios nRF24L01+ en el bus SPI y grabador de transacciones.
+
+Sirve para ejecutar y medir nrf24l01.NRF24L01 en el host: cada chip tiene su
+banco de registros, FIFOs de 3 paquetes, pines CE/CSN/IRQ y un aire común que
+entrega los paquetes al chip que escucha la dirección de destino y devuelve
+el ACK (con su payload, si lo hay):
+
+    air = Air()
+    chip = air.chip()
+    nrf = NRF24L01(chip.spi, chip.csn, chip.ce, payload_size=16)
+    chip.spi.transactions  # transacciones SPI (flancos de bajada de CSN)
+
+La transmisión es instantánea. Un pulso corto de CE en modo TX envía un solo
+paquete (al bajar CE, como el chip que vuelve a Standby-I); si CE sigue alto
+cuando hay otra transacción SPI, se envía todo el FIFO. El estado (TX_DS o
+MAX_RT) queda listo para la siguiente lectura.
+"""
+import random
+
+# Registros
+CONFIG = 0x00
+EN_AA = 0x01
+EN_RXADDR = 0x02
+SETUP_AW = 0x03
+SETUP_RETR = 0x04
+RF_CH = 0x05
+RF_SETUP = 0x06
+STATUS = 0x07
+OBSERVE_TX = 0x08
+RX_ADDR_P0 = 0x0A
+RX_ADDR_P1 = 0x0B
+TX_ADDR = 0x10
+RX_PW_P0 = 0x11
+FIFO_STATUS = 0x17
+DYNPD = 0x1C
+FEATURE = 0x1D
+ADDRESS_REGISTERS = (RX_ADDR_P0, RX_ADDR_P1, TX_ADDR)
+
+# Bits
+MASK_RX_DR = 0x40
+MASK_TX_DS = 0x20
+MASK_MAX_RT = 0x10
+PWR_UP = 0x02
+PRIM_RX = 0x01
+RX_DR = 0x40
+TX_DS = 0x20
+MAX_RT = 0x10
+EN_DPL = 0x04
+EN_ACK_PAY = 0x02
+EN_DYN_ACK = 0x01
+
+# Instrucciones
+R_RX_PL_WID = 0x60
+R_RX_PAYLOAD = 0x61
+W_TX_PAYLOAD = 0xA0
+W_TX_PAYLOAD_NOACK = 0xB0
+W_ACK_PAYLOAD = 0xA8
+FLUSH_TX = 0xE1
+FLUSH_RX = 0xE2
+REUSE_TX_PL = 0xE3
+ACTIVATE = 0x50
+NOP = 0xFF
+
+FIFO_DEPTH = 3
+MAX_PAYLOAD = 32
+
+
+class Pin:
+    OUT = 3
+    IN = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, value: int = 1, on_change=None):
+        """
+        Pin emulado con la API de machine.Pin que usa el driver.
+
+        Args:
+            value: Nivel inicial.
+            on_change: Función que se llama con el nuevo nivel cuando cambia.
+        """
+        self._value = value
+        self._on_change = on_change
+        self._handler = None
+        self._trigger = 0
+
+    def init(self, mode=None, pull=None, value=None):
+        if value is not None:
+            self(value)
+
+    def value(self, value=None):
+        return self(value)
+
+    def __call__(self, value=None):
+        if value is None:
+            return self._value
+        value = 1 if value else 0
+        if value != self._value:
+            self._value = value
+            if self._on_change is not None:
+                self._on_change(value)
+            if self._handler is not None and self._trigger & (self.IRQ_RISING if value else self.IRQ_FALLING):
+                self._handler(self)
+        return None
+
+    def irq(self, handler=None, trigger=IRQ_FALLING):
+        self._handler = handler
+        self._trigger = trigger
+
+
+class SpiBusRecorder:
+    def __init__(self, chip: 'NRF24L01Chip'):
+        """
+        Sustituto de machine.SPI conectado a un chip emulado; cuenta las
+        transacciones (cada selección con CSN) y los bytes transferidos.
+        """
+        self.chip = chip
+        self.transactions = 0
+        self.bytes = 0
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def _exchange(self, value: int) -> int:
+        self.bytes += 1
+        return self.chip.exchange(value)
+
+    def readinto(self, buf, write: int = 0x00):
+        for index in range(len(buf)):
+            buf[index] = self._exchange(write)
+
+    def read(self, length: int, write: int = 0x00) -> bytes:
+        buf = bytearray(length)
+        self.readinto(buf, write)
+        return bytes(buf)
+
+    def write(self, buf):
+        for value in bytes(buf):
+            self._exchange(value)
+
+    def write_readinto(self, write_buf, read_buf):
+        for index, value in enumerate(bytes(write_buf)):
+            read_buf[index] = self._exchange(value)
+
+    def reset(self):
+        """
+        Borra los contadores (no el estado del chip).
+        """
+        self.transactions = 0
+        self.bytes = 0
+
+
+class Air:
+    def __init__(self, loss: float = 0.0, seed: int | None = None):
+        """
+        Medio compartido entre chips del mismo canal.
+
+        Args:
+            loss: Probabilidad de perder cada intento de transmisión (paquete o ACK).
+            seed: Semilla para repetir las pérdidas.
+        """
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.chips = []
+        self.packets = 0
+        self.lost = 0
+
+    def chip(self) -> 'NRF24L01Chip':
+        chip = NRF24L01Chip(self)
+        self.chips.append(chip)
+        return chip
+
+    def transmit(self, sender: 'NRF24L01Chip', payload: bytes, no_ack: bool):
+        """
+        Entrega un paquete al chip que escucha la dirección TX del emisor.
+
+        Returns:
+            tuple: (entregado, payload del ACK o None).
+        """
+        self.packets += 1
+        if self.random.random() < self.loss:
+            self.lost += 1
+            return False, None
+        for chip in self.chips:
+            if chip is sender or chip.reg(RF_CH) != sender.reg(RF_CH):
+                continue
+            accepted, ack_payload = chip.receive(sender.address(TX_ADDR), payload, no_ack)
+            if accepted:
+                return True, ack_payload
+        return False, None
+
+
+class NRF24L01Chip:
+    def __init__(self, air: Air):
+        """
+        Estado emulado de un nRF24L01+ con los valores de reinicio del datasheet.
+        """
+        self.air = air
+        self.registers = bytearray(0x1E)
+        self.registers[CONFIG] = 0x08
+        self.registers[EN_AA] = 0x3F
+        self.registers[EN_RXADDR] = 0x03
+        self.registers[SETUP_AW] = 0x03
+        self.registers[SETUP_RETR] = 0x03
+        self.registers[RF_CH] = 0x02
+        self.registers[RF_SETUP] = 0x0E
+        self.registers[STATUS] = 0x0E
+        self.registers[0x0C:0x10] = bytes((0xC3, 0xC4, 0xC5, 0xC6))
+        self.addresses = {
+            RX_ADDR_P0: bytearray(b'\xe7' * 5),
+            RX_ADDR_P1: bytearray(b'\xc2' * 5),
+            TX_ADDR: bytearray(b'\xe7' * 5),
+        }
+        self.rx_fifo = []  # (pipe, payload)
+        self.tx_fifo = []  # (payload, no_ack)
+        self.ack_fifo = []  # (pipe, payload)
+        self.sent = 0
+        self.received = 0
+
+        self.spi = SpiBusRecorder(self)
+        self.csn = Pin(1, self._on_csn)
+        self.ce = Pin(0, self._on_ce)
+        self.irq = Pin(1)
+        self._command = None
+        self._data = bytearray()
+        self._index = 0
+        self._ce_pulse = False  # CE subió y todavía no se envió nada
+
+    # --- Registros -------------------------------------------------------
+
+    def reg(self, register: int) -> int:
+        if register == STATUS:
+            return self._status()
+        if register == FIFO_STATUS:
+            return self._fifo_status()
+        return self.registers[register]
+
+    def address(self, register: int) -> bytes:
+        return bytes(self.addresses[register])
+
+    def _status(self) -> int:
+        pipe = self.rx_fifo[0][0] if self.rx_fifo else 0b111
+        full = 1 if len(self.tx_fifo) >= FIFO_DEPTH else 0
+        return (self.registers[STATUS] & 0x70) | pipe << 1 | full
+
+    def _fifo_status(self) -> int:
+        value = 0
+        if len(self.tx_fifo) >= FIFO_DEPTH:
+            value |= 0x20
+        if not self.tx_fifo:
+            value |= 0x10
+        if len(self.rx_fifo) >= FIFO_DEPTH:
+            value |= 0x02
+        if not self.rx_fifo:
+            value |= 0x01
+        return value
+
+    def _write_register(self, register: int, data: bytes):
+        if not data:
+            return
+        if register in ADDRESS_REGISTERS:
+            self.addresses[register][:len(data)] = data
+        elif register == STATUS:
+            self.registers[STATUS] &= ~(data[0] & 0x70)
+        elif register not in (FIFO_STATUS, OBSERVE_TX):
+            self.registers[register] = data[0]
+        self._update_irq()
+        self._maybe_transmit()
+
+    def _read_register(self, register: int, index: int) -> int:
+        if register in ADDRESS_REGISTERS:
+            return self.addresses[register][index % 5]
+        return self.reg(register)
+
+    # --- SPI ---------------------------------------------------------------
+
+    def _on_csn(self, level: int):
+        if level == 0:
+            self.spi.transactions += 1
+            if self.ce():
+                self._maybe_transmit()  # CE sostenido: se vacía el FIFO
+            self._command = None
+            self._data = bytearray()
+            self._index = 0
+        else:
+            self._finish()
+
+    def exchange(self, value: int) -> int:
+        """
+        Procesa un byte con CSN bajo y retorna el byte que devuelve el chip.
+        """
+        if self._command is None:
+            self._command = value
+            return self._status()
+
+        command = self._command
+        index = self._index
+        self._index += 1
+        if command < 0x20:
+            return self._read_register(command, index)
+        if command == R_RX_PAYLOAD:
+            payload = self.rx_fifo[0][1] if self.rx_fifo else b''
+            return payload[index] if index < len(payload) else 0
+        if command == R_RX_PL_WID:
+            return len(self.rx_fifo[0][1]) if self.rx_fifo else 0
+        self._data.append(value)
+        return 0
+
+    def _finish(self):
+        command = self._command
+        self._command = None
+        if command is None:
+            return
+        data = bytes(self._data)
+        if command < 0x20:
+            return
+        if command < 0x40:
+            self._write_register(command & 0x1F, data)
+        elif command == R_RX_PAYLOAD:
+            if self.rx_fifo and self._index:
+                self.rx_fifo.pop(0)
+        elif command in (W_TX_PAYLOAD, W_TX_PAYLOAD_NOACK):
+            if len(self.tx_fifo) < FIFO_DEPTH and data:
+                no_ack = command == W_TX_PAYLOAD_NOACK and self.registers[FEATURE] & EN_DYN_ACK
+                self.tx_fifo.append((data[:MAX_PAYLOAD], bool(no_ack)))
+                self._maybe_transmit()
+        elif command & 0xF8 == W_ACK_PAYLOAD:
+            if len(self.ack_fifo) < FIFO_DEPTH and data:
+                self.ack_fifo.append((command & 0x07, data[:MAX_PAYLOAD]))
+        elif command == FLUSH_TX:
+            self.tx_fifo.clear()
+            self.ack_fifo.clear()
+        elif command == FLUSH_RX:
+            self.rx_fifo.clear()
+        self._update_irq()
+
+    # --- Radio ---------------------------------------------------------------
+
+    def _on_ce(self, level: int):
+        if level:
+            self._ce_pulse = True
+        elif self._ce_pulse:
+            self._maybe_transmit(limit=1)
+
+    def _powered(self) -> bool:
+        return bool(self.registers[CONFIG] & PWR_UP)
+
+    def listening(self) -> bool:
+        return self._powered() and bool(self.registers[CONFIG] & PRIM_RX) and bool(self.ce())
+
+    def _maybe_transmit(self, limit: int | None = None):
+        config = self.registers[CONFIG]
+        if not config & PWR_UP or config & PRIM_RX:
+            return
+        if limit is None and not self.ce():
+            return
+        self._ce_pulse = False
+        retries = self.registers[SETUP_RETR] & 0x0F
+        while self.tx_fifo and not self.registers[STATUS] & MAX_RT and limit != 0:
+            if limit is not None:
+                limit -= 1
+            payload, no_ack = self.tx_fifo[0]
+            delivered, ack_payload = False, None
+            for attempt in range(retries + 1):
+                delivered, ack_payload = self.air.transmit(self, payload, no_ack)
+                self.registers[OBSERVE_TX] = (self.registers[OBSERVE_TX] & 0xF0) | attempt
+                if delivered or no_ack:
+                    break
+            if not delivered and not no_ack:
+                self.registers[STATUS] |= MAX_RT
+                break
+            self.tx_fifo.pop(0)
+            self.sent += 1
+            self.registers[STATUS] |= TX_DS
+            if ack_payload is not None and len(self.rx_fifo) < FIFO_DEPTH:
+                self.rx_fifo.append((0, ack_payload))
+                self.registers[STATUS] |= RX_DR
+        self._update_irq()
+
+    def _pipe_for(self, address: bytes):
+        enabled = self.registers[EN_RXADDR]
+        for pipe in range(6):
+            if not enabled & (1 << pipe):
+                continue
+            if pipe < 2:
+                pipe_address = self.address(RX_ADDR_P0 + pipe)
+            else:
+                pipe_address = bytes((self.registers[RX_ADDR_P0 + pipe],)) + self.address(RX_ADDR_P1)[1:]
+            if pipe_address == address:
+                return pipe
+        return None
+
+    def receive(self, address: bytes, payload: bytes, no_ack: bool):
+        """
+        Recibe un paquete del aire si este chip escucha la dirección.
+
+        Returns:
+            tuple: (aceptado con ACK, payload del ACK o None).
+        """
+        if not self.listening():
+            return False, None
+        pipe = self._pipe_for(address)
+        if pipe is None or len(self.rx_fifo) >= FIFO_DEPTH:
+            return False, None
+        dynamic = self.registers[FEATURE] & EN_DPL and self.registers[DYNPD] & (1 << pipe)
+        if not dynamic:
+            width = self.registers[RX_PW_P0 + pipe]
+            payload = (payload + bytes(MAX_PAYLOAD))[:width]
+        self.rx_fifo.append((pipe, bytes(payload)))
+        self.received += 1
+        self.registers[STATUS] |= RX_DR
+
+        ack_payload = None
+        if not no_ack and self.registers[FEATURE] & EN_ACK_PAY:
+            for index, (ack_pipe, data) in enumerate(self.ack_fifo):
+                if ack_pipe == pipe:
+                    ack_payload = data
+                    del self.ack_fifo[index]
+                    self.registers[STATUS] |= TX_DS
+                    break
+        self._update_irq()
+        return True, ack_payload
+
+    def _update_irq(self):
+        pending = self.registers[STATUS] & 0x70 & ~(self.registers[CONFIG] & 0x70)
+        self.irq(0 if pending else 1)
@@ -0,0 +1,200 @@
+"""
+Red NRF24L01 de un master con hasta cinco conos secundarios.
+
+El chip escucha seis pipes a la vez: el pipe 0 queda para los ACK de lo que
+se envía y el master escucha al secundario n en el pipe n (1-5), cada uno
+con su dirección (MASTER_ADDRESSES). Las tramas se separan por el pipe por
+el que llegaron (RX_P_NO del registro STATUS, ver Wifi.rx_pipe) y van a la
+cola de su nodo, así el master junta a la vez los cortes de varios
+secundarios. Para hablarle a un nodo se cambia la dirección de envío a la
+suya (SECONDARY_ADDRESSES).
+
+Network es el único lector de las tramas del Wifi que envuelve: serve()
+debe correr como tarea del bucle.
+"""
+import protocol
+import runtime
+from ticks import ticks_ms, ticks_diff
+
+MAX_NODES = 5
+# El secundario n escucha en SECONDARY_ADDRESSES[n - 1] y envía a
+# MASTER_ADDRESSES[n - 1]. Las del master comparten los 4 últimos bytes, como
+# exigen los pipes 2-5; el nodo 1 usa las direcciones de siempre.
+MASTER_ADDRESSES = (b"2NODE", b"3NODE", b"4NODE", b"5NODE", b"6NODE")
+SECONDARY_ADDRESSES = (b"1NODE", b"7NODE", b"8NODE", b"9NODE", b"0NODE")
+
+
+class Node:
+    def __init__(self, number: int, capacity: int = 4):
+        """
+        Secundario de la red, con su cola de tramas recibidas.
+
+        Args:
+            number: Número de nodo (1-5), que es también el pipe por el que llega.
+            capacity: Tramas que se guardan mientras nadie las lee; más allá se descartan.
+        """
+        self.number = number
+        self.address = SECONDARY_ADDRESSES[number - 1]
+        self.received = 0
+        self.dropped = 0
+        self.received_ms: int | None = None
+        self._frames = [bytearray(protocol.FRAME_SIZE) for _ in range(capacity)]
+        self._times = [0] * capacity
+        self._written = 0
+        self._read = 0
+
+    def pending(self) -> int:
+        return self._written - self._read
+
+    def pop(self) -> bytearray | None:
+        """
+        Returns:
+            bytearray | None: La trama más antigua (válida hasta que lleguen
+                otras `capacity`) o None si la cola está vacía. received_ms
+                queda con el instante en que llegó.
+        """
+        if self._read == self._written:
+            return None
+        index = self._read % len(self._frames)
+        self._read += 1
+        self.received_ms = self._times[index]
+        return self._frames[index]
+
+    def _push(self, frame, now_ms: int) -> bool:
+        if self._written - self._read >= len(self._frames):
+            self.dropped += 1
+            return False
+        index = self._written % len(self._frames)
+        slot = self._frames[index]
+        for i in range(protocol.FRAME_SIZE):
+            slot[i] = frame[i]
+        self._times[index] = now_ms
+        self._written += 1
+        self.received += 1
+        return True
+
+
+class Network:
+    def __init__(self, wifi: 'wifi_manager.Wifi', nodes=(1,)):
+        """
+        Args:
+            wifi: Radio del master, creada con receive_address=MASTER_ADDRESSES[0].
+            nodes: Números de los secundarios (1-5) que se escuchan.
+        """
+        self.wifi = wifi
+        self.nodes = {}
+        self.running = False
+        self.unknown = 0  # tramas de pipes sin nodo
+        self._flag = runtime.Flag()
+        self._request_lock = runtime.Lock()  # un pedido a la vez: select cambia la dirección de envío
+        for number in nodes:
+            self.add_node(number)
+
+    def add_node(self, number: int) -> Node:
+        """
+        Abre el pipe del secundario `number` y crea su cola.
+        """
+        if not 1 <= number <= MAX_NODES:
+            raise ValueError("El número de nodo va de 1 a %d." % MAX_NODES)
+        node = self.nodes.get(number)
+        if node is None:
+            self.wifi.nrf.open_rx_pipe(number, MASTER_ADDRESSES[number - 1])
+            node = self.nodes[number] = Node(number)
+        return node
+
+    def start(self):
+        """
+        Lanza serve() como tarea del bucle actual.
+        """
+        if not self.running:
+            self.running = True
+            runtime.spawn(self.serve())
+        return self
+
+    async def serve(self):
+        """
+        Reparte las tramas recibidas en la cola del nodo de su pipe.
+        """
+        self.running = True
+        while self.running:
+            frame = await self.wifi.aget_frame()
+            node = self.nodes.get(self.wifi.rx_pipe)
+            if node is None:
+                self.unknown += 1
+                continue
+            if node._push(frame, ticks_ms()):
+                self._flag.set()
+
+    def stop(self):
+        self.running = False
+        return self
+
+    def select(self, number: int):
+        """
+        Dirige los envíos del Wifi al secundario `number`.
+        """
+        self.wifi.nrf.open_tx_pipe(self.nodes[number].address)
+
+    def send_frame(self, number: int, opcode: int, value: int = 0, arg: int = 0) -> bool:
+        self.select(number)
+        return self.wifi.send_frame(opcode, value, arg)
+
+    async def arequest_frame(self, number: int, opcode: int, value: int = 0, arg: int = 0) -> bytearray | None:
+        """
+        Como Wifi.arequest_frame, dirigido al secundario `number`; mientras
+        espera el ACK el bucle sigue atendiendo las demás tareas.
+        """
+        async with self._request_lock:
+            self.select(number)
+            return await self.wifi.arequest_frame(opcode, value, arg)
+
+    async def arequest_all(self, opcode: int, value: int = 0, arg: int = 0, reply: int = protocol.OK) -> list:
+        """
+        Envía un pedido a cada secundario, uno tras otro, cediendo el control
+        al bucle entre envíos.
+
+        Returns:
+            list: Los números de los nodos que respondieron `reply` en el ACK.
+        """
+        answered = []
+        for number in self.nodes:
+            response = await self.arequest_frame(number, opcode, value, arg)
+            if response is not None and protocol.opcode(response) == reply:
+                answered.append(number)
+        return answered
+
+    def clear(self):
+        """
+        Descarta las tramas guardadas (p. ej. restos de una medición anterior).
+        """
+        for node in self.nodes.values():
+            node._read = node._written
+
+    async def anext(self, timeout_ms: int | None = None) -> Node | None:
+        """
+        Espera a que algún secundario tenga una trama guardada.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera en milisegundos; None espera indefinidamente.
+
+        Returns:
+            Node | None: El nodo (su trama se lee con pop()) o None si venció el plazo.
+        """
+        start = ticks_ms()
+        while True:
+            for node in self.nodes.values():
+                if node.pending():
+                    return node
+            remaining = None
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+                if remaining <= 0:
+                    return None
+            await self._flag.wait_ms(remaining)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Número de nodo -> (tramas recibidas, descartadas por cola llena).
+        """
+        return {number: (node.received, node.dropped) for number, node in self.nodes.items()}
@@ -0,0 +1,116 @@
+"""
+Protocolo binario entre el control y los conos.
+
+Cada mensaje es una trama fija de 8 bytes, little-endian:
+
+    byte 0    MAGIC (identifica la trama y la versión del protocolo)
+    byte 1    opcode
+    byte 2    número de secuencia (0-255, lo incrementa quien envía)
+    byte 3    argumento (p. ej. el número de etapa)
+    bytes 4-7 valor con signo de 32 bits: milisegundos o centímetros
+
+Las tramas se arman sobre un buffer preasignado (Encoder) y se leen campo a
+campo sobre el buffer recibido, sin crear objetos.
+"""
+from random import getrandbits
+from struct import pack_into
+
+MAGIC = 0xA1
+FRAME_SIZE = 8
+FORMAT = '<BBBBi'
+MAX_VALUE = 0x7FFFFFFF
+
+# Opcodes. En los pedidos (START, DISTANCE_REQUEST, ANNOUNCE) el argumento puede llevar
+# un identificador de pedido, que las respuestas (REPLIES) devuelven en su
+# propio argumento; 0 significa sin identificador (ver rpc).
+START = 1  # control -> master -> secundario: empezar la medición
+OK = 2  # confirmación de START o de DISTANCE_REQUEST
+STOP = 3  # cancelar la medición o la toma de distancia
+DISTANCE_REQUEST = 4  # pedir la distancia entre conos
+DISTANCE = 5  # valor: distancia en centímetros (0 si no se pudo medir)
+STAGE = 6  # argumento: etapa (1 o 2); valor: tiempo de la etapa en milisegundos
+END = 7  # secundario -> master: el sensor detectó el paso; valor: milisegundos desde la detección
+PING = 8
+PONG = 9
+ERROR = 10  # argumento: código de error
+ACK = 11  # argumento: número de secuencia confirmado (canal confiable)
+ANNOUNCE = 12  # control -> difusión: descubrir los conos en el canal
+HELLO = 13  # cono -> control: respuesta a ANNOUNCE
+SPLIT = 14  # argumento: secundario (1-5) que detectó el paso; valor: milisegundos desde la salida
+
+REPLIES = (OK, DISTANCE, HELLO)
+
+# Códigos de ERROR
+ERR_NO_SECONDARY = 1  # ningún secundario respondió al START o informó el paso a tiempo
+
+
+class Encoder:
+    def __init__(self):
+        """
+        Arma tramas sobre un único buffer y numera las que envía. La
+        numeración empieza en un valor al azar para que, tras un reinicio, las
+        primeras tramas no parezcan duplicados de la sesión anterior.
+        """
+        self.buffer = bytearray(FRAME_SIZE)
+        self.seq = getrandbits(8)
+
+    def encode(self, opcode: int, value: int = 0, arg: int = 0) -> bytearray:
+        """
+        Args:
+            opcode: Tipo de mensaje.
+            value: Milisegundos o centímetros, según el opcode.
+            arg: Argumento de un byte, según el opcode.
+
+        Returns:
+            bytearray: La trama, válida hasta la siguiente llamada.
+        """
+        self.seq = (self.seq + 1) & 0xFF
+        pack_into(FORMAT, self.buffer, 0, MAGIC, opcode, self.seq, arg, value)
+        return self.buffer
+
+
+def is_frame(payload) -> bool:
+    """
+    Returns:
+        bool: True si el payload empieza con una trama de este protocolo.
+    """
+    return payload is not None and len(payload) >= FRAME_SIZE and payload[0] == MAGIC
+
+
+def opcode(frame) -> int:
+    return frame[1]
+
+
+def seq(frame) -> int:
+    return frame[2]
+
+
+def arg(frame) -> int:
+    return frame[3]
+
+
+def value(frame) -> int:
+    """
+    Lee el valor con signo sin struct.unpack, que crearía una tupla.
+    """
+    result = frame[4] | frame[5] << 8 | frame[6] << 16 | frame[7] << 24
+    if result > MAX_VALUE:
+        result -= 1 << 32
+    return result
+
+
+def same_frame(a, b) -> bool:
+    """
+    Compara dos tramas byte a byte sin crear copias.
+    """
+    for index in range(FRAME_SIZE):
+        if a[index] != b[index]:
+            return False
+    return True
+
+
+def clamp(number) -> int:
+    """
+    Ajusta un número al rango del campo de valor.
+    """
+    return max(-MAX_VALUE, min(int(number), MAX_VALUE))
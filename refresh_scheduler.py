@@ -0,0 +1,114 @@
+"""
+Planificador de refresco adaptativo para el LCD.
+
+Decide cuándo volver a dibujar una pantalla que cambia sola (el cronómetro):
+rápido mientras algo cuenta, lento cuando nada cambia y nunca cuando está
+detenido. Los redibujados provocados por un evento también pasan por aquí:
+quien produce el evento llama a set_mode, que despierta al que espera para
+que dibuje en el momento, así cada evento produce una sola pantalla.
+"""
+import runtime
+from mpthreading import Condition
+from ticks import ticks_ms, ticks_us, ticks_diff, ticks_add
+
+FAST = 'fast'
+IDLE = 'idle'
+STOPPED = 'stopped'
+
+
+class RefreshScheduler:
+    def __init__(self, display: 'display_server.DisplayServer', fast_ms: int = 100, idle_ms: int = 1000):
+        """
+        Args:
+            display: Servicio de pantalla, del que se leen las estadísticas de dibujado.
+            fast_ms: Periodo de refresco mientras algo está contando.
+            idle_ms: Periodo de refresco cuando nada cambia (p. ej. en pausa).
+        """
+        self.display = display
+        self.fast_ms = fast_ms
+        self.idle_ms = idle_ms
+        self.mode = STOPPED
+        self.closed = False
+        self._deadline = ticks_ms()
+        self._cond = Condition()
+        self._flag = None
+        self._window_tick = ticks_us()
+        self._window_drawn = display.frames_drawn
+        self._window_busy = display.busy_us
+
+    def set_mode(self, mode: str):
+        """
+        Cambia el ritmo de refresco (FAST, IDLE o STOPPED).
+        """
+        self.mode = mode
+        self._signal()
+
+    def close(self):
+        """
+        Libera a quien esté esperando; wait() deja de bloquear.
+        """
+        self.closed = True
+        self._signal()
+
+    def wait(self):
+        """
+        Bloquea hasta el siguiente refresco. Los plazos son fijos, así que el
+        tiempo de dibujado no se acumula; en STOPPED no hay ningún refresco
+        hasta que cambie el modo.
+        """
+        with self._cond:
+            while not self.closed:
+                mode = self.mode
+                if mode == STOPPED:
+                    self._cond.wait()
+                    self._deadline = ticks_ms()
+                    continue
+
+                self._deadline = ticks_add(self._deadline, self.fast_ms if mode == FAST else self.idle_ms)
+                delay = ticks_diff(self._deadline, ticks_ms())
+                # Un cambio de modo notifica la condición y despierta al instante
+                if delay <= 0 or self._cond.wait(delay / 1000):
+                    self._deadline = ticks_ms()
+                return
+
+    async def await_next(self):
+        """
+        Versión cooperativa de wait(): un cambio de modo despierta la tarea al instante.
+        """
+        if self._flag is None:
+            self._flag = runtime.Flag()
+        while not self.closed:
+            if self.mode == STOPPED:
+                await self._flag.wait()
+                self._deadline = ticks_ms()
+                continue
+
+            self._deadline = ticks_add(self._deadline, self.fast_ms if self.mode == FAST else self.idle_ms)
+            delay = ticks_diff(self._deadline, ticks_ms())
+            if delay <= 0 or await self._flag.wait_ms(delay):
+                self._deadline = ticks_ms()
+            return
+
+    def stats(self) -> dict:
+        """
+        Estadísticas desde la llamada anterior: pantallas por segundo dibujadas
+        y fracción del tiempo que el bus estuvo ocupado dibujando.
+        """
+        now = ticks_us()
+        window = max(1, ticks_diff(now, self._window_tick))
+        drawn = self.display.frames_drawn - self._window_drawn
+        busy = self.display.busy_us - self._window_busy
+        self._window_tick = now
+        self._window_drawn = self.display.frames_drawn
+        self._window_busy = self.display.busy_us
+        return {
+            'mode': self.mode,
+            'fps': drawn * 1000000 / window,
+            'bus_utilisation': busy / window,
+        }
+
+    def _signal(self):
+        if self._flag is not None:
+            self._flag.set()
+        with self._cond:
+            self._cond.notify_all()
@@ -0,0 +1,343 @@
+"""
+Pedidos con respuesta sobre ESP-NOW.
+
+Cada pedido lleva un identificador en el argumento de la trama y el peer lo
+devuelve en la respuesta (ver protocol.REPLIES), así una respuesta tardía no
+se confunde con la de otro pedido y puede haber varios pedidos en curso a la
+vez. Solo cuenta la respuesta del cono al que se envió el pedido. Las tramas que no son respuestas (tiempos de etapa, errores) quedan en
+una cola de eventos, junto con la MAC del cono que las envió.
+
+Un pedido a BROADCAST llega a todos los conos con una sola transmisión y
+junta las respuestas de cada uno; así se descubren conos (discover) y se
+arrancan varios carriles a la vez.
+
+RpcClient es el único lector de las tramas del ESPNow que envuelve: serve()
+debe correr como tarea del bucle.
+"""
+import protocol
+import runtime
+from esp_now_manager import BROADCAST
+from ticks import ticks_ms, ticks_diff
+
+
+class Call:
+    def __init__(self, client: 'RpcClient', request_id: int, opcode: int, target: bytes):
+        """
+        Pedido en curso; result() espera la respuesta.
+
+        Args:
+            client: Cliente que envió el pedido.
+            request_id: Identificador del pedido (1-255).
+            opcode: Opcode del pedido.
+            target: MAC del cono al que se envió; solo su respuesta cuenta.
+        """
+        self.client = client
+        self.request_id = request_id
+        self.opcode = opcode
+        self.target = target
+        self.reply: bytearray | None = None
+        self.peer: bytes | None = None
+        self.rtt_ms: int | None = None
+        self.failed = False
+        self._start = ticks_ms()
+        self._flag = runtime.Flag()
+
+    def done(self) -> bool:
+        """
+        Returns:
+            bool: True si llegó la respuesta o el pedido falló.
+        """
+        return self.reply is not None or self.failed
+
+    def _accepts(self, peer) -> bool:
+        """
+        Retorna True si la respuesta viene del cono al que se envió el pedido:
+        otro cono puede devolver el mismo identificador (p. ej. la respuesta
+        tardía a un pedido viejo).
+        """
+        return peer == self.target
+
+    def _resolve(self, frame, peer) -> bool:
+        """
+        Guarda una respuesta; retorna True si el pedido quedó completo.
+        """
+        self.rtt_ms = ticks_diff(ticks_ms(), self._start)
+        self.reply = bytearray(frame)
+        self.peer = bytes(peer)
+        self._flag.set()
+        return True
+
+    def _fail(self):
+        self.failed = True
+        self._flag.set()
+
+    async def result(self, timeout_ms: int | None = None) -> bytearray | None:
+        """
+        Espera la respuesta.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera en milisegundos; None espera indefinidamente.
+
+        Returns:
+            bytearray | None: La trama de respuesta, o None si el envío falló o
+                venció el plazo (el pedido se abandona y una respuesta tardía
+                se descarta).
+        """
+        start = ticks_ms()
+        while not self.done():
+            remaining = None
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+                if remaining <= 0:
+                    self.client._expire(self)
+                    return None
+            await self._flag.wait_ms(remaining)
+        return self.reply
+
+
+class BroadcastCall(Call):
+    def __init__(self, client: 'RpcClient', request_id: int, opcode: int, expected: int | None):
+        """
+        Pedido difundido a todos los conos; junta una respuesta por cono.
+
+        Args:
+            expected: Respuestas que completan el pedido; None espera hasta el plazo.
+        """
+        super().__init__(client, request_id, opcode, BROADCAST)
+        self.expected = expected
+        self.replies = {}  # MAC -> trama de respuesta
+
+    def done(self) -> bool:
+        return self.failed or (self.expected is not None and len(self.replies) >= self.expected)
+
+    def _accepts(self, peer) -> bool:
+        return True  # responde cada cono
+
+    def _resolve(self, frame, peer) -> bool:
+        self.replies[bytes(peer)] = bytearray(frame)
+        self.rtt_ms = ticks_diff(ticks_ms(), self._start)
+        if self.done():
+            self._flag.set()
+        return self.done()
+
+    async def result(self, timeout_ms: int | None = None) -> dict:
+        """
+        Espera las respuestas.
+
+        Returns:
+            dict: MAC -> trama de respuesta de cada cono que respondió a tiempo.
+        """
+        await super().result(timeout_ms)
+        return self.replies
+
+
+class RpcClient:
+    # Tramas no solicitadas que se guardan mientras nadie las lee
+    EVENT_CAPACITY = 8
+
+    def __init__(self, esp_now: 'esp_now_manager.ESPNow'):
+        """
+        Args:
+            esp_now: Enlace ESP-NOW; conviene que sea reliable=True para que
+                los pedidos no se pierdan.
+        """
+        self.esp_now = esp_now
+        self.running = False
+        self._pending = {}
+        self._next_id = 0
+        self._events = []
+        self._event_flag = runtime.Flag()
+
+        self.calls = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.late_replies = 0
+        self.events_dropped = 0
+        self.rtt_histogram = [0] * (len(esp_now.LATENCY_BUCKETS_MS) + 1)
+        self.rtt_min_ms: int | None = None
+        self.rtt_max_ms: int | None = None
+        self.rtt_total_ms = 0
+
+    def start(self):
+        """
+        Lanza serve() como tarea del bucle actual.
+        """
+        if not self.running:
+            self.running = True
+            runtime.spawn(self.serve())
+        return self
+
+    async def serve(self):
+        """
+        Reparte las tramas recibidas: las respuestas a su pedido y el resto a
+        la cola de eventos.
+        """
+        self.running = True
+        while self.running:
+            frame = await self.esp_now.aget_frame()
+            if protocol.opcode(frame) in protocol.REPLIES:
+                self._reply(frame, self.esp_now.frame_peer)
+            else:
+                self._event(frame, self.esp_now.frame_peer)
+
+    def stop(self):
+        self.running = False
+        return self
+
+    async def call(self, opcode: int, value: int = 0, peer: bytes | None = None,
+                   expected: int | None = None) -> Call:
+        """
+        Envía un pedido sin esperar la respuesta.
+
+        Args:
+            opcode: Tipo de pedido (constantes de protocol).
+            value: Valor de la trama, según el opcode.
+            peer: MAC del cono; None usa el peer por defecto y BROADCAST lo
+                envía a todos con una sola transmisión.
+            expected: Solo para BROADCAST: respuestas que completan el pedido
+                (None espera hasta el plazo).
+
+        Returns:
+            Call: El pedido en curso (BroadcastCall si se difundió).
+        """
+        self._next_id = self._next_id % 255 + 1  # 0 queda para tramas sin pedido
+        if peer == BROADCAST:
+            call = BroadcastCall(self, self._next_id, opcode, expected)
+        else:
+            call = Call(self, self._next_id, opcode, bytes(peer if peer is not None else self.esp_now.peer_mac))
+        self._pending[call.request_id] = call
+        self.calls += 1
+
+        if self.esp_now.reliable and peer != BROADCAST:
+            sent = await self.esp_now.asend_frame(opcode, value, call.request_id, peer)
+        else:
+            sent = self.esp_now.send_frame(opcode, value, call.request_id, peer)
+        if not sent and not call.done():
+            self._pending.pop(call.request_id, None)
+            self.failures += 1
+            call._fail()
+        return call
+
+    async def request(self, opcode: int, value: int = 0, timeout_ms: int | None = None,
+                      peer: bytes | None = None) -> bytearray | None:
+        """
+        Envía un pedido y espera su respuesta.
+
+        Returns:
+            bytearray | None: La trama de respuesta, o None si falló o venció el plazo.
+        """
+        call = await self.call(opcode, value, peer)
+        return await call.result(timeout_ms)
+
+    async def broadcast(self, opcode: int, value: int = 0, timeout_ms: int = 500) -> dict:
+        """
+        Difunde un pedido a los conos registrados y espera sus respuestas.
+
+        Returns:
+            dict: MAC -> trama de respuesta de cada cono que respondió a tiempo.
+        """
+        call = await self.call(opcode, value, BROADCAST, expected=len(self.esp_now.peers))
+        return await call.result(timeout_ms)
+
+    async def discover(self, timeout_ms: int = 500) -> list:
+        """
+        Difunde un ANNOUNCE y registra a los conos que responden.
+
+        Returns:
+            list: Las MAC de los conos que respondieron.
+        """
+        call = await self.call(protocol.ANNOUNCE, peer=BROADCAST)
+        replies = await call.result(timeout_ms)
+        for mac in replies:
+            self.esp_now.add_peer(mac)
+        return list(replies)
+
+    async def anext_event(self, timeout_ms: int | None = None) -> bytes | None:
+        """
+        Espera la siguiente trama que no es respuesta a un pedido.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera en milisegundos; None espera indefinidamente.
+
+        Returns:
+            bytes | None: La trama (seguida de la MAC de quien la envió, ver
+                event_peer) o None si venció el plazo.
+        """
+        start = ticks_ms()
+        while not self._events:
+            remaining = None
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+                if remaining <= 0:
+                    return None
+            await self._event_flag.wait_ms(remaining)
+        return self._events.pop(0)
+
+    @staticmethod
+    def event_peer(event: bytes) -> bytes:
+        """
+        Returns:
+            bytes: La MAC del cono que envió un evento de anext_event.
+        """
+        return event[protocol.FRAME_SIZE:]
+
+    def clear_events(self):
+        """
+        Descarta los eventos guardados (p. ej. restos de una medición anterior).
+        """
+        self._events.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Pedidos enviados, en curso, vencidos, fallidos, respuestas
+                tardías, eventos descartados y tiempos de ida y vuelta (mínimo,
+                máximo, promedio y por tramo de ESPNow.LATENCY_BUCKETS_MS).
+        """
+        answered = sum(self.rtt_histogram)
+        return {
+            'calls': self.calls,
+            'in_flight': len(self._pending),
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'late_replies': self.late_replies,
+            'events_dropped': self.events_dropped,
+            'rtt_min_ms': self.rtt_min_ms,
+            'rtt_max_ms': self.rtt_max_ms,
+            'rtt_avg_ms': self.rtt_total_ms / answered if answered else None,
+            'rtt_ms': self.rtt_histogram,
+        }
+
+    def _reply(self, frame, peer):
+        call = self._pending.get(protocol.arg(frame))
+        if call is None or not call._accepts(peer):
+            self.late_replies += 1
+            return
+        if call._resolve(frame, peer):
+            del self._pending[call.request_id]
+        self._record_rtt(call.rtt_ms)
+
+    def _event(self, frame, peer):
+        if len(self._events) >= self.EVENT_CAPACITY:
+            self.events_dropped += 1
+            return
+        self._events.append(bytes(frame) + bytes(peer))
+        self._event_flag.set()
+
+    def _expire(self, call: Call):
+        if self._pending.pop(call.request_id, None) is not None and not isinstance(call, BroadcastCall):
+            self.timeouts += 1
+        call._fail()
+
+    def _record_rtt(self, rtt_ms: int):
+        self.rtt_total_ms += rtt_ms
+        if self.rtt_min_ms is None or rtt_ms < self.rtt_min_ms:
+            self.rtt_min_ms = rtt_ms
+        if self.rtt_max_ms is None or rtt_ms > self.rtt_max_ms:
+            self.rtt_max_ms = rtt_ms
+        bucket = 0
+        for limit in self.esp_now.LATENCY_BUCKETS_MS:
+            if rtt_ms < limit:
+                break
+            bucket += 1
+        self.rtt_histogram[bucket] += 1
@@ -0,0 +1,109 @@
+"""
+Capa mínima de ejecución cooperativa sobre uasyncio (en la placa) o asyncio
+(en el host), para que botones, pantalla, radios y sensor corran como tareas
+en un único bucle en lugar de hilos con esperas activas.
+"""
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+CancelledError = asyncio.CancelledError
+TimeoutError = asyncio.TimeoutError
+Lock = asyncio.Lock
+
+
+if hasattr(asyncio, 'sleep_ms'):
+    # uasyncio la trae y no crea un float por espera
+    sleep_ms = asyncio.sleep_ms
+else:
+    async def sleep_ms(milliseconds: int):
+        await asyncio.sleep(milliseconds / 1000)
+
+
+def spawn(coro):
+    """
+    Lanza una corrutina como tarea del bucle actual y devuelve la tarea.
+    """
+    return asyncio.create_task(coro)
+
+
+def cancel(task):
+    """
+    Cancela una tarea si todavía no terminó.
+    """
+    if task is not None and not task.done():
+        task.cancel()
+
+
+async def wait_for_ms(awaitable, timeout_ms: int | None):
+    """
+    Espera un awaitable con plazo; al vencer cancela la espera y lanza TimeoutError.
+    """
+    if timeout_ms is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, timeout_ms / 1000)
+
+
+async def join(task):
+    """
+    Espera a que una tarea termine, sin propagar su cancelación.
+    """
+    try:
+        return await task
+    except CancelledError:
+        return None
+
+
+def run(coro):
+    """
+    Ejecuta una corrutina hasta que termine.
+    """
+    return asyncio.run(coro)
+
+
+try:
+    ThreadSafeFlag = asyncio.ThreadSafeFlag
+except AttributeError:
+    ThreadSafeFlag = None
+
+
+class Flag:
+    def __init__(self):
+        """
+        Señal que se puede activar desde una IRQ u otro hilo y esperar desde
+        una tarea. En la placa es un ThreadSafeFlag; en el host un Event cuyo
+        set() se reenvía al hilo del bucle.
+        """
+        self._flag = ThreadSafeFlag() if ThreadSafeFlag is not None else asyncio.Event()
+        self._loop = None
+
+    def set(self):
+        if self._loop is None:
+            self._flag.set()
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._flag.set)
+        except RuntimeError:
+            self._flag.set()  # el bucle ya terminó
+
+    async def wait(self):
+        if ThreadSafeFlag is None:
+            self._loop = asyncio.get_running_loop()
+            await self._flag.wait()
+            self._flag.clear()
+        else:
+            await self._flag.wait()
+
+    async def wait_ms(self, timeout_ms: int | None) -> bool:
+        """
+        Espera la señal con plazo.
+
+        Returns:
+            bool: True si llegó la señal, False si venció el plazo.
+        """
+        try:
+            await wait_for_ms(self.wait(), timeout_ms)
+            return True
+        except TimeoutError:
+            return False
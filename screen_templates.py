@@ -0,0 +1,53 @@
+"""
+Plantillas de pantalla precompiladas para los menús del LCD 2x16.
+
+El texto fijo de cada pantalla se codifica una sola vez (al importar el módulo)
+en filas de bytes listas para el LCD. Las pantallas dinámicas declaran sus
+campos variables y al mostrarlas solo se formatean esos campos; el resto de la
+fila se reutiliza tal cual.
+"""
+
+
+class Template:
+    def __init__(self, *lines, fields: dict | None = None, cols: int = 16):
+        """
+        Compila una pantalla.
+
+        Args:
+            *lines: Texto fijo de cada fila.
+            fields: Campos variables, nombre -> (fila, columna, ancho).
+            cols: Ancho de la pantalla.
+        """
+        self.cols = cols
+        self.fields = fields or {}
+        self.rows = tuple(self._compile(line) for line in lines)
+        self._dynamic_rows = tuple(sorted({row for row, _, _ in self.fields.values()}))
+
+    def _compile(self, line: str) -> bytes:
+        line = bytes(ord(char) & 0xFF for char in line[:self.cols])
+        return line + b' ' * (self.cols - len(line))
+
+    def render(self, **values):
+        """
+        Devuelve las filas de la pantalla con los campos indicados ya escritos.
+
+        Las filas sin campos son las mismas bytes precompiladas; una pantalla
+        estática no genera ninguna asignación de memoria.
+
+        Args:
+            **values: Valor de cada campo; los que falten quedan en blanco.
+
+        Returns:
+            tuple: Filas listas para ShadowLcd/DisplayServer.show.
+        """
+        if not self._dynamic_rows:
+            return self.rows
+
+        rows = list(self.rows)
+        for index in self._dynamic_rows:
+            rows[index] = bytearray(rows[index])
+        for name, (row, col, width) in self.fields.items():
+            value = values.get(name)
+            text = b'' if value is None else str(value).encode()[:width]
+            rows[row][col:col + width] = text + b' ' * (width - len(text))
+        return tuple(rows)
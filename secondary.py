@@ -1,52 +1,70 @@
-import time
-from threading import Thread
-
+import nrf_network
+import protocol
+import runtime
 import wifi_manager
 from sensor import UltrasonicSensor
+from ticks import ticks_ms, ticks_diff
 
-wifi = wifi_manager.Wifi(send_address=b"1NODE", receive_address=b"2NODE")  # Diceccion de recepcion y emision
+NODE = 1  # número de este secundario en la red del master (1-5)
+# Reintentos del END: espera exponencial desde END_RETRY_BASE_MS hasta
+# END_RETRY_MAX_MS, sin pasar de END_DEADLINE_MS desde la detección
+END_RETRY_BASE_MS = 4
+END_RETRY_MAX_MS = 256
+END_DEADLINE_MS = 3000
+wifi = wifi_manager.Wifi(
+    send_address=nrf_network.MASTER_ADDRESSES[NODE - 1],
+    receive_address=nrf_network.SECONDARY_ADDRESSES[NODE - 1],
+)
 sensor = UltrasonicSensor(26, 14)
 
 
-def main():
-    wifi.listener.start_listening()
+async def main():
+    # START y DISTANCE_REQUEST se confirman con el OK que viaja en el ACK
+    wifi.set_ack_frame(protocol.OK)
     while True:
-        if wifi.listener.response() == 'distance':
-            wifi.send_message('ok')
-            wifi.get_distance.receiver()
-            wifi.listener.start_listening()
+        frame = await wifi.aget_frame()
+        if protocol.opcode(frame) == protocol.DISTANCE_REQUEST:
+            await wifi.get_distance.receiver()
 
-        elif wifi.listener.response() == 'start':
-            wifi.send_message('ok')
+        elif protocol.opcode(frame) == protocol.START:
             break
-        elif wifi.listener.response() == 'stop':
-            wifi.listener.start_listening()
-        time.sleep(0.1)
-
-    sensor_thread = Thread(target=sensor.wait_for_detection)
-    sensor_thread.start()
 
-    wifi.listener.start_listening()
-    while True:
-        time.sleep(0.1)
-        if not sensor_thread.is_alive():
-            break
+    async def listen_during_run():
+        while True:
+            frame = await wifi.aget_frame()
+            if protocol.opcode(frame) == protocol.DISTANCE_REQUEST:
+                await wifi.get_distance.receiver()
 
-        elif wifi.listener.response() == 'distance':
-            wifi.get_distance.receiver()
-            wifi.listener.start_listening()
+            elif protocol.opcode(frame) == protocol.STOP:
+                sensor.stop()
+                return
 
-        elif wifi.listener.response() == 'stop':
-            sensor.stop()
-            return
+    listen_task = runtime.spawn(listen_during_run())
+    detected = await sensor.await_detection()
+    detected_ms = ticks_ms()
+    runtime.cancel(listen_task)
+    if detected is None:
+        return
 
-    sensor_thread.join()
-    wifi.send_message('end')
+    # Con varios secundarios el master puede estar transmitiendo o recibiendo
+    # a otro: se reintenta con espera exponencial, desplazada según el nodo
+    # para que dos secundarios no vuelvan a chocar. El END lleva los
+    # milisegundos desde la detección, así el master descuenta los reintentos
+    delay = END_RETRY_BASE_MS
+    while True:
+        waited = ticks_diff(ticks_ms(), detected_ms)
+        if wifi.send_frame(protocol.END, waited):
+            break
+        if waited + delay >= END_DEADLINE_MS:
+            print('END sin confirmar')
+            break
+        await runtime.sleep_ms(delay + 2 * NODE)
+        delay = min(delay * 2, END_RETRY_MAX_MS)
 
 
 if __name__ == "__main__":
     while True:
         try:
-            main()
+            runtime.run(main())
         finally:
             wifi.listener.stop()
@@ -1,6 +1,8 @@
 from machine import Pin, time_pulse_us
 import time
 
+import runtime
+
 
 class UltrasonicSensor:
     def __init__(self, trigger_pin, echo_pin, detection_threshold=20, max_readings=10):
@@ -54,21 +56,52 @@ class UltrasonicSensor:
 
         while self.running:
             current_distance = self.measure_distance()
-            readings[index] = current_distance
-            index = (index + 1) % self.MAX_READINGS
-
-            # Check previous reading
-            prev_index = (index - 1) % self.MAX_READINGS
-            prev_distance = readings[prev_index]
-
-            # Detection conditions
-            if (prev_distance == self.NO_RESPONSE and current_distance != self.NO_RESPONSE) or \
-                    (current_distance != self.NO_RESPONSE and
-                     abs(current_distance - prev_distance) > self.DETECTION_THRESHOLD):
-                self.running = False
+            index = self._record(readings, index, current_distance)
+            if not self.running:
                 return current_distance
 
             time.sleep(0.02)  # Use ms for better readability
 
+    async def await_detection(self):
+        """
+        Cooperative version of wait_for_detection: yields to the event loop
+        between readings instead of blocking a thread.
+
+        Returns:
+            float: Detected distance or None if stopped
+        """
+        readings = [self.NO_RESPONSE] * self.MAX_READINGS
+        index: int = 0
+        self.running = True
+
+        while self.running:
+            current_distance = self.measure_distance()
+            index = self._record(readings, index, current_distance)
+            if not self.running:
+                return current_distance
+
+            await runtime.sleep_ms(20)
+
+    def _record(self, readings, index, current_distance):
+        """
+        Store a reading in the circular buffer and stop when it is a detection.
+
+        Returns:
+            int: Next buffer index
+        """
+        readings[index] = current_distance
+        index = (index + 1) % self.MAX_READINGS
+
+        # Check previous reading
+        prev_index = (index - 1) % self.MAX_READINGS
+        prev_distance = readings[prev_index]
+
+        # Detection conditions
+        if (prev_distance == self.NO_RESPONSE and current_distance != self.NO_RESPONSE) or \
+                (current_distance != self.NO_RESPONSE and
+                 abs(current_distance - prev_distance) > self.DETECTION_THRESHOLD):
+            self.running = False
+        return index
+
     def stop(self):
         self.running = False
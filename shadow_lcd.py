@@ -0,0 +1,150 @@
+"""
+Capa de framebuffer en sombra para pantallas LCD 2x16.
+
+Guarda una copia de lo que ya está en el cristal y, al recibir una pantalla
+nueva, solo envía las celdas que cambiaron con el mínimo de saltos de cursor.
+Funciona tanto con i2c_lcd.LCD (move/write/draw) como con I2cLcd (move_to/putstr).
+"""
+
+
+class ShadowLcd:
+    # Reescribir una celda sin cambios cuesta lo mismo que un salto de cursor,
+    # así que dos tramos separados por un hueco de este tamaño se envían juntos
+    MAX_GAP = 1
+
+    def __init__(self, lcd, rows: int = 2, cols: int = 16):
+        """
+        Envuelve un LCD con un buffer en sombra.
+
+        Args:
+            lcd: Objeto LCD (i2c_lcd.LCD o I2cLcd).
+            rows: Cantidad de filas de la pantalla.
+            cols: Cantidad de columnas de la pantalla.
+        """
+        self.lcd = lcd
+        self.rows = rows
+        self.cols = cols
+        self._shadow = [bytearray(b' ' * cols) for _ in range(rows)]
+        self._valid = False
+        self._cursor = None
+        self._glyphs = None
+        self.cells_sent = 0
+        self.moves_sent = 0
+        self.glyph_uploads = 0
+
+    def invalidate(self):
+        """
+        Olvida el contenido del cristal; la próxima pantalla se envía completa.
+        """
+        self._valid = False
+        self._cursor = None
+
+    def load_glyphs(self, glyphs):
+        """
+        Sube un juego de caracteres personalizados a la CGRAM si no está ya cargado.
+
+        El juego residente se recuerda por identidad, así que volver a pedir el
+        mismo juego (por ejemplo al cambiar de modo) no genera tráfico.
+
+        Args:
+            glyphs: Secuencia de hasta 8 mapas de 8 bytes.
+
+        Returns:
+            bool: True si hubo que subir el juego.
+        """
+        if self._glyphs is glyphs:
+            return False
+        for location, charmap in enumerate(glyphs):
+            self.lcd.custom_char(location, charmap)
+        self._glyphs = glyphs
+        # Escribir la CGRAM deja el cursor fuera de la DDRAM
+        self._cursor = None
+        self.glyph_uploads += 1
+        return True
+
+    def clear(self):
+        """
+        Borra la pantalla enviando solo las celdas que no estaban en blanco.
+        """
+        self.show(*([''] * self.rows))
+
+    def show(self, *lines):
+        """
+        Muestra una pantalla completa, enviando solo las diferencias.
+
+        Args:
+            *lines: Texto (str o bytes) de cada fila, desde la fila 0.
+
+        Returns:
+            int: Cantidad de celdas enviadas al LCD.
+        """
+        segments = []
+        for row in range(self.rows):
+            line = self._encode(lines[row] if row < len(lines) else '')
+            self._diff_row(row, line, segments)
+        self._valid = True
+        if segments:
+            self._send(segments)
+        return sum(len(text) for _, _, text in segments)
+
+    def _encode(self, line):
+        cols = self.cols
+        if len(line) == cols and not isinstance(line, str):
+            return line
+        if isinstance(line, str):
+            line = bytes(ord(char) & 0xFF for char in line[:cols])
+        else:
+            line = bytes(line[:cols])
+        if len(line) < cols:
+            line += b' ' * (cols - len(line))
+        return line
+
+    def _diff_row(self, row, line, segments):
+        shadow = self._shadow[row]
+        cols = self.cols
+        valid = self._valid
+        col = 0
+        while col < cols:
+            if valid and line[col] == shadow[col]:
+                col += 1
+                continue
+            start = col
+            end = col + 1
+            gap = 0
+            col += 1
+            while col < cols and gap <= self.MAX_GAP:
+                if line[col] != shadow[col] or not valid:
+                    end = col + 1
+                    gap = 0
+                else:
+                    gap += 1
+                col += 1
+            shadow[start:end] = line[start:end]
+            segments.append((start, row, line[start:end]))
+            col = end
+
+    def _send(self, segments):
+        lcd = self.lcd
+        batch = []
+        for col, row, text in segments:
+            move = (col, row) != self._cursor
+            if move:
+                self.moves_sent += 1
+            self.cells_sent += len(text)
+            batch.append((col if move else None, row, text))
+            end = col + len(text)
+            self._cursor = (end, row) if end < self.cols else None
+
+        if hasattr(lcd, 'draw'):
+            lcd.draw(batch)
+            return
+
+        for col, row, text in batch:
+            if hasattr(lcd, 'putstr'):
+                if col is not None:
+                    lcd.move_to(col, row)
+                lcd.putstr(''.join(chr(char) for char in text))
+            else:
+                if col is not None:
+                    lcd.move(col, row)
+                lcd.write(''.join(chr(char) for char in text))
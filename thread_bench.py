@@ -0,0 +1,102 @@
+"""
+Benchmark del costo de lanzar un hilo nuevo por tarea frente a despachar la
+tarea a un hilo ya creado del grupo (mpthreading.ThreadPool).
+
+Se ejecuta en el host con el _thread de CPython (python thread_bench.py) o en
+la placa; en ambos casos los dos caminos usan mpthreading, el mismo código.
+
+Antes de medir comprueba que las esperas con plazo vencen a tiempo también
+con el sondeo que se usa en la placa (mpthreading._TIMED_ACQUIRE = False),
+forzado en el host.
+"""
+import mpthreading
+from ticks import ticks_us, ticks_diff
+
+
+def _noop():
+    return None
+
+
+def check_timed_waits(timeout=0.05):
+    """
+    Comprueba que cada espera con plazo de mpthreading vence a tiempo con
+    _acquire por sondeo, como en la placa, y que despierta si la liberan.
+
+    :return: Milisegundos que tardó la espera más larga.
+    """
+    timed = mpthreading._TIMED_ACQUIRE
+    mpthreading._TIMED_ACQUIRE = False
+    try:
+        held = mpthreading.Lock()
+        held.acquire()
+        blocker = mpthreading.Lock()
+        blocker.acquire()
+        waits = (
+            lambda: held.acquire(timeout=timeout),
+            lambda: mpthreading.Event().wait(timeout),
+            lambda: _wait_condition(mpthreading.Condition(), timeout),
+            lambda: _raises(mpthreading.Empty, lambda: mpthreading.Queue().get(timeout=timeout)),
+            lambda: _raises(OSError, lambda: mpthreading.Future().result(timeout)),
+            lambda: mpthreading.Thread(target=blocker.acquire).join(timeout),
+        )
+        longest = 0
+        for wait in waits:
+            start = ticks_us()
+            assert not wait()
+            elapsed_ms = ticks_diff(ticks_us(), start) / 1000
+            assert elapsed_ms < timeout * 1000 * 4, elapsed_ms
+            longest = max(longest, elapsed_ms)
+
+        event = mpthreading.Event()
+        mpthreading.Thread(target=event.set).start()
+        assert event.wait(1)
+        return longest
+    finally:
+        mpthreading._TIMED_ACQUIRE = timed
+
+
+def _wait_condition(condition, timeout):
+    with condition:
+        return condition.wait(timeout)
+
+
+def _raises(error, call):
+    try:
+        call()
+    except error:
+        return False
+    return True
+
+
+def spawn_cost_us(iterations=200):
+    start = ticks_us()
+    for _ in range(iterations):
+        thread = mpthreading.Thread(target=_noop)
+        thread.start()
+        thread.join()
+    return ticks_diff(ticks_us(), start) / iterations
+
+
+def pool_cost_us(iterations=200, pool=None):
+    pool = pool or mpthreading.ThreadPool(workers=1)
+    pool.submit(_noop).result()  # hilo ya despierto antes de medir
+    start = ticks_us()
+    for _ in range(iterations):
+        pool.submit(_noop).result()
+    return ticks_diff(ticks_us(), start) / iterations
+
+
+def run(iterations=200):
+    print(f'esperas de 50 ms por sondeo: la más larga {check_timed_waits():.1f} ms')
+    pool = mpthreading.ThreadPool(workers=1)
+    spawn_us = spawn_cost_us(iterations)
+    pool_us = pool_cost_us(iterations, pool)
+    pool.shutdown()
+    print('camino        us/tarea')
+    print(f'hilo nuevo    {spawn_us:>8.1f}')
+    print(f'grupo         {pool_us:>8.1f}')
+    return spawn_us, pool_us
+
+
+if __name__ == '__main__':
+    run()
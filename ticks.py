@@ -0,0 +1,31 @@
+"""
+Reloj monotónico en milisegundos/microsegundos con la API de MicroPython.
+
+En la placa reexporta las funciones de time; en el host (CPython) las
+implementa sobre time.monotonic_ns para poder ejecutar la lógica sin hardware.
+"""
+import time
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms, sleep_us
+except ImportError:
+    _PERIOD = 1 << 30
+    _HALF_PERIOD = _PERIOD // 2
+
+    def ticks_ms():
+        return (time.monotonic_ns() // 1000000) & (_PERIOD - 1)
+
+    def ticks_us():
+        return (time.monotonic_ns() // 1000) & (_PERIOD - 1)
+
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & (_PERIOD - 1)
+
+    def ticks_diff(end, start):
+        return ((end - start + _HALF_PERIOD) & (_PERIOD - 1)) - _HALF_PERIOD
+
+    def sleep_ms(milliseconds):
+        time.sleep(milliseconds / 1000)
+
+    def sleep_us(microseconds):
+        time.sleep(microseconds / 1000000)
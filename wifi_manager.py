@@ -1,11 +1,27 @@
 from machine import Pin, SPI
 from nrf24l01 import NRF24L01
-import threading
-import time
+import mpthreading
+
+import protocol
+import runtime
+from ticks import ticks_ms, ticks_us, ticks_diff
 
 
 class Wifi:
-    def __init__(self, send_address: bytes, receive_address: bytes):
+    # Intervalo de consulta del FIFO de recepción en aget_message (sin pin IRQ)
+    POLL_MS = 2
+    # Paquetes sin leer que se guardan al pasar a transmisión
+    HELD_CAPACITY = 8
+
+    def __init__(self, send_address: bytes, receive_address: bytes, irq_pin: int | None = None):
+        """
+        Args:
+            send_address: Dirección de 5 bytes del otro cono.
+            receive_address: Dirección de 5 bytes de este cono.
+            irq_pin: GPIO conectado al pin IRQ del NRF24L01, si está cableado;
+                la recepción pasa a atenderse por interrupción en lugar de
+                consultar el FIFO por SPI.
+        """
         # Configuración de pines
         ce = Pin(22, mode=Pin.OUT)
         cs = Pin(21, mode=Pin.OUT)
@@ -22,24 +38,298 @@ class Wifi:
         # Inicializar el módulo NRF24L01
         self.nrf: NRF24L01 = NRF24L01(spi=spi_bus, cs=cs, ce=ce, channel=76, payload_size=16)
 
+        # Largo de payload dinámico: las tramas viajan con sus 8 bytes, sin
+        # relleno, y el cono que recibe puede responder dentro del ACK
+        self.nrf.set_dynamic_payloads(True, ack_payloads=True)
         self.nrf.open_tx_pipe(send_address)
         self.nrf.open_rx_pipe(1, receive_address)
+        self._encoder = protocol.Encoder()
+        # Los payloads se leen siempre sobre este buffer (recv_into), así la
+        # recepción no reserva memoria ni provoca pausas del recolector
+        self._rx = bytearray(32)
+        self._rx_length = 0
+        # Al pasar a transmisión lo recibido y no leído se guarda aquí (el
+        # FIFO de la radio tiene solo tres lugares) y se entrega después, en
+        # orden; las respuestas en ACK van a su propio buffer
+        self._held = [bytearray(32) for _ in range(self.HELD_CAPACITY)]
+        self._held_lengths = bytearray(self.HELD_CAPACITY)
+        self._held_pipes = bytearray(self.HELD_CAPACITY)
+        self._held_written = 0
+        self._held_read = 0
+        self.held_dropped = 0
+        self._ack_rx = bytearray(32)
+        # Mientras arequest_frame espera el ACK la radio está en transmisión:
+        # quien espera tramas no debe volver a recepción ni leer el FIFO
+        self._transmitting = False
+        # Pipe por el que llegó el último paquete leído (ver nrf_network)
+        self.rx_pipe: int | None = None
+        # Respuesta que se carga en el ACK de cada paquete recibido
+        self.ack_opcode: int | None = None
+        self._ack = bytearray(protocol.FRAME_SIZE)
         self.get_distance = DistanceMeasurement(self)
         self.listener = NRFListener(self.nrf)
+        self._radio_flag = runtime.Flag()
+        if irq_pin is not None:
+            self.nrf.irq_init(Pin(irq_pin, Pin.IN), handler=self._on_radio)
+
+    def _on_radio(self, nrf: NRF24L01):
+        # Llamada desde la IRQ de la radio: despierta a quien espera
+        self._radio_flag.set()
+        self.listener.wake()
 
     def send_message(self, message: str):
         """
         Enviar un mensaje utilizando NRF24L01
         """
+        return self._send(message.encode())
+
+    def send_frame(self, opcode: int, value: int = 0, arg: int = 0):
+        """
+        Envía una trama del protocolo binario; ocupa 8 de los 16 bytes del payload.
+
+        Args:
+            opcode: Tipo de mensaje (constantes de protocol).
+            value: Milisegundos o centímetros, según el opcode.
+            arg: Argumento de un byte, según el opcode.
+
+        Returns:
+            bool: True si la trama fue enviada exitosamente, False en caso contrario.
+        """
+        return self._send(self._encoder.encode(opcode, value, arg))
+
+    async def asend_stream(self, payloads, on_result=None, timeout_ms: int = 500) -> int:
+        """
+        Envía varios payloads seguidos (p. ej. un registro de la sesión o una
+        serie de muestras) manteniendo hasta tres en el FIFO de la radio, que
+        no se apaga entre paquetes; entre tanto cede el control al bucle.
+
+        Args:
+            payloads: Iterable de buffers de hasta 32 bytes; cada uno se copia
+                al encolarlo, así que se puede reutilizar el mismo buffer.
+            on_result: Función (índice, entregado) que se llama con el
+                resultado de cada paquete, en orden, a medida que se conoce.
+            timeout_ms: Tiempo máximo sin resultados antes de abandonar el envío.
+
+        Returns:
+            int: Cantidad de paquetes entregados.
+
+        Raises:
+            OSError: Si la radio no informa el resultado de un paquete en timeout_ms.
+        """
+        self._to_tx()
+        self.nrf.stream_start(on_result)
+        try:
+            for payload in payloads:
+                while self.nrf.stream_write(payload) < 0:
+                    await self._stream_wait(timeout_ms)
+            while self.nrf.stream_pending():
+                await self._stream_wait(timeout_ms)
+        finally:
+            self.nrf.stream_stop()
+            self._take_ack()
+            self._listen()
+        return self.nrf.stream_sent
+
+    async def _stream_wait(self, timeout_ms: int):
+        # Espera el resultado del paquete en el aire
+        start = ticks_ms()
+        while self.nrf.stream_poll() is None:
+            if ticks_diff(ticks_ms(), start) >= timeout_ms:
+                raise OSError("send failed")
+            if self.nrf.irq is not None:
+                await self._radio_flag.wait_ms(self.POLL_MS)
+            else:
+                await runtime.sleep_ms(0)
+
+    def request_frame(self, opcode: int, value: int = 0, arg: int = 0) -> bytearray | None:
+        """
+        Envía una trama y retorna la respuesta que el otro cono cargó en el
+        ACK (ver set_ack_frame), sin pasar a recepción para esperarla: el
+        pedido y su respuesta ocupan una sola vuelta de radio.
+
+        Returns:
+            bytearray | None: La trama de respuesta (válida hasta el siguiente
+                envío) o None si el envío falló o el ACK llegó sin respuesta.
+        """
+        self._to_tx()
+        try:
+            self.nrf.send(self._encoder.encode(opcode, value, arg))
+            return self._ack_reply()
+        except OSError:
+            self._take_ack()
+            return None
+        finally:
+            self._listen()
+
+    async def arequest_frame(self, opcode: int, value: int = 0, arg: int = 0,
+                             timeout_ms: int = 500) -> bytearray | None:
+        """
+        Como request_frame, pero cede el control al bucle mientras la radio
+        espera el ACK (con sus reintentos automáticos puede tardar varios
+        milisegundos). Solo puede haber un envío en curso a la vez.
+
+        Args:
+            timeout_ms: Tiempo máximo sin resultado antes de abandonar el envío.
+
+        Returns:
+            bytearray | None: La trama de respuesta (válida hasta el siguiente
+                envío) o None si el envío falló o el ACK llegó sin respuesta.
+        """
+        self._to_tx()
+        self._transmitting = True
+        try:
+            self.nrf.send_start(self._encoder.encode(opcode, value, arg))
+            start = ticks_ms()
+            result = self.nrf.send_done()
+            while result is None and ticks_diff(ticks_ms(), start) < timeout_ms:
+                await runtime.sleep_ms(0)
+                result = self.nrf.send_done()
+            if result != 1:
+                self._take_ack()
+                return None
+            return self._ack_reply()
+        finally:
+            self._transmitting = False
+            self._listen()
+            self._radio_flag.set()  # quien espera tramas vuelve a mirar
+
+    def set_ack_frame(self, opcode: int | None, value: int = 0, arg: int = 0):
+        """
+        Define la trama que este cono devuelve dentro del ACK de cada paquete
+        que recibe (p. ej. OK o PONG), para que quien pregunta con
+        request_frame la obtenga sin esperar otro envío.
+
+        Args:
+            opcode: Tipo de la respuesta; None deja de responder en el ACK.
+            value: Valor de la trama, según el opcode.
+            arg: Argumento de un byte, según el opcode.
+        """
+        self.ack_opcode = opcode
+        if opcode is not None:
+            self._ack[:] = self._encoder.encode(opcode, value, arg)
+        if self.nrf.is_listening:
+            self._load_ack()
+
+    def _load_ack(self):
+        # En recepción el FIFO de envío solo guarda respuestas de ACK: se
+        # vacía para que quede una sola, la vigente
+        self.nrf.flush_tx()
+        if self.ack_opcode is not None:
+            self.nrf.write_ack_payload(1, self._ack)
+
+    def _listen(self):
+        self.nrf.start_listening()  # Regresar al modo de recepción
+        if self.ack_opcode is not None:
+            self._load_ack()
+
+    def _to_tx(self):
         self.listener.stop()
         self.nrf.stop_listening()  # Cambiar a modo de transmisión
+        # Con CE en bajo no llega nada más: lo que quedó sin leer se guarda
+        held = self._held
+        while self.nrf.any():
+            if self._held_written - self._held_read >= len(held):
+                self.nrf.recv_into(self._ack_rx)  # sin lugar: se descarta
+                self.held_dropped += 1
+                continue
+            index = self._held_written % len(held)
+            self._held_lengths[index] = self.nrf.recv_into(held[index])
+            self._held_pipes[index] = self.nrf.rx_pipe
+            self._held_written += 1
+
+    def _ack_reply(self) -> bytearray | None:
+        if not self._take_ack():
+            return None
+        return self._ack_rx if protocol.is_frame(self._ack_rx) else None
+
+    def _take_ack(self) -> int:
+        # En transmisión solo llegan respuestas en ACK: se sacan de la radio
+        # para que no se entreguen como tramas recibidas y queda la última
+        length = 0
+        while self.nrf.any():
+            length = self.nrf.recv_into(self._ack_rx)
+        return length
+
+    def _receive(self) -> bytearray:
+        if self._held_read != self._held_written:
+            index = self._held_read % len(self._held)
+            self._held_read += 1
+            self._rx_length = self._held_lengths[index]
+            self._rx[:] = self._held[index]
+            self.rx_pipe = self._held_pipes[index]
+            return self._rx
+        self._rx_length = self.nrf.recv_into(self._rx)
+        self.rx_pipe = self.nrf.rx_pipe
+        if self.ack_opcode is not None:
+            self._load_ack()  # la anterior se fue con el ACK de este paquete
+        return self._rx
+
+    def _send(self, payload):
+        self._to_tx()
         try:
-            self.nrf.send(message.encode())
+            self.nrf.send(payload)
             return True
         except OSError:
             return False
         finally:
-            self.nrf.start_listening()  # Regresar al modo de recepción
+            self._take_ack()
+            self._listen()
+
+    async def aget_message(self, timeout_ms: int | None = None) -> str | None:
+        """
+        Espera un mensaje cediendo el control al bucle entre consultas, sin
+        usar el hilo de NRFListener.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera en milisegundos; None espera indefinidamente.
+
+        Returns:
+            str | None: El mensaje recibido (sin el relleno) o None si venció el plazo.
+        """
+        payload = await self._await_payload(timeout_ms)
+        return bytes(payload[:self._rx_length]).rstrip(b'\x00').decode() if payload is not None else None
+
+    async def aget_frame(self, timeout_ms: int | None = None) -> bytearray | None:
+        """
+        Como aget_message, pero para tramas del protocolo binario; los
+        paquetes que no son tramas se descartan.
+
+        Args:
+            timeout_ms: Tiempo máximo de espera en milisegundos; None espera indefinidamente.
+
+        Returns:
+            bytearray | None: La trama (válida hasta la siguiente lectura) o
+                None si venció el plazo.
+        """
+        start = ticks_ms()
+        while True:
+            remaining = None
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+            payload = await self._await_payload(remaining)
+            if payload is None:
+                return None
+            if protocol.is_frame(payload):
+                return payload
+
+    async def _await_payload(self, timeout_ms: int | None):
+        self.listener.stop()
+        start = ticks_ms()
+        while True:
+            if not self._transmitting:
+                if not self.nrf.is_listening:
+                    self._listen()
+                if self._held_read != self._held_written or self.nrf.any():
+                    return self._receive()
+            remaining = None
+            if timeout_ms is not None:
+                remaining = timeout_ms - ticks_diff(ticks_ms(), start)
+                if remaining <= 0:
+                    return None
+            if self.nrf.irq is not None:
+                await self._radio_flag.wait_ms(remaining)
+            else:
+                await runtime.sleep_ms(self.POLL_MS)
 
 
 class NRFListener:
@@ -52,7 +342,10 @@ class NRFListener:
         """
         self._nrf = nrf
         self._running = False
-        self._response: bytes | None = None
+        self._response: bytearray | None = None
+        self._buffer = bytearray(32)
+        self._received = mpthreading.Event()
+        self._radio = mpthreading.Event()
         self._listener_thread = None
 
     def start_listening(self, sleep_time: float = 0.01):
@@ -64,8 +357,12 @@ class NRFListener:
             return
         self._running = True
         self._response = None
-        self._listener_thread = threading.Thread(target=self._listen, args=(sleep_time,))
-        self._listener_thread.daemon = True
+        self._received.clear()
+        # La escucha dura hasta que llega un paquete: tiene su propio hilo
+        # para no ocupar un trabajador del grupo compartido, que queda para
+        # tareas cortas
+        self._listener_thread = mpthreading.Thread(
+            target=self._listen, args=(sleep_time,), name="nrf-listener", daemon=True)
         self._listener_thread.start()
 
     def _listen(self, sleep_time: float):
@@ -79,75 +376,129 @@ class NRFListener:
 
             if self._nrf.any():
                 while self._nrf.any():
-                    self._response = self._nrf.recv()
-                    self.stop()
+                    self._nrf.recv_into(self._buffer)
+                    self._response = self._buffer
+                    # No se llama a stop(): esperaría a este mismo hilo
+                    self._running = False
+                    self._nrf.stop_listening()
+                    self._received.set()
             if sleep_time:
-                time.sleep(sleep_time)  # Pausa breve para reducir carga de CPU
+                # Pausa breve para reducir carga de CPU; con pin IRQ la
+                # interrupción la corta en cuanto llega un paquete
+                self._radio.wait(sleep_time)
+                self._radio.clear()
+
+    def wake(self):
+        """
+        Despierta al hilo de escucha (lo llama la IRQ de la radio).
+        """
+        self._radio.set()
 
     def stop(self):
         """
-        Detiene el proceso de escucha en segundo plano.
+        Detiene el proceso de escucha en segundo plano; si no se inició, no
+        toca la radio (y no descarta lo que ya esté en el FIFO).
         """
+        if self._listener_thread is None:
+            return
         self._running = False
         self._nrf.stop_listening()
-        if self._listener_thread:
-            self._listener_thread.join()
+        self._radio.set()  # corta la pausa del hilo
+        self._listener_thread.join()
+        self._listener_thread = None
 
     def response(self):
         """
         Verifica si hay una respuesta disponible.
 
         Returns:
-            La respuesta recibida o None si no hay respuesta.
+            El payload recibido (bytearray, válido hasta la siguiente escucha)
+            o None si no hay respuesta.
         """
         if self._response is not None:
-            response: str = self._response.decode()
+            response: bytearray = self._response
             try:
                 self._response = None
                 self.stop()
             finally:
                 return response
 
+    def wait_response(self, timeout: float | None = None):
+        """
+        Bloquea hasta que llegue una respuesta, sin consultar periódicamente.
+
+        Args:
+            timeout: Tiempo máximo de espera en segundos; None espera indefinidamente.
+
+        Returns:
+            La respuesta recibida o None si venció el plazo.
+        """
+        if not self._received.wait(timeout):
+            return None
+        self._received.clear()
+        return self.response()
+
 
 class DistanceMeasurement:
     def __init__(self, wifi_instance: Wifi):
         self.wifi = wifi_instance
 
-    def transmitter(self, timeout=1.0, samples: int = 5) -> float | None:
-        self.wifi.nrf.stop_listening()
+    async def transmitter(self, timeout=1.0, samples: int = 5) -> float | None:
+        """
+        Estima la distancia al otro cono por el tiempo de ida y vuelta de
+        varios PING; entre intentos cede el control al bucle.
+
+        Returns:
+            float | None: Distancia promedio en metros o None si no hubo respuesta.
+        """
         distances: list[float | None] = []
+        timeout_us = int(timeout * 1000000)
 
         for _ in range(samples):
-            start_time = time.time()
-            if not self.wifi.send_message('ping'):
-                print("Error sending ping")
-                continue
-
-            self.wifi.nrf.start_listening()
-            while time.time() - start_time < timeout:
-                response = self.wifi.nrf.recv()
-                if response == b'pong':
+            # El PONG viaja en el ACK del PING (ver Wifi.set_ack_frame); hasta
+            # que el receptor lo carga, el ACK trae su respuesta anterior
+            first_us = ticks_us()
+            while ticks_diff(ticks_us(), first_us) < timeout_us:
+                start_us = ticks_us()
+                response = self.wifi.request_frame(protocol.PING)
+                if response is not None and protocol.opcode(response) == protocol.PONG:
                     # Speed of radio wave is approximately 3e8 m/s
-                    round_trip_time = time.time() - start_time
+                    round_trip_time = ticks_diff(ticks_us(), start_us) / 1000000
                     distances.append((round_trip_time * 3e8) / 2)
                     break
+                await runtime.sleep_ms(2)
+            else:
+                print("Error sending ping")
 
-            self.wifi.nrf.stop_listening()
-            time.sleep(0.1)
+            await runtime.sleep_ms(100)
 
         self.wifi.nrf.stop_listening()
-        self.wifi.send_message('stop')
+        self.wifi.send_frame(protocol.STOP)
         return sum(distances) / len(distances) if distances else None
 
-    def receiver(self, timeout: float = 2.0) -> None:
-        self.wifi.nrf.start_listening()
-        init_t = time.time()
+    async def receiver(self, timeout: float = 2.0) -> None:
+        """
+        Responde los PING del transmisor hasta su STOP o hasta pasar
+        `timeout` segundos sin pings; mientras espera cede el control al bucle.
+        """
+        # Cada PING se responde con el PONG cargado en su ACK
+        previous = self.wifi.ack_opcode
+        self.wifi.set_ack_frame(protocol.PONG)
+        timeout_ms = int(timeout * 1000)
+        init_t = ticks_ms()
 
-        while time.time() - init_t < timeout:
-            message = self.wifi.nrf.recv()
-            if message == b'ping':
-                self.wifi.send_message('pong')
-                init_t = time.time()
-            elif message == b'stop':
+        while True:
+            remaining = timeout_ms - ticks_diff(ticks_ms(), init_t)
+            if remaining <= 0:
+                break
+            # El PONG sale en los ACK del hardware: la tarea solo despierta
+            # para ver qué trama llegó
+            message = await self.wifi.aget_frame(remaining)
+            if message is None:
+                break
+            if protocol.opcode(message) == protocol.PING:
+                init_t = ticks_ms()
+            elif protocol.opcode(message) == protocol.STOP:
                 break
         self.wifi.nrf.stop_listening()
+        self.wifi.set_ack_frame(previous)